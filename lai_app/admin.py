@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import Q
 
-from .models import Cargo, Cidadao, Configuracao, Funcionario, Setor
+from .models import Cargo, Cidadao, Configuracao, Feriado, Funcionario, Setor, normalizar
 
 class CargoAdmin(admin.ModelAdmin):
     list_display = ('nome', 'detalhes')
@@ -18,12 +20,32 @@ class CidadaoAdmin(admin.ModelAdmin):
     
     def has_add_permission(self, request):
         return False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Nome e documento pelos índices de trigramas, ordenados por similaridade;
+        # credenciais apenas por igualdade
+        if not search_term:
+            return queryset, False
+
+        encontrados = queryset.buscar(search_term).values('pk')
+        queryset = queryset.filter(
+            Q(pk__in=encontrados) |
+            Q(credenciais__username=search_term) |
+            Q(credenciais__email__iexact=search_term)
+        ).annotate(similaridade=TrigramWordSimilarity(normalizar(search_term), 'nome_busca'))
+
+        return queryset.order_by('-similaridade', 'nome'), False
   
 class ConfiguracaoAdmin(admin.ModelAdmin):
 
   def has_delete_permission(self, request, obj = None):
     return False
   
+class FeriadoAdmin(admin.ModelAdmin):
+    list_display = ('data', 'descricao')
+    search_fields = ('descricao',)
+    date_hierarchy = 'data'
+
 class FuncionarioAdmin(admin.ModelAdmin):
     list_display = ('nome', 'cargo', 'lotacao', 'credenciais')
     search_fields = ('nome', 'cargo__nome', 'lotacao__nome', 'credenciais__username', 'credenciais__email')
@@ -35,5 +57,6 @@ class SetorAdmin(admin.ModelAdmin):
 admin.site.register(Cargo, CargoAdmin)
 admin.site.register(Cidadao, CidadaoAdmin)
 admin.site.register(Configuracao, ConfiguracaoAdmin)
+admin.site.register(Feriado, FeriadoAdmin)
 admin.site.register(Funcionario, FuncionarioAdmin)
 admin.site.register(Setor, SetorAdmin)
\ No newline at end of file
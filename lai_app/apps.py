@@ -1,6 +1,35 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save
+
+
+def conferir_configuracao(sender, **kwargs):
+    from .calendario import CalendarioUteis
+    from .models import AtualizacaoResumo, Configuracao
+    Configuracao.exigir_conferencia()
+    AtualizacaoResumo.exigir_conferencia()
+    CalendarioUteis.exigir_conferencia()
 
 
 class LaiAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lai_app'
+
+    def ready(self):
+        # As cópias locais da Configuração, da marca do resumo anual e do calendário
+        # de dias úteis são validadas contra a versão compartilhada uma vez por requisição
+        request_started.connect(conferir_configuracao, dispatch_uid='lai_app.conferir_configuracao')
+
+        # Essas versões só chegam a todos os processos por um cache compartilhado
+        from .checks import cache_compartilhado
+        checks.register(cache_compartilhado, checks.Tags.caches)
+
+        # Alterações no calendário de feriados, por qualquer caminho
+        from .models import Feriado
+        post_save.connect(Feriado.calendario_alterado, sender=Feriado, dispatch_uid='lai_app.feriado_salvo')
+        post_delete.connect(Feriado.calendario_alterado, sender=Feriado, dispatch_uid='lai_app.feriado_excluido')
+
+        # Tabela de transições do fluxo, montada a partir de PedidoInformacao.SITUACOES
+        from .transicoes import compilar_transicoes
+        compilar_transicoes()
@@ -0,0 +1,169 @@
+from datetime import date, datetime, time, timedelta
+from typing import NamedTuple
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import DateTimeField, Max, Min, Q
+from django.db.models.expressions import RawSQL
+from django.utils.timezone import get_current_timezone_name, is_naive, localtime, make_aware
+
+from .models import Feriado, PedidoInformacao
+
+# Prazos da LAI, em dias úteis
+DIAS_RESPOSTA = 20
+DIAS_PRORROGACAO = 10
+DIAS_RECURSO = 10
+
+
+class CalendarioUteis:
+
+    # Índice de dias úteis entre 1º de janeiro de ano_inicial e 31 de dezembro de
+    # ano_final: acumulado[i] é o número de dias úteis de inicio até inicio + i,
+    # inclusive, e uteis[k] é o (k + 1)-ésimo dia útil. Somar n dias úteis a uma
+    # data é, portanto, uma consulta a cada lista.
+
+    # Cópia local ao processo, validada contra a versão dos feriados no cache uma
+    # vez por requisição, como a Configuração (ver SingletonModel)
+    _local = None
+    _versao_local = None
+    _versao_conferida = False
+
+    def __init__(self, ano_inicial, ano_final, feriados):
+        self.ano_inicial = ano_inicial
+        self.ano_final = ano_final
+        self.inicio = date(ano_inicial, 1, 1)
+        self.acumulado = []
+        self.uteis = []
+
+        dia = self.inicio
+        while dia.year <= ano_final:
+            if dia.weekday() < 5 and dia not in feriados:
+                self.uteis.append(dia)
+            self.acumulado.append(len(self.uteis))
+            dia += timedelta(days=1)
+
+    def cobre(self, ano_inicial, ano_final):
+        return self.ano_inicial <= ano_inicial and ano_final <= self.ano_final
+
+    def somar(self, data, dias):
+        # n-ésimo dia útil após a data, que não entra na contagem
+        return self.uteis[self.acumulado[(data - self.inicio).days] + dias - 1]
+
+    @classmethod
+    def limpar_cache(cls):
+        cls._local = None
+        cls._versao_local = None
+        cls._versao_conferida = False
+
+    @classmethod
+    def exigir_conferencia(cls):
+        # Chamado no início de cada requisição
+        cls._versao_conferida = False
+
+    @classmethod
+    def carregar(cls, ano_inicial, ano_final):
+        if cls._local is not None and not cls._versao_conferida:
+            versao = cache.get(Feriado.CHAVE_VERSAO)
+            if versao is None:
+                cache.add(Feriado.CHAVE_VERSAO, 1, None)
+                versao = cache.get(Feriado.CHAVE_VERSAO)
+            if versao != cls._versao_local:
+                cls._local = None
+            cls._versao_conferida = True
+
+        if cls._local is None or not cls._local.cobre(ano_inicial, ano_final):
+            # O novo índice também cobre os anos do anterior, para não ser refeito a
+            # cada data fora do intervalo
+            if cls._local is not None:
+                ano_inicial = min(ano_inicial, cls._local.ano_inicial)
+                ano_final = max(ano_final, cls._local.ano_final)
+            cache.add(Feriado.CHAVE_VERSAO, 1, None)
+            versao = cache.get(Feriado.CHAVE_VERSAO)
+            feriados = set(Feriado.objects.filter(data__year__gte=ano_inicial, data__year__lte=ano_final)
+                           .order_by().values_list('data', flat=True))
+            cls._local = cls(ano_inicial, ano_final, feriados)
+            cls._versao_local = versao
+            cls._versao_conferida = True
+
+        return cls._local
+
+
+def somar_dias_uteis(data, dias):
+    # O ano seguinte é incluído para os prazos que atravessam a virada do ano
+    return CalendarioUteis.carregar(data.year, data.year + 1).somar(data, dias)
+
+
+def prazo_em_dias_uteis(momento, dias):
+    # O prazo vence no fim do n-ésimo dia útil após a data do ato, no fuso local
+    if is_naive(momento):
+        momento = make_aware(momento)
+    final = somar_dias_uteis(localtime(momento).date(), dias)
+    return make_aware(datetime.combine(final, time.max))
+
+
+def prazo_resposta(data_pedido, prorrogado=False):
+    return prazo_em_dias_uteis(data_pedido, DIAS_RESPOSTA + (DIAS_PRORROGACAO if prorrogado else 0))
+
+
+class Prazo(NamedTuple):
+    # Prazo gravado numa coluna do pedido, contado em dias úteis da data de um ato
+    campo: str
+    data: str
+    dias: int
+    # Situações em que o prazo ainda corre
+    situacoes: tuple
+    # Campo da decisão cujo indeferimento (False) abre o prazo, se houver
+    decisao: str | None = None
+
+    def calcular(self, ped_info):
+        if self.decisao and getattr(ped_info, self.decisao):
+            return None
+        data = getattr(ped_info, self.data)
+        return prazo_em_dias_uteis(data, self.dias) if data else None
+
+    def filtro(self):
+        # Pedidos que têm esse prazo
+        condicao = Q(**{f'{self.data}__isnull': False})
+        if self.decisao:
+            condicao &= Q(**{self.decisao: False})
+        return condicao
+
+
+PRAZOS = {prazo.campo: prazo for prazo in (
+    Prazo('prazo_resposta', 'data_pedido', DIAS_RESPOSTA, ('AI', 'BI', 'EP', 'DR')),
+    Prazo('prazo_recurso_1', 'data_resp_inicial', DIAS_RECURSO, ('PR',), 'resp_inicial'),
+    Prazo('prazo_recurso_2', 'data_resp_recurso_1', DIAS_RECURSO, ('RR',), 'resp_recurso_1'),
+)}
+
+
+def expressao_prazo(prazo, calendario):
+    # Mesmo cálculo de prazo_em_dias_uteis, em SQL, com o índice de dias úteis
+    # passado como arrays: serve aos UPDATEs em conjunto (PostgreSQL)
+    coluna = connection.ops.quote_name(prazo.data)
+    fuso = get_current_timezone_name()
+    return RawSQL(
+        f"(((%s::date[])[(%s::integer[])[({coluna} AT TIME ZONE %s)::date - %s::date + 1] + %s]"
+        f" + %s::time) AT TIME ZONE %s)",
+        (calendario.uteis, calendario.acumulado, fuso, calendario.inicio, prazo.dias, time.max, fuso),
+        output_field=DateTimeField(),
+    )
+
+
+def calendario_para(pedidos, prazo):
+    # Índice que cobre as datas de origem do prazo nos pedidos (None se não houver)
+    limites = pedidos.aggregate(inicio=Min(prazo.data), fim=Max(prazo.data))
+    if limites['inicio'] is None:
+        return None
+    return CalendarioUteis.carregar(localtime(limites['inicio']).year, localtime(limites['fim']).year + 1)
+
+
+def recalcular_prazos():
+    # Recalcula de uma vez, com um UPDATE por prazo, os prazos que ainda correm;
+    # usado quando o calendário de feriados muda
+    atualizados = {}
+    for prazo in PRAZOS.values():
+        abertos = PedidoInformacao.objects.filter(prazo.filtro(), situacao__in=prazo.situacoes)
+        calendario = calendario_para(abertos, prazo)
+        atualizados[prazo.campo] = (abertos.update(**{prazo.campo: expressao_prazo(prazo, calendario)})
+                                    if calendario else 0)
+    return atualizados
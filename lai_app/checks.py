@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core import checks
+
+
+# Backends cujo conteúdo fica restrito a um processo (ou não é guardado): as
+# versões dos SingletonModel e do calendário não chegariam aos demais workers
+CACHES_LOCAIS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_compartilhado(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in CACHES_LOCAIS:
+        return [checks.Error(
+            f"O cache 'default' ({backend}) não é compartilhado entre os processos.",
+            hint="Configure CACHES['default'] com um backend compartilhado "
+                 "(DatabaseCache, Redis ou Memcached); as versões da Configuração "
+                 "e do calendário de feriados são guardadas nele.",
+            id='lai_app.E001',
+        )]
+    return []
@@ -0,0 +1,17 @@
+from django.utils.functional import SimpleLazyObject
+
+from .filas import filas_do_usuario
+
+
+def papeis(request):
+    # Disponibiliza os papéis do usuário para os templates
+    return {'papeis': getattr(request, 'papeis', None)}
+
+
+def filas(request):
+    # Tamanho das filas de trabalho do funcionário, para os indicadores da barra
+    # de navegação; lido das contagens apenas se o template usar
+    papeis = getattr(request, 'papeis', None)
+    if papeis is None or papeis.funcionario is None:
+        return {}
+    return {'filas': SimpleLazyObject(lambda: filas_do_usuario(request))}
@@ -0,0 +1,250 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import unicodedata
+from datetime import datetime
+from itertools import groupby
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.crypto import salted_hmac
+from django.utils.timezone import localtime, now
+
+from .models import PedidoInformacao, ResumoPedidos
+from .relatorio import MARGEM, desfecho
+
+# Colunas publicadas: (nome no arquivo, campo da consulta). Os dados pessoais do
+# cidadão (nome, documento e endereço) não são publicados; o requerente aparece
+# como um pseudônimo, que só permite agrupar os pedidos de uma mesma pessoa.
+COLUNAS = (
+    ('numero', 'num_registro'),
+    ('ano', 'ano'),
+    ('data_pedido', 'data_pedido'),
+    ('titulo', 'titulo'),
+    ('descricao', 'descricao'),
+    ('situacao', 'situacao'),
+    ('requerente', 'requerente_id'),
+    ('setor_info', 'setor_info__nome'),
+    ('data_encam', 'data_encam'),
+    ('data_fornec', 'data_fornec'),
+    ('parecer', 'parecer'),
+    ('data_parecer', 'data_parecer'),
+    ('resp_inicial', 'resp_inicial'),
+    ('just_resp_inicial', 'just_resp_inicial'),
+    ('data_resp_inicial', 'data_resp_inicial'),
+    ('recurso_1', 'recurso_1'),
+    ('data_recurso_1', 'data_recurso_1'),
+    ('resp_recurso_1', 'resp_recurso_1'),
+    ('just_resp_recurso_1', 'just_resp_recurso_1'),
+    ('data_resp_recurso_1', 'data_resp_recurso_1'),
+    ('recurso_2', 'recurso_2'),
+    ('data_recurso_2', 'data_recurso_2'),
+    ('resp_recurso_2', 'resp_recurso_2'),
+    ('just_resp_recurso_2', 'just_resp_recurso_2'),
+    ('data_resp_recurso_2', 'data_resp_recurso_2'),
+    ('atualizado_em', 'atualizado_em'),
+)
+
+# Textos livres, escritos pelo cidadão ou pela equipe, que podem citar dados
+# pessoais: são publicados depois de redigidos (ver redigir)
+TEXTOS_LIVRES = ('titulo', 'descricao', 'parecer', 'just_resp_inicial', 'recurso_1', 'just_resp_recurso_1',
+                 'recurso_2', 'just_resp_recurso_2')
+
+# Lidos só para a redação dos textos; nunca publicados
+CAMPOS_REQUERENTE = ('requerente__nome', 'requerente__num_doc_id')
+
+REMOVIDO = '[removido]'
+PADROES_PESSOAIS = (
+    # e-mail
+    re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+'),
+    # CPF, com ou sem pontuação
+    re.compile(r'\b\d{3}\.?\d{3}\.?\d{3}-?\d{2}\b'),
+    # Telefone com DDD, ou celular de nove dígitos
+    re.compile(r'(?:\+?55\s?)?(?:\(\d{2}\)\s?|\b\d{2}\s)9?\d{4}[-\s]?\d{4}\b'),
+    re.compile(r'\b9\d{4}[-\s]?\d{4}\b'),
+)
+# Partes do nome que não identificam ninguém sozinhas
+PARTICULAS = {'da', 'das', 'de', 'do', 'dos', 'e'}
+
+# Decisão de cada instância e a data que indica que ela foi proferida
+DECISOES = {'resp_inicial': 'data_resp_inicial', 'resp_recurso_1': 'data_resp_recurso_1',
+            'resp_recurso_2': 'data_resp_recurso_2'}
+
+LOTE_CURSOR = 2000
+MANIFESTO = 'manifesto.json'
+
+
+def pseudonimo(requerente_id):
+    # HMAC com chave secreta: sem a chave, não se chega ao cidadão a partir do
+    # pseudônimo, nem mesmo testando todas as chaves primárias
+    return salted_hmac('lai_app.dados_abertos', str(requerente_id),
+                       secret=settings.DADOS_ABERTOS_SEGREDO, algorithm='sha256').hexdigest()[:20]
+
+
+def sem_acentos(texto):
+    # Minúsculas e sem acentos, caractere a caractere: as posições continuam as do texto original
+    return ''.join(unicodedata.normalize('NFKD', caractere)[:1].lower() or caractere for caractere in texto)
+
+
+def redigir(texto, nome, documento):
+    # Troca por [removido] e-mails, CPFs, telefones, o documento e cada parte do
+    # nome do requerente (sem diferenciar maiúsculas e acentos)
+    if not texto:
+        return texto
+    padroes = list(PADROES_PESSOAIS)
+    partes = [parte for parte in sem_acentos(nome or '').split() if len(parte) > 2 and parte not in PARTICULAS]
+    if partes:
+        padroes.append(re.compile(r'\b(?:' + '|'.join(map(re.escape, partes)) + r')\b'))
+    digitos = re.sub(r'\D', '', documento or '')
+    if len(digitos) >= 5:
+        padroes.append(re.compile(r'(?<!\d)' + r'[.\-/\s]?'.join(digitos) + r'(?!\d)'))
+
+    comparado = sem_acentos(texto)
+    trechos = sorted(encontrado.span() for padrao in padroes for encontrado in padrao.finditer(comparado))
+    partes_texto, fim = [], 0
+    for inicio, final in trechos:
+        if inicio >= fim:
+            partes_texto.append(texto[fim:inicio] + REMOVIDO)
+            fim = final
+        else:
+            fim = max(fim, final)
+    return ''.join(partes_texto) + texto[fim:]
+
+
+def registro(linha):
+    pedido = dict(zip([campo for nome, campo in COLUNAS] + list(CAMPOS_REQUERENTE), linha))
+    item = {}
+    for nome, campo in COLUNAS:
+        valor = pedido[campo]
+        if isinstance(valor, datetime):
+            valor = localtime(valor).isoformat()
+        elif campo in TEXTOS_LIVRES:
+            valor = redigir(valor, pedido['requerente__nome'], pedido['requerente__num_doc_id'])
+        item[nome] = valor
+
+    item['situacao'] = PedidoInformacao.SITUACOES[pedido['situacao']]
+    item['requerente'] = pseudonimo(pedido['requerente_id'])
+    # Decisões ainda não proferidas ficam vazias, em vez de "Indeferido"
+    for decisao, data in DECISOES.items():
+        item[decisao] = ("Deferido" if pedido[decisao] else "Indeferido") if pedido[data] else None
+    item['desfecho'] = ResumoPedidos.DESFECHOS[desfecho(pedido)]
+    return item
+
+
+def registros(queryset):
+    # Lidos de um cursor do servidor, em ordem de ano e número, para gravar um
+    # arquivo por ano numa única passada
+    linhas = (queryset.order_by('ano', 'num_registro')
+              .values_list(*(campo for nome, campo in COLUNAS), *CAMPOS_REQUERENTE)
+              .iterator(chunk_size=LOTE_CURSOR))
+    return (registro(linha) for linha in linhas)
+
+
+def gravar_atomico(caminho, conteudo):
+    # Grava num temporário do mesmo diretório e renomeia: quem lê o diretório
+    # vê o arquivo anterior ou o novo completo, nunca um arquivo pela metade
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(descritor, 'wb') as arquivo:
+            resultado = conteudo(arquivo)
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        os.chmod(temporario, 0o644)
+        os.replace(temporario, caminho)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+    return resultado
+
+
+class GravacaoResumida:
+    # Repassa as gravações ao arquivo calculando o SHA-256 do que foi gravado
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.resumo = hashlib.sha256()
+
+    def write(self, dados):
+        self.resumo.update(dados)
+        return self.arquivo.write(dados)
+
+    def flush(self):
+        self.arquivo.flush()
+
+
+def gravar_jsonl_gzip(caminho, itens):
+    def conteudo(arquivo):
+        total = 0
+        destino = GravacaoResumida(arquivo)
+        with gzip.GzipFile(fileobj=destino, mode='wb', mtime=0) as comprimido:
+            for item in itens:
+                comprimido.write(json.dumps(item, ensure_ascii=False).encode('utf-8') + b'\n')
+                total += 1
+        return total, destino.resumo.hexdigest()
+
+    return gravar_atomico(caminho, conteudo)
+
+
+def ler_manifesto(diretorio):
+    try:
+        with open(os.path.join(diretorio, MANIFESTO), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return None
+
+
+def publicar(diretorio, incremental=False):
+    # Grava um arquivo completo por ano ou, no modo incremental, um arquivo de
+    # alterações por ano com os pedidos movimentados desde a marca do manifesto.
+    # As alterações só incluem e atualizam registros: um pedido excluído deixa de
+    # constar apenas na publicação completa seguinte.
+    # O manifesto é gravado por último: é ele que torna a publicação visível.
+    segredo = settings.DADOS_ABERTOS_SEGREDO
+    # Sem chave própria, salted_hmac usaria a SECRET_KEY, e os pseudônimos de uma
+    # faixa pequena de chaves primárias poderiam ser refeitos por quem a conhece
+    if not segredo or segredo == settings.SECRET_KEY:
+        raise ImproperlyConfigured("Defina DADOS_ABERTOS_SEGREDO com uma chave exclusiva da publicação.")
+    os.makedirs(diretorio, exist_ok=True)
+    manifesto = ler_manifesto(diretorio) if incremental else None
+    inicio = now()
+
+    pedidos = PedidoInformacao.objects.all()
+    if manifesto:
+        marca = datetime.fromisoformat(manifesto['marca'])
+        pedidos = pedidos.filter(atualizado_em__gte=marca - MARGEM)
+        arquivos = manifesto['arquivos']
+    else:
+        arquivos = []
+
+    gerados = []
+    for ano, itens in groupby(registros(pedidos), key=lambda item: item['ano']):
+        if manifesto:
+            nome, tipo = f"pedidos-{ano}-{localtime(inicio):%Y%m%d%H%M%S}.jsonl.gz", 'alteracoes'
+        else:
+            nome, tipo = f"pedidos-{ano}.jsonl.gz", 'completo'
+        linhas, sha256 = gravar_jsonl_gzip(os.path.join(diretorio, nome), itens)
+        gerados.append({'arquivo': nome, 'ano': ano, 'tipo': tipo, 'linhas': linhas, 'sha256': sha256,
+                        'gerado_em': localtime(inicio).isoformat()})
+
+    def conteudo(arquivo):
+        arquivo.write(json.dumps({
+            'marca': localtime(inicio).isoformat(),
+            # Os arquivos de alterações substituem, pela chave, os registros anteriores
+            'chave': ['ano', 'numero'],
+            'exclusoes': "Os arquivos de alterações não registram exclusões; "
+                         "elas aparecem na próxima publicação completa.",
+            'arquivos': arquivos + gerados,
+        }, ensure_ascii=False, indent=2).encode('utf-8'))
+    gravar_atomico(os.path.join(diretorio, MANIFESTO), conteudo)
+
+    # Uma publicação completa torna obsoletos os arquivos que não estão nela
+    if not manifesto:
+        publicados = {item['arquivo'] for item in gerados}
+        for nome in os.listdir(diretorio):
+            if nome.startswith('pedidos-') and nome.endswith('.jsonl.gz') and nome not in publicados:
+                os.remove(os.path.join(diretorio, nome))
+
+    return gerados
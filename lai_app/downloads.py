@@ -0,0 +1,114 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+BLOCO = 64 * 1024
+FAIXA = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def etag(estado):
+    # Muda quando o arquivo é regravado ou substituído
+    return quote_etag(f"{estado.st_mtime_ns:x}-{estado.st_size:x}")
+
+
+def etag_confere(cabecalho, valor):
+    # Comparação fraca (If-None-Match), que ignora o prefixo W/
+    etiquetas = [etiqueta.strip().removeprefix('W/') for etiqueta in cabecalho.split(',')]
+    return '*' in etiquetas or valor in etiquetas
+
+
+def faixa_pedida(cabecalho, tamanho):
+    # Uma única faixa "bytes=inicio-fim" ou "bytes=-sufixo": devolve (início, fim)
+    # inclusivos, None para ignorar o cabeçalho (várias faixas, sintaxe
+    # inválida) ou False se a faixa não puder ser atendida
+    encontrado = FAIXA.match(cabecalho.strip())
+    if not encontrado or encontrado.groups() == ('', ''):
+        return None
+    inicio, fim = encontrado.groups()
+    if not inicio:
+        sufixo = int(fim)
+        if not sufixo or not tamanho:
+            return False
+        return max(tamanho - sufixo, 0), tamanho - 1
+    inicio = int(inicio)
+    if fim and int(fim) < inicio:
+        return None
+    if inicio >= tamanho:
+        return False
+    return inicio, min(int(fim), tamanho - 1) if fim else tamanho - 1
+
+
+def ler_trecho(caminho, inicio, quantidade):
+    with open(caminho, 'rb') as arquivo:
+        arquivo.seek(inicio)
+        while quantidade > 0:
+            bloco = arquivo.read(min(BLOCO, quantidade))
+            if not bloco:
+                break
+            quantidade -= len(bloco)
+            yield bloco
+
+
+def servir_arquivo(request, caminho, nome):
+    # Entrega o arquivo já autorizado pela view. Com ARQUIVOS_PROTEGIDOS definido,
+    # a transferência fica com o proxy (X-Accel-Redirect do nginx ou X-Sendfile
+    # do Apache/lighttpd), que também trata Range e ETag; sem ele, o próprio
+    # Django atende, com Range, ETag e If-None-Match.
+    estado = os.stat(caminho)
+    tipo = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+    cabecalhos = {
+        'Content-Type': tipo,
+        'Content-Disposition': content_disposition_header(False, nome),
+        # Conteúdo sujeito a autorização: só o navegador guarda, e revalida
+        'Cache-Control': 'private, no-cache',
+    }
+
+    modo = settings.ARQUIVOS_PROTEGIDOS
+    if modo == 'x-accel':
+        relativo = os.path.relpath(caminho, settings.MEDIA_ROOT)
+        resposta = HttpResponse(headers=cabecalhos)
+        resposta['X-Accel-Redirect'] = settings.ARQUIVOS_PROTEGIDOS_PREFIXO + quote(relativo.replace(os.sep, '/'))
+        return resposta
+    if modo == 'x-sendfile':
+        resposta = HttpResponse(headers=cabecalhos)
+        resposta['X-Sendfile'] = caminho
+        return resposta
+
+    valor_etag = etag(estado)
+    cabecalhos.update({'ETag': valor_etag, 'Last-Modified': http_date(estado.st_mtime),
+                       'Accept-Ranges': 'bytes'})
+
+    if etag_confere(request.headers.get('If-None-Match', ''), valor_etag):
+        resposta = HttpResponseNotModified()
+        for cabecalho in ('ETag', 'Last-Modified', 'Cache-Control'):
+            resposta[cabecalho] = cabecalhos[cabecalho]
+        return resposta
+
+    tamanho = estado.st_size
+    faixa = None
+    # If-Range: a faixa só vale se o arquivo ainda for o mesmo que o cliente tem
+    if 'Range' in request.headers and request.headers.get('If-Range', valor_etag) == valor_etag:
+        faixa = faixa_pedida(request.headers['Range'], tamanho)
+
+    if faixa is False:
+        resposta = HttpResponse(status=416, headers=cabecalhos)
+        resposta['Content-Range'] = f"bytes */{tamanho}"
+        return resposta
+
+    if faixa is None:
+        # FileResponse usa o wsgi.file_wrapper do servidor, quando houver
+        resposta = FileResponse(open(caminho, 'rb'))
+        for cabecalho, valor in cabecalhos.items():
+            resposta[cabecalho] = valor
+        return resposta
+
+    inicio, fim = faixa
+    resposta = StreamingHttpResponse(ler_trecho(caminho, inicio, fim - inicio + 1), status=206, headers=cabecalhos)
+    resposta['Content-Range'] = f"bytes {inicio}-{fim}/{tamanho}"
+    resposta['Content-Length'] = fim - inicio + 1
+    return resposta
@@ -0,0 +1,108 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from django.http import StreamingHttpResponse
+from django.utils.timezone import localtime, now
+
+from .models import PedidoInformacao
+
+# Colunas exportadas: (cabeçalho, campo da consulta); o requerente e o setor vêm
+# no mesmo join da consulta dos pedidos
+COLUNAS = (
+    ('numero', 'num_registro'),
+    ('ano', 'ano'),
+    ('data_pedido', 'data_pedido'),
+    ('titulo', 'titulo'),
+    ('situacao', 'situacao'),
+    ('requerente', 'requerente__nome'),
+    ('setor_info', 'setor_info__nome'),
+    ('prazo_resposta', 'prazo_resposta'),
+    ('data_resp_inicial', 'data_resp_inicial'),
+)
+
+# Linhas lidas do cursor do servidor a cada ida ao banco e linhas por bloco
+# enviado ao cliente: a memória usada não depende do tamanho do resultado
+LOTE_CURSOR = 2000
+LINHAS_POR_BLOCO = 500
+
+# Início de texto que a planilha interpreta como fórmula
+INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def linhas(queryset):
+    # Tuplas lidas de um cursor do servidor, sem o cache de resultados do queryset
+    situacoes = PedidoInformacao.SITUACOES
+    posicao_situacao = [campo for cabecalho, campo in COLUNAS].index('situacao')
+    for linha in queryset.values_list(*(campo for cabecalho, campo in COLUNAS)).iterator(chunk_size=LOTE_CURSOR):
+        linha = list(linha)
+        linha[posicao_situacao] = situacoes[linha[posicao_situacao]]
+        yield linha
+
+
+def blocos(itens):
+    bloco = []
+    for item in itens:
+        bloco.append(item)
+        if len(bloco) == LINHAS_POR_BLOCO:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+def celula_csv(valor):
+    if isinstance(valor, datetime):
+        return f"{localtime(valor):%d/%m/%Y %H:%M}"
+    # Textos digitados pelo cidadão (título, nome) vão como texto, nunca como
+    # fórmula: o apóstrofo inicial impede a injeção de fórmulas na planilha
+    if isinstance(valor, str) and valor.startswith(INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def gerar_csv(queryset):
+    # Separador ';' e BOM UTF-8, como espera a planilha em português
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+    escritor.writerow(cabecalho for cabecalho, campo in COLUNAS)
+    yield '\ufeff' + buffer.getvalue()
+
+    for bloco in blocos(linhas(queryset)):
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows([celula_csv(valor) for valor in linha] for linha in bloco)
+        yield buffer.getvalue()
+
+
+def gerar_jsonl_gzip(queryset):
+    # Um objeto JSON por linha, comprimido em gzip à medida que é gerado
+    compressor = zlib.compressobj(wbits=31)
+    cabecalhos = [cabecalho for cabecalho, campo in COLUNAS]
+
+    def valor_json(valor):
+        return localtime(valor).isoformat() if isinstance(valor, datetime) else valor
+
+    for bloco in blocos(linhas(queryset)):
+        texto = ''.join(json.dumps(dict(zip(cabecalhos, map(valor_json, linha))), ensure_ascii=False) + '\n'
+                        for linha in bloco)
+        comprimido = compressor.compress(texto.encode('utf-8'))
+        if comprimido:
+            yield comprimido
+    yield compressor.flush()
+
+
+# formato: (gerador, content type, extensão do arquivo)
+FORMATOS = {
+    'csv': (gerar_csv, 'text/csv; charset=utf-8', 'csv'),
+    'jsonl': (gerar_jsonl_gzip, 'application/gzip', 'jsonl.gz'),
+}
+
+
+def exportar(queryset, formato):
+    gerador, tipo, extensao = FORMATOS[formato]
+    resposta = StreamingHttpResponse(gerador(queryset), content_type=tipo)
+    resposta['Content-Disposition'] = f'attachment; filename="pedidos-{localtime(now()):%Y%m%d-%H%M}.{extensao}"'
+    return resposta
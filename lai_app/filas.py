@@ -0,0 +1,51 @@
+from collections import Counter
+
+from .models import ContagemPedidos, PedidoInformacao
+
+# Fila de trabalho de cada papel: (papel, situação); a fila de fornecimento é a
+# do setor do próprio funcionário
+FILAS = {
+    'analise': ('adm', 'AI'),
+    'parecer': ('parecer', 'EP'),
+    'resposta': ('resposta', 'DR'),
+    'recurso_1': ('recurso_1', 'AR'),
+    'recurso_2': ('recurso_2', 'AF'),
+}
+
+
+def contagens(request):
+    # Lidas uma única vez por requisição, para a barra de navegação e o painel
+    if not hasattr(request, '_contagens'):
+        request._contagens = ContagemPedidos.totais()
+    return request._contagens
+
+
+def por_situacao(totais):
+    situacoes = Counter()
+    for (situacao, setor_id), (setor_nome, total) in totais.items():
+        situacoes[situacao] += total
+    return situacoes
+
+
+def filas_do_usuario(request):
+    papeis = request.papeis
+    totais = contagens(request)
+    situacoes = por_situacao(totais)
+
+    filas = {nome: situacoes[situacao] for nome, (papel, situacao) in FILAS.items() if getattr(papeis, papel)}
+    if papeis.funcionario:
+        filas['fornecimento'] = totais.get(('BI', papeis.lotacao_id), (None, 0))[1]
+    return filas
+
+
+def painel(request):
+    # Pedidos por situação e, para o setor administrativo, a busca de
+    # informações distribuída pelos setores fornecedores
+    totais = contagens(request)
+    situacoes = por_situacao(totais)
+
+    painel = {'situacoes': [(nome, situacoes[situacao]) for situacao, nome in PedidoInformacao.SITUACOES.items()]}
+    if request.papeis.adm:
+        painel['fornecimento'] = sorted((setor_nome, total) for (situacao, setor_id), (setor_nome, total)
+                                        in totais.items() if situacao == 'BI' and total)
+    return painel
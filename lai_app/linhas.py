@@ -0,0 +1,53 @@
+from django.db.models import F
+
+from .models import PedidoInformacao
+from .paginacao import PaginacaoKeysetMixin
+
+
+class LinhaPedInfo:
+    # Linha compacta das listagens de pedidos: só as colunas exibidas nas
+    # tabelas, sem o estado e os campos de texto de uma instância do modelo
+
+    CAMPOS = ('id', 'num_registro', 'ano', 'data_pedido', 'titulo', 'situacao',
+              'requerente_nome', 'data_recurso_1', 'data_recurso_2')
+
+    __slots__ = CAMPOS
+
+    SITUACOES = dict(PedidoInformacao.SITUACOES)
+
+    def __init__(self, id, num_registro, ano, data_pedido, titulo, situacao,
+                 requerente_nome, data_recurso_1, data_recurso_2):
+        self.id = id
+        self.num_registro = num_registro
+        self.ano = ano
+        self.data_pedido = data_pedido
+        self.titulo = titulo
+        self.situacao = situacao
+        self.requerente_nome = requerente_nome
+        self.data_recurso_1 = data_recurso_1
+        self.data_recurso_2 = data_recurso_2
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_situacao_display(self):
+        return self.SITUACOES.get(self.situacao, self.situacao)
+
+    def __str__(self):
+        return f"{self.num_registro}/{self.ano}"
+
+    def __repr__(self):
+        return f"<LinhaPedInfo: {self}>"
+
+
+class ListaPedInfosMixin(PaginacaoKeysetMixin):
+    # Listagens de pedidos: busca apenas as colunas de LinhaPedInfo, com o nome
+    # do requerente obtido no mesmo join, e materializa a página como LinhaPedInfo
+
+    def projetar(self, queryset):
+        campos = [campo for campo in LinhaPedInfo.CAMPOS if campo != 'requerente_nome']
+        return queryset.values(*campos, requerente_nome=F('requerente__nome'))
+
+    def materializar(self, itens):
+        return [LinhaPedInfo(*(item[campo] for campo in LinhaPedInfo.CAMPOS)) for item in itens]
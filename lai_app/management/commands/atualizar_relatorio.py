@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from lai_app.relatorio import atualizar_resumo
+
+
+class Command(BaseCommand):
+    help = ("Atualiza o resumo do relatório anual da LAI, refazendo apenas os meses com pedidos "
+            "movimentados desde a última atualização. Agende periodicamente (ex.: a cada 15 minutos).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true',
+                            help="Refaz o resumo de todos os meses")
+
+    def handle(self, *args, **options):
+        meses = atualizar_resumo(completo=options['completo'])
+        for ano, mes in meses:
+            self.stdout.write(f"{mes:02d}/{ano}")
+        self.stdout.write(self.style.SUCCESS(f"{len(meses)} mês(es) atualizado(s)."))
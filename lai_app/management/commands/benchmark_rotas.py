@@ -0,0 +1,173 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+from django.utils.timezone import localtime, now
+
+from lai_app.models import Cidadao, Configuracao, Funcionario, PedidoInformacao
+
+# Cenários por rota: (rota, papel, situação do pedido de referência, parâmetros GET).
+# O pedido de referência vai na URL das rotas que recebem a chave do pedido.
+# O papel é resolvido sobre os dados existentes: 'anonimo', 'cidadao', 'requerente'
+# (o requerente do pedido), 'fornecedor' (funcionário do setor do pedido) ou o nome
+# de um setor da Configuracao.
+CENARIOS = (
+    ('menu', 'setor_adm', None, {}),
+    ('req_info', 'cidadao', None, {}),
+    ('registrar_cidadao', 'anonimo', None, {}),
+    ('metricas', 'anonimo', None, {}),
+    ('analisar_ped_info', 'setor_adm', 'AI', {}),
+    ('fornecer_ped_info', 'fornecedor', 'BI', {}),
+    ('parecer_ped_info', 'setor_parecer', 'EP', {}),
+    ('resposta_ped_info', 'setor_resposta', 'DR', {}),
+    ('recurso1_ped_info', 'requerente', 'PR', {}),
+    ('resposta_rec_1', 'setor_recurso_1', 'AR', {}),
+    ('recurso2_ped_info', 'requerente', 'RR', {}),
+    ('resposta_rec_2', 'setor_recurso_2', 'AF', {}),
+    ('detalhes_ped_info', 'setor_adm', 'RF', {}),
+    ('arquivo_ped_info', 'setor_adm', 'RF', {}),
+    ('ped_infos_analise', 'setor_adm', None, {}),
+    ('meus_ped_infos', 'requerente', 'PR', {}),
+    ('ped_infos_fornecimento', 'fornecedor', 'BI', {}),
+    ('ped_infos_geral', 'setor_adm', None, {}),
+    ('ped_infos_geral', 'setor_adm', None, {'busca': 'licitação merenda'}),
+    ('ped_infos_geral', 'setor_adm', None, {'requerente': 'maria silva'}),
+    ('ped_infos_geral', 'setor_adm', None, {'situacao': 'PR', 'ordenacao': 'data_pedido'}),
+    ('ped_infos_parecer', 'setor_parecer', None, {}),
+    ('ped_infos_resposta', 'setor_resposta', None, {}),
+    ('ped_infos_resp_rec_1', 'setor_recurso_1', None, {}),
+    ('ped_infos_resp_rec_2', 'setor_recurso_2', None, {}),
+    ('prazos_setor', 'setor_resposta', None, {}),
+    ('relatorio_anual', 'anonimo', None, {}),
+)
+
+
+def percentil(amostras, p):
+    ordenadas = sorted(amostras)
+    return ordenadas[min(len(ordenadas) - 1, int(round(p / 100 * (len(ordenadas) - 1))))]
+
+
+class Command(BaseCommand):
+    help = ("Percorre todas as rotas de lai_cmg/urls.py pelo cliente de testes, com o papel "
+            "adequado, e grava p50/p95 de latência e o número de consultas em JSON. "
+            "Com --base, compara com uma execução anterior e falha se houver regressão.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=20)
+        parser.add_argument('--saida', default='benchmark.json')
+        parser.add_argument('--base', help="JSON de uma execução anterior para comparação")
+        parser.add_argument('--tolerancia', type=float, default=20,
+                            help="Aumento percentual de p95 tolerado em relação à base (padrão: 20)")
+
+    def handle(self, *args, **options):
+        configuracao = Configuracao.load()
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        # O token de /metrics, quando configurado, vai em todas as requisições
+        token = settings.METRICAS_TOKEN
+        cliente = Client(HTTP_HOST=host, headers={'Authorization': f"Bearer {token}"} if token else None)
+
+        padroes = [padrao for padrao in get_resolver().url_patterns
+                   if isinstance(padrao, URLPattern) and padrao.name]
+        rotas = {padrao.name for padrao in padroes}
+        # Rotas que recebem a chave do pedido na URL
+        com_pk = {padrao.name for padrao in padroes if getattr(padrao.pattern, 'converters', None)}
+        sem_cenario = rotas - {rota for rota, *_ in CENARIOS}
+        if sem_cenario:
+            self.stderr.write(f"Rotas sem cenário de benchmark: {', '.join(sorted(sem_cenario))}")
+
+        resultados = {}
+        for rota, papel, situacao, parametros in CENARIOS:
+            nome = rota + (f" {json.dumps(parametros, ensure_ascii=False)}" if parametros else "")
+            ped_info = self.pedido(situacao) if situacao else None
+            if situacao and ped_info is None:
+                self.stderr.write(f"{nome}: nenhum pedido em {situacao}, ignorada")
+                continue
+            # Os dados sintéticos só registram o caminho do arquivo de informação
+            if rota == 'arquivo_ped_info' and not ped_info.arquivo_info.storage.exists(ped_info.arquivo_info.name):
+                self.stderr.write(f"{nome}: arquivo {ped_info.arquivo_info.name} ausente em MEDIA_ROOT, ignorada")
+                continue
+            usuario = self.usuario(papel, ped_info, configuracao)
+            cliente.logout()
+            if usuario is not None:
+                cliente.force_login(usuario)
+
+            url = reverse(rota, args=[ped_info.pk] if rota in com_pk else [])
+            cliente.get(url, parametros)  # aquecimento
+            latencias = []
+            for _ in range(options['repeticoes']):
+                with CaptureQueriesContext(connection) as consultas:
+                    inicio = time.perf_counter()
+                    resposta = cliente.get(url, parametros)
+                    latencias.append((time.perf_counter() - inicio) * 1000)
+
+            resultados[nome] = {
+                'status': resposta.status_code,
+                'consultas': len(consultas),
+                'p50_ms': round(statistics.median(latencias), 2),
+                'p95_ms': round(percentil(latencias, 95), 2),
+            }
+            self.stdout.write(f"{nome:60} {resposta.status_code}  {len(consultas):3d} consultas  "
+                              f"p50 {resultados[nome]['p50_ms']:8.2f} ms  p95 {resultados[nome]['p95_ms']:8.2f} ms")
+
+        relatorio = {
+            'gerado_em': localtime(now()).isoformat(),
+            'pedidos': PedidoInformacao.objects.count(),
+            'repeticoes': options['repeticoes'],
+            'rotas': resultados,
+        }
+        with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {options['saida']}"))
+
+        if options['base']:
+            with open(options['base'], encoding='utf-8') as arquivo:
+                base = json.load(arquivo)
+            regressoes = self.comparar(base['rotas'], resultados, options['tolerancia'])
+            if regressoes:
+                raise CommandError(f"{regressoes} rota(s) com regressão em relação a {options['base']}")
+
+    def pedido(self, situacao):
+        pedidos = PedidoInformacao.objects.filter(situacao=situacao)
+        # Os recursos só podem ser interpostos dentro do prazo
+        if situacao == 'PR':
+            pedidos = pedidos.filter(prazo_recurso_1__gte=now())
+        elif situacao == 'RR':
+            pedidos = pedidos.filter(prazo_recurso_2__gte=now())
+        return pedidos.order_by('-data_pedido').first()
+
+    def usuario(self, papel, ped_info, configuracao):
+        if papel == 'anonimo':
+            return None
+        if papel == 'requerente':
+            return ped_info.requerente.credenciais
+        if papel == 'cidadao':
+            cidadao = Cidadao.objects.filter(credenciais__isnull=False).order_by('pk').first()
+            return cidadao.credenciais if cidadao else None
+        setor_id = ped_info.setor_info_id if papel == 'fornecedor' else getattr(configuracao, papel + '_id')
+        funcionario = (Funcionario.objects.filter(lotacao_id=setor_id, credenciais__isnull=False)
+                       .order_by('pk').first())
+        if funcionario is None:
+            raise CommandError(f"Nenhum funcionário com credenciais para o papel {papel}.")
+        return funcionario.credenciais
+
+    def comparar(self, base, resultados, tolerancia):
+        regressoes = 0
+        self.stdout.write(f"\nComparação com a base (tolerância de {tolerancia:.0f}% em p95):")
+        for nome, atual in resultados.items():
+            anterior = base.get(nome)
+            if anterior is None:
+                self.stdout.write(f"{nome:60} nova")
+                continue
+            variacao = (atual['p95_ms'] / anterior['p95_ms'] - 1) * 100 if anterior['p95_ms'] else 0
+            piorou = variacao > tolerancia or atual['consultas'] > anterior['consultas']
+            linha = (f"{nome:60} p95 {anterior['p95_ms']:8.2f} -> {atual['p95_ms']:8.2f} ms ({variacao:+.0f}%)  "
+                     f"consultas {anterior['consultas']} -> {atual['consultas']}")
+            self.stdout.write(self.style.ERROR(linha) if piorou else linha)
+            regressoes += piorou
+        return regressoes
@@ -0,0 +1,468 @@
+import asyncio
+import json
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from importlib import import_module
+from urllib.parse import urlencode, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Max, Min
+from django.urls import reverse
+
+from lai_app.models import Cidadao, Configuracao, Funcionario, PedidoInformacao, Setor
+
+# Etapas do ciclo de vida: (nome, situação de origem, rota da fila, rota do formulário, papel)
+ETAPAS = (
+    ('requerer', None, None, 'req_info', 'cidadao'),
+    ('analisar', 'AI', 'ped_infos_analise', 'analisar_ped_info', 'setor_adm'),
+    ('fornecer', 'BI', 'ped_infos_fornecimento', 'fornecer_ped_info', 'fornecedor'),
+    ('parecer', 'EP', 'ped_infos_parecer', 'parecer_ped_info', 'setor_parecer'),
+    ('responder', 'DR', 'ped_infos_resposta', 'resposta_ped_info', 'setor_resposta'),
+    ('recurso_1', 'PR', None, 'recurso1_ped_info', 'requerente'),
+    ('responder_recurso_1', 'AR', 'ped_infos_resp_rec_1', 'resposta_rec_1', 'setor_recurso_1'),
+    ('recurso_2', 'RR', None, 'recurso2_ped_info', 'requerente'),
+    ('responder_recurso_2', 'AF', 'ped_infos_resp_rec_2', 'resposta_rec_2', 'setor_recurso_2'),
+)
+ETAPA_POR_ORIGEM = {origem: nome for nome, origem, *_ in ETAPAS if origem}
+
+TAXAS_PADRAO = {'requerer': 4, 'analisar': 2, 'fornecer': 2, 'parecer': 2, 'responder': 2,
+                'recurso_1': 0.5, 'responder_recurso_1': 0.5, 'recurso_2': 0.25, 'responder_recurso_2': 0.25}
+
+CONFLITO = "já foi movimentado por outro usuário"
+
+
+class Resposta:
+
+    def __init__(self, status, cabecalhos, corpo):
+        self.status = status
+        self.cabecalhos = cabecalhos
+        self.corpo = corpo
+
+    @property
+    def texto(self):
+        return self.corpo.decode('utf-8', errors='replace')
+
+
+class Ator:
+    # Cliente HTTP/1.1 mínimo sobre asyncio (uma conexão por requisição), com os
+    # cookies de sessão e CSRF de um usuário
+
+    def __init__(self, host, porta, sessao=None):
+        self.host = host
+        self.porta = porta
+        self.cookies = {}
+        if sessao:
+            self.cookies[settings.SESSION_COOKIE_NAME] = sessao
+
+    async def requisitar(self, metodo, caminho, corpo=b'', tipo=None):
+        leitor, escritor = await asyncio.open_connection(self.host, self.porta)
+        try:
+            cabecalhos = [f"{metodo} {caminho} HTTP/1.1", f"Host: {self.host}:{self.porta}",
+                          "Connection: close", f"Content-Length: {len(corpo)}"]
+            if tipo:
+                cabecalhos.append(f"Content-Type: {tipo}")
+            if self.cookies:
+                cabecalhos.append("Cookie: " + "; ".join(f"{nome}={valor}" for nome, valor in self.cookies.items()))
+            escritor.write(("\r\n".join(cabecalhos) + "\r\n\r\n").encode('latin-1') + corpo)
+            await escritor.drain()
+            bruto = await leitor.read()
+        finally:
+            escritor.close()
+
+        cabeca, _, corpo = bruto.partition(b"\r\n\r\n")
+        linhas = cabeca.decode('latin-1').split("\r\n")
+        status = int(linhas[0].split()[1])
+        recebidos = defaultdict(list)
+        for linha in linhas[1:]:
+            nome, _, valor = linha.partition(":")
+            recebidos[nome.strip().lower()].append(valor.strip())
+        for valor in recebidos.get('set-cookie', []):
+            for nome, morsel in SimpleCookie(valor).items():
+                self.cookies[nome] = morsel.value
+        if 'chunked' in recebidos.get('transfer-encoding', [''])[0]:
+            corpo = desfazer_chunked(corpo)
+        return Resposta(status, recebidos, corpo)
+
+    async def get(self, caminho):
+        return await self.requisitar('GET', caminho)
+
+    async def enviar_formulario(self, caminho, pagina, campos, arquivo=None):
+        # Envia o formulário com o token CSRF da página obtida antes
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', pagina.texto)
+        campos = {'csrfmiddlewaretoken': token.group(1) if token else '', **campos}
+        if arquivo is None:
+            return await self.requisitar('POST', caminho, urlencode(campos).encode(),
+                                         'application/x-www-form-urlencoded')
+        fronteira = uuid.uuid4().hex
+        partes = [f'--{fronteira}\r\nContent-Disposition: form-data; name="{nome}"\r\n\r\n{valor}\r\n'.encode()
+                  for nome, valor in campos.items()]
+        nome_campo, nome_arquivo, conteudo = arquivo
+        partes.append(f'--{fronteira}\r\nContent-Disposition: form-data; name="{nome_campo}"; '
+                      f'filename="{nome_arquivo}"\r\nContent-Type: application/pdf\r\n\r\n'.encode()
+                      + conteudo + b"\r\n")
+        partes.append(f"--{fronteira}--\r\n".encode())
+        return await self.requisitar('POST', caminho, b"".join(partes), f"multipart/form-data; boundary={fronteira}")
+
+
+def desfazer_chunked(corpo):
+    saida = bytearray()
+    while corpo:
+        tamanho, _, corpo = corpo.partition(b"\r\n")
+        tamanho = int(tamanho.split(b";")[0], 16)
+        if not tamanho:
+            break
+        saida += corpo[:tamanho]
+        corpo = corpo[tamanho + 2:]
+    return bytes(saida)
+
+
+class AmostradorBloqueios(threading.Thread):
+    # Amostra periodicamente, no PostgreSQL, as sessões à espera de bloqueio e as
+    # atribui à etapa pelo comando em execução: o UPDATE de transição filtra pela
+    # situação de origem; o de numeração é o UPDATE de lai_app_numerador
+
+    def __init__(self, intervalo):
+        super().__init__(daemon=True)
+        self.intervalo = intervalo
+        self.parar = threading.Event()
+        self.amostras = defaultdict(int)
+
+    def run(self):
+        try:
+            with connection.cursor() as cursor:
+                while not self.parar.wait(self.intervalo):
+                    cursor.execute("SELECT query FROM pg_stat_activity "
+                                   "WHERE wait_event_type = 'Lock' AND datname = current_database()")
+                    for consulta, in cursor.fetchall():
+                        self.amostras[self.classificar(consulta)] += 1
+        finally:
+            connection.close()
+
+    @staticmethod
+    def classificar(consulta):
+        if 'lai_app_numerador' in consulta:
+            return 'requerer'
+        origem = re.search(r'WHERE .*"situacao" = \'(\w\w)\'', consulta)
+        if origem:
+            return ETAPA_POR_ORIGEM.get(origem.group(1), 'outras')
+        return 'outras'
+
+    def esperas(self):
+        # Tempo de espera estimado: amostras em espera vezes o intervalo de amostragem
+        return {etapa: {'amostras': total, 'espera_estimada_s': round(total * self.intervalo, 3)}
+                for etapa, total in self.amostras.items()}
+
+
+class Command(BaseCommand):
+    help = ("Gerador de carga do ciclo de vida dos pedidos: cidadãos e funcionários simulados, "
+            "com chegadas de Poisson por etapa, movimentam pedidos por HTTP contra um servidor "
+            "local. Informa vazão, taxa de erro, conflitos e esperas por bloqueio por etapa.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help="Servidor alvo (padrão: http://127.0.0.1:8000)")
+        parser.add_argument('--iniciar', choices=['wsgi', 'asgi'],
+                            help="Inicia o servidor local (runserver ou uvicorn) antes da carga")
+        parser.add_argument('--duracao', type=float, default=60, help="Segundos de carga (padrão: 60)")
+        parser.add_argument('--taxa', action='append', default=[], metavar='ETAPA=CHEGADAS_POR_S',
+                            help="Taxa de chegada de uma etapa; pode ser repetido")
+        parser.add_argument('--concorrencia', type=int, default=50,
+                            help="Máximo de ações simultâneas (padrão: 50)")
+        parser.add_argument('--topo-fila', type=int, default=3,
+                            help="Os atores escolhem entre os N primeiros da fila, o que provoca "
+                                 "disputa pelo mesmo pedido (padrão: 3)")
+        parser.add_argument('--cidadaos', type=int, default=200, help="Cidadãos que protocolam pedidos")
+        parser.add_argument('--amostragem', type=float, default=0.05,
+                            help="Intervalo, em segundos, da amostragem de bloqueios (padrão: 0,05)")
+        parser.add_argument('--semente', type=int)
+        parser.add_argument('--saida', help="Grava o relatório em JSON")
+
+    def handle(self, *args, **options):
+        taxas = dict(TAXAS_PADRAO)
+        for taxa in options['taxa']:
+            etapa, _, valor = taxa.partition('=')
+            if etapa not in taxas:
+                raise CommandError(f"Etapa desconhecida: {etapa}. Use uma de: {', '.join(taxas)}")
+            taxas[etapa] = float(valor)
+
+        alvo = urlsplit(options['url'])
+        self.host, self.porta = alvo.hostname, alvo.port or 80
+        self.aleatorio = random.Random(options['semente'])
+        self.topo_fila = options['topo_fila']
+        self.sessoes = {}
+        self.preparar_atores(options['cidadaos'])
+
+        servidor = self.iniciar_servidor(options['iniciar']) if options['iniciar'] else None
+        amostrador = None
+        if connection.vendor == 'postgresql':
+            amostrador = AmostradorBloqueios(options['amostragem'])
+            amostrador.start()
+        try:
+            self.resultados = defaultdict(lambda: defaultdict(int))
+            self.latencias = defaultdict(list)
+            inicio = time.perf_counter()
+            asyncio.run(self.carga(taxas, options['duracao'], options['concorrencia']))
+            duracao = time.perf_counter() - inicio
+        finally:
+            if amostrador is not None:
+                amostrador.parar.set()
+                amostrador.join()
+            if servidor is not None:
+                servidor.terminate()
+                servidor.wait()
+
+        relatorio = self.relatorio(duracao, amostrador.esperas() if amostrador else {})
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+
+    def preparar_atores(self, quantidade_cidadaos):
+        configuracao = Configuracao.load()
+        self.funcionarios = {}
+        for papel in ('setor_adm', 'setor_parecer', 'setor_resposta', 'setor_recurso_1', 'setor_recurso_2'):
+            self.funcionarios[papel] = self.funcionario_do_setor(getattr(configuracao, papel + '_id'), papel)
+        # Um funcionário por setor fornecedor que tenha alguém com credenciais
+        self.fornecedores = {}
+        for setor_id in Setor.objects.values_list('pk', flat=True):
+            funcionario = (Funcionario.objects.filter(lotacao_id=setor_id, credenciais__isnull=False)
+                           .order_by('pk').first())
+            if funcionario:
+                self.fornecedores[setor_id] = funcionario.credenciais
+        self.setores = list(self.fornecedores)
+        # Sorteio sobre a lista de chaves, lida uma vez: order_by('?') ordenaria a
+        # tabela inteira no banco, uma carga que a aplicação real nunca gera
+        pks = list(Cidadao.objects.filter(credenciais__isnull=False).values_list('pk', flat=True))
+        sorteados = self.aleatorio.sample(pks, min(quantidade_cidadaos, len(pks)))
+        self.cidadaos = [cidadao.credenciais for cidadao in
+                         Cidadao.objects.filter(pk__in=sorteados).select_related('credenciais').order_by('pk')]
+        # Faixa de chaves dos pedidos, para sortear os pedidos dos recursos
+        faixa = PedidoInformacao.objects.aggregate(menor=Min('pk'), maior=Max('pk'))
+        self.faixa_pedidos = (faixa['menor'] or 0, faixa['maior'] or 0)
+        if not self.cidadaos:
+            raise CommandError("Nenhum cidadão com credenciais; rode antes gerar_dados_sinteticos.")
+
+    def funcionario_do_setor(self, setor_id, papel):
+        funcionario = (Funcionario.objects.filter(lotacao_id=setor_id, credenciais__isnull=False)
+                       .order_by('pk').first())
+        if funcionario is None:
+            raise CommandError(f"Nenhum funcionário com credenciais no setor de {papel}.")
+        return funcionario.credenciais
+
+    def sessao(self, usuario):
+        # Sessão autenticada criada direto no armazenamento, sem passar pelo login
+        if usuario.pk not in self.sessoes:
+            sessao = import_module(settings.SESSION_ENGINE).SessionStore()
+            sessao[SESSION_KEY] = str(usuario.pk)
+            sessao[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            sessao[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+            sessao.create()
+            self.sessoes[usuario.pk] = sessao.session_key
+        return self.sessoes[usuario.pk]
+
+    def iniciar_servidor(self, tipo):
+        endereco = f"{self.host}:{self.porta}"
+        if tipo == 'wsgi':
+            comando = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'runserver', '--noreload', endereco]
+        else:
+            comando = [sys.executable, '-m', 'uvicorn', 'lai_cmg.asgi:application',
+                       '--host', self.host, '--port', str(self.porta)]
+        servidor = subprocess.Popen(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite:
+            if servidor.poll() is not None:
+                raise CommandError(f"O servidor {tipo} terminou ao iniciar: {' '.join(comando)}")
+            try:
+                socket.create_connection((self.host, self.porta), timeout=0.5).close()
+                return servidor
+            except OSError:
+                time.sleep(0.2)
+        servidor.terminate()
+        raise CommandError(f"O servidor {tipo} não respondeu em {endereco}.")
+
+    async def carga(self, taxas, duracao, concorrencia):
+        self.semaforo = asyncio.Semaphore(concorrencia)
+        self.fim = time.monotonic() + duracao
+        tarefas = set()
+        geradores = [asyncio.create_task(self.chegadas(etapa, taxa, tarefas))
+                     for etapa, taxa in taxas.items() if taxa > 0]
+        await asyncio.gather(*geradores)
+        if tarefas:
+            await asyncio.wait(tarefas)
+        # Fecha a conexão da thread usada pelas consultas feitas com sync_to_async
+        await sync_to_async(connections.close_all)()
+
+    async def chegadas(self, etapa, taxa, tarefas):
+        # Processo de Poisson: intervalos exponenciais entre as chegadas
+        acao = getattr(self, 'acao_' + etapa)
+        while True:
+            await asyncio.sleep(self.aleatorio.expovariate(taxa))
+            if time.monotonic() >= self.fim:
+                return
+            tarefa = asyncio.create_task(self.executar(etapa, acao))
+            tarefas.add(tarefa)
+            tarefa.add_done_callback(tarefas.discard)
+
+    async def executar(self, etapa, acao):
+        async with self.semaforo:
+            inicio = time.perf_counter()
+            try:
+                desfecho = await acao()
+            except Exception as erro:
+                desfecho = 'erro'
+                self.resultados[etapa]['excecao:' + type(erro).__name__] += 1
+            self.resultados[etapa][desfecho] += 1
+            if desfecho == 'sucesso':
+                self.latencias[etapa].append(time.perf_counter() - inicio)
+
+    def classificar(self, resposta):
+        if resposta.status == 302:
+            return 'sucesso'
+        if resposta.status == 403:
+            # O pedido mudou de situação entre a fila e o formulário
+            return 'conflito'
+        if resposta.status == 200:
+            return 'conflito' if CONFLITO in resposta.texto else 'invalido'
+        return 'erro'
+
+    async def ator(self, usuario):
+        sessao = await sync_to_async(self.sessao)(usuario)
+        return Ator(self.host, self.porta, sessao)
+
+    async def escolher_da_fila(self, ator, rota_fila, rota_formulario):
+        pagina = await ator.get(reverse(rota_fila))
+        if pagina.status != 200:
+            return None, pagina
+        prefixo = re.escape(reverse(rota_formulario, args=[0])[:-2])
+        pks = re.findall(prefixo + r'(\d+)/', pagina.texto)
+        if not pks:
+            return None, pagina
+        return int(self.aleatorio.choice(pks[:self.topo_fila])), pagina
+
+    async def etapa_de_fila(self, rota_fila, rota_formulario, usuario, campos, arquivo=None):
+        ator = await self.ator(usuario)
+        pk, pagina = await self.escolher_da_fila(ator, rota_fila, rota_formulario)
+        if pk is None:
+            return 'fila_vazia' if pagina.status == 200 else 'erro'
+        caminho = reverse(rota_formulario, args=[pk])
+        formulario = await ator.get(caminho)
+        if formulario.status != 200:
+            return self.classificar(formulario)
+        if callable(campos):
+            campos = campos(formulario)
+        return self.classificar(await ator.enviar_formulario(caminho, formulario, campos, arquivo))
+
+    async def acao_requerer(self):
+        ator = await self.ator(self.aleatorio.choice(self.cidadaos))
+        caminho = reverse('req_info')
+        formulario = await ator.get(caminho)
+        if formulario.status != 200:
+            return 'erro'
+        resposta = await ator.enviar_formulario(caminho, formulario, {
+            'titulo': "Pedido de carga", 'descricao': "Solicito informações sobre contratos vigentes."})
+        return self.classificar(resposta)
+
+    async def acao_analisar(self):
+        def campos(formulario):
+            opcoes = [valor for valor in re.findall(r'<option value="(\d+)"', formulario.texto)]
+            return {'setor_info': self.aleatorio.choice(opcoes or [str(s) for s in self.setores])}
+        return await self.etapa_de_fila('ped_infos_analise', 'analisar_ped_info',
+                                        self.funcionarios['setor_adm'], campos)
+
+    async def acao_fornecer(self):
+        setor_id = self.aleatorio.choice(self.setores)
+        return await self.etapa_de_fila('ped_infos_fornecimento', 'fornecer_ped_info',
+                                        self.fornecedores[setor_id],
+                                        {'observacoes_forn': "Documentos anexados."},
+                                        ('arquivo_info', 'informacao.pdf', b"%PDF-1.4\n" + b"0" * 2048))
+
+    async def acao_parecer(self):
+        return await self.etapa_de_fila('ped_infos_parecer', 'parecer_ped_info',
+                                        self.funcionarios['setor_parecer'], {'parecer': "Sem óbice legal."})
+
+    async def acao_responder(self):
+        return await self.etapa_de_fila('ped_infos_resposta', 'resposta_ped_info',
+                                        self.funcionarios['setor_resposta'],
+                                        {'resp_inicial': 'on', 'just_resp_inicial': "Deferido."})
+
+    async def acao_responder_recurso_1(self):
+        return await self.etapa_de_fila('ped_infos_resp_rec_1', 'resposta_rec_1',
+                                        self.funcionarios['setor_recurso_1'],
+                                        {'just_resp_recurso_1': "Recurso indeferido."})
+
+    async def acao_responder_recurso_2(self):
+        return await self.etapa_de_fila('ped_infos_resp_rec_2', 'resposta_rec_2',
+                                        self.funcionarios['setor_recurso_2'],
+                                        {'just_resp_recurso_2': "Recurso indeferido."})
+
+    async def recurso(self, situacao, rota, campo):
+        # O requerente abre os detalhes do pedido e, se ainda estiver no prazo, recorre
+        ped_info = await sync_to_async(self.pedido_para_recurso)(situacao)
+        if ped_info is None:
+            return 'fila_vazia'
+        ator = await self.ator(ped_info.requerente.credenciais)
+        detalhes = await ator.get(reverse('detalhes_ped_info', args=[ped_info.pk]))
+        caminho = reverse(rota, args=[ped_info.pk])
+        if detalhes.status != 200:
+            return self.classificar(detalhes)
+        if caminho not in detalhes.texto:
+            return 'fora_do_prazo'
+        formulario = await ator.get(caminho)
+        if formulario.status != 200:
+            return self.classificar(formulario)
+        return self.classificar(await ator.enviar_formulario(
+            caminho, formulario, {campo: "As informações fornecidas estão incompletas."}))
+
+    def pedido_para_recurso(self, situacao):
+        # Primeiro pedido na situação a partir de uma chave sorteada, voltando ao
+        # início da tabela se não houver nenhum depois dela; cada busca percorre
+        # o índice da chave primária só até o primeiro pedido que serve
+        pedidos = (PedidoInformacao.objects.filter(situacao=situacao, requerente__credenciais__isnull=False)
+                   .select_related('requerente__credenciais'))
+        sorteada = self.aleatorio.randint(*self.faixa_pedidos)
+        return (pedidos.filter(pk__gte=sorteada).order_by('pk').first() or
+                pedidos.filter(pk__lt=sorteada).order_by('-pk').first())
+
+    async def acao_recurso_1(self):
+        return await self.recurso('PR', 'recurso1_ped_info', 'recurso_1')
+
+    async def acao_recurso_2(self):
+        return await self.recurso('RR', 'recurso2_ped_info', 'recurso_2')
+
+    def relatorio(self, duracao, esperas):
+        etapas = {}
+        self.stdout.write(f"\n{'etapa':22}{'tentativas':>11}{'sucesso':>9}{'vazão/s':>9}{'conflito':>9}"
+                          f"{'erro %':>8}{'p50 ms':>9}{'p95 ms':>9}{'bloqueio s':>12}")
+        for nome, *_ in ETAPAS:
+            contagem = self.resultados.get(nome, {})
+            tentativas = sum(valor for chave, valor in contagem.items() if not chave.startswith('excecao:'))
+            latencias = sorted(self.latencias.get(nome, []))
+            espera = esperas.get(nome, {'amostras': 0, 'espera_estimada_s': 0})
+            etapas[nome] = {
+                'tentativas': tentativas,
+                'desfechos': dict(contagem),
+                'vazao_por_s': round(contagem.get('sucesso', 0) / duracao, 3),
+                'taxa_erro': round(contagem.get('erro', 0) / tentativas, 4) if tentativas else 0,
+                'p50_ms': round(statistics.median(latencias) * 1000, 1) if latencias else None,
+                'p95_ms': round(latencias[round(0.95 * (len(latencias) - 1))] * 1000, 1) if latencias else None,
+                'bloqueios': espera,
+            }
+            dados = etapas[nome]
+            self.stdout.write(
+                f"{nome:22}{tentativas:>11}{contagem.get('sucesso', 0):>9}{dados['vazao_por_s']:>9.2f}"
+                f"{contagem.get('conflito', 0):>9}{dados['taxa_erro'] * 100:>8.1f}"
+                f"{dados['p50_ms'] or 0:>9.1f}{dados['p95_ms'] or 0:>9.1f}{espera['espera_estimada_s']:>12.2f}")
+        return {'duracao_s': round(duracao, 2), 'etapas': etapas,
+                'bloqueios_outros': esperas.get('outras')}
@@ -0,0 +1,231 @@
+import random
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils.timezone import get_current_timezone, now
+
+from lai_app.models import (Cargo, Cidadao, Configuracao, ContagemPedidos, Funcionario, Numerador,
+                            PedidoInformacao, Setor, normalizar)
+from lai_app.calendario import PRAZOS
+
+PRENOMES = ("Ana", "Antônio", "Beatriz", "Carlos", "Cecília", "Daniel", "Eduarda", "Felipe",
+            "Gabriela", "Heitor", "Helena", "Igor", "Joana", "José", "Júlia", "Lucas", "Luíza",
+            "Marcos", "Maria", "Mateus", "Natália", "Otávio", "Paula", "Rafael", "Sofia", "Tiago",
+            "Valéria", "Vinícius")
+SOBRENOMES = ("Almeida", "Araújo", "Barbosa", "Cardoso", "Carvalho", "Castro", "Costa", "Dias",
+              "Fernandes", "Ferreira", "Gomes", "Lima", "Martins", "Melo", "Oliveira", "Pereira",
+              "Ribeiro", "Rocha", "Santos", "Silva", "Souza", "Teixeira", "Conceição", "Simões")
+CIDADES = (("Campinas", "SP"), ("Belo Horizonte", "MG"), ("Curitiba", "PR"), ("Recife", "PE"),
+           ("Salvador", "BA"), ("Porto Alegre", "RS"), ("Goiânia", "GO"), ("Belém", "PA"))
+BAIRROS = ("Centro", "Jardim América", "Vila Nova", "São José", "Boa Vista", "Santa Rita")
+ASSUNTOS = ("contratos de limpeza urbana", "licitação de merenda escolar", "obras de pavimentação",
+            "despesas com diárias", "remuneração de servidores", "convênios com entidades",
+            "gastos com publicidade", "frota de veículos oficiais", "atendimento nas unidades de saúde",
+            "transporte escolar", "iluminação pública", "coleta seletiva de resíduos")
+PEDIDOS = ("Solicito cópia integral dos documentos referentes a {assunto} do exercício de {ano}.",
+           "Requeiro informações sobre os valores pagos em {assunto} no ano de {ano}.",
+           "Gostaria de saber quais empresas participaram de {assunto} em {ano} e os valores contratados.",
+           "Peço a relação de processos administrativos relativos a {assunto}, com datas e responsáveis.")
+SETORES = (("ADM", "Protocolo e Atendimento"), ("JUR", "Procuradoria Jurídica"),
+           ("GAB", "Gabinete da Presidência"), ("CI", "Controladoria Interna"),
+           ("MESA", "Mesa Diretora"))
+CARGOS = ("Analista Legislativo", "Assistente Administrativo", "Procurador", "Assessor", "Técnico")
+
+# Pedidos abertos há mais tempo que isso são, em sua maioria, pedidos já encerrados
+DIAS_EM_ANDAMENTO = 90
+ENCERRADOS = (('PR', 6), ('RR', 2), ('RF', 2))
+
+
+class Command(BaseCommand):
+    help = ("Gera dados sintéticos reprodutíveis (mesma semente, mesmos dados) para testes de "
+            "desempenho: setores, funcionários, cidadãos e pedidos em todas as situações e anos.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--setores', type=int, default=40)
+        parser.add_argument('--funcionarios', type=int, default=500)
+        parser.add_argument('--cidadaos', type=int, default=100_000)
+        parser.add_argument('--pedidos', type=int, default=2_000_000)
+        parser.add_argument('--anos', type=int, default=6,
+                            help="Quantidade de exercícios, terminando no atual (padrão: 6)")
+        parser.add_argument('--semente', type=int, default=2024)
+        parser.add_argument('--lote', type=int, default=5000,
+                            help="Linhas por bulk_create (padrão: 5000)")
+
+    def handle(self, *args, **options):
+        self.aleatorio = random.Random(options['semente'])
+        self.lote = options['lote']
+        self.prefixo = f"s{options['semente']}"
+
+        with transaction.atomic():
+            setores = self.gerar_setores(max(options['setores'], len(SETORES) + 1))
+            funcionarios = self.gerar_funcionarios(setores, max(options['funcionarios'], len(setores)))
+        cidadaos = self.gerar_cidadaos(options['cidadaos'])
+        self.gerar_pedidos(options['pedidos'], options['anos'], cidadaos, setores, funcionarios)
+        # bulk_create não passa por save(): as contagens são refeitas ao final
+        ContagemPedidos.reconciliar()
+        self.informar("contagens reconciliadas")
+
+    def informar(self, mensagem):
+        self.stdout.write(mensagem)
+        self.stdout.flush()
+
+    def gerar_setores(self, quantidade):
+        setores = [Setor(nome=nome, sigla=sigla) for sigla, nome in SETORES]
+        setores += [Setor(nome=f"Departamento {i}", sigla=f"D{i:02d}")
+                    for i in range(1, quantidade - len(SETORES) + 1)]
+        setores = Setor.objects.bulk_create(setores)
+
+        configuracao = Configuracao.load()
+        if configuracao.setor_adm_id is None:
+            adm, jur, gab, ci, mesa = setores[:len(SETORES)]
+            Configuracao(pk=configuracao.pk, setor_adm=adm, setor_parecer=jur, setor_resposta=gab,
+                         setor_recurso_1=ci, setor_recurso_2=mesa).save()
+        self.informar(f"{len(setores)} setores")
+        return setores
+
+    def gerar_funcionarios(self, setores, quantidade):
+        cargos = Cargo.objects.bulk_create(Cargo(nome=nome) for nome in CARGOS)
+        usuarios = User.objects.bulk_create(
+            User(username=f"{self.prefixo}_func{i}", password='!') for i in range(quantidade))
+        # Ao menos um funcionário por setor; o restante é distribuído ao acaso
+        funcionarios = Funcionario.objects.bulk_create(
+            Funcionario(nome=self.nome(), matricula=f"{self.prefixo}{i}",
+                        cargo=self.aleatorio.choice(cargos),
+                        lotacao=setores[i] if i < len(setores) else self.aleatorio.choice(setores),
+                        credenciais=usuario)
+            for i, usuario in enumerate(usuarios))
+        self.informar(f"{len(funcionarios)} funcionários")
+        return funcionarios
+
+    def gerar_cidadaos(self, quantidade):
+        ids = []
+        for inicio in range(0, quantidade, self.lote):
+            fim = min(inicio + self.lote, quantidade)
+            with transaction.atomic():
+                usuarios = User.objects.bulk_create(
+                    User(username=f"{self.prefixo}_cid{i}", password='!') for i in range(inicio, fim))
+                cidadaos = []
+                for i, usuario in enumerate(usuarios, start=inicio):
+                    nome = self.nome()
+                    cidade, estado = self.aleatorio.choice(CIDADES)
+                    cidadaos.append(Cidadao(
+                        nome=nome, nome_busca=normalizar(nome), num_doc_id=f"{i:011d}",
+                        cep=f"{self.aleatorio.randrange(10**8):08d}", logradouro=f"Rua {self.nome()}",
+                        numero=str(self.aleatorio.randint(1, 3000)), bairro=self.aleatorio.choice(BAIRROS),
+                        cidade=cidade, estado=estado, credenciais=usuario))
+                ids += [cidadao.pk for cidadao in Cidadao.objects.bulk_create(cidadaos)]
+            self.informar(f"{fim}/{quantidade} cidadãos")
+        return ids
+
+    def gerar_pedidos(self, quantidade, anos, cidadaos, setores, funcionarios):
+        agora = now()
+        fuso = get_current_timezone()
+        exercicios = list(range(agora.year - anos + 1, agora.year + 1))
+        por_setor = {}
+        for funcionario in funcionarios:
+            por_setor.setdefault(funcionario.lotacao_id, []).append(funcionario)
+        configuracao = Configuracao.load()
+        papeis = {}
+        for nome in ('setor_adm', 'setor_parecer', 'setor_resposta', 'setor_recurso_1', 'setor_recurso_2'):
+            # Com uma configuração pré-existente, usa os funcionários já lotados nela
+            setor_id = getattr(configuracao, nome + '_id')
+            papeis[nome] = por_setor.get(setor_id) or list(Funcionario.objects.filter(lotacao_id=setor_id))
+            if not papeis[nome]:
+                raise CommandError(f"Nenhum funcionário lotado no setor configurado em {nome}.")
+
+        gerados = 0
+        for posicao, exercicio in enumerate(exercicios):
+            # Divide os pedidos igualmente entre os exercícios
+            total = quantidade * (posicao + 1) // len(exercicios) - quantidade * posicao // len(exercicios)
+            inicio_ano = datetime(exercicio, 1, 1, tzinfo=fuso)
+            segundos = int((min(datetime(exercicio + 1, 1, 1, tzinfo=fuso), agora) - inicio_ano).total_seconds())
+            datas = sorted(inicio_ano + timedelta(seconds=self.aleatorio.randrange(segundos))
+                           for _ in range(total))
+            proximo = (Numerador.objects.filter(exercicio_num=exercicio)
+                       .values_list('ultimo_num', flat=True).first() or 0) + 1
+            proximo = max(proximo, (PedidoInformacao.objects.filter(ano=exercicio)
+                                    .aggregate(maior=Max('num_registro'))['maior'] or 0) + 1)
+
+            for inicio in range(0, total, self.lote):
+                lote = datas[inicio:inicio + self.lote]
+                pedidos = [self.pedido(proximo + i, exercicio, data, agora, cidadaos, setores, por_setor, papeis)
+                           for i, data in enumerate(lote, start=inicio)]
+                with transaction.atomic():
+                    PedidoInformacao.objects.bulk_create(pedidos)
+                    # O auto_now_add de data_pedido vale no bulk_create; as datas
+                    # sorteadas são regravadas em seguida, na mesma transação
+                    for pedido, data in zip(pedidos, lote):
+                        pedido.data_pedido = data
+                    PedidoInformacao.objects.bulk_update(pedidos, ['data_pedido'], batch_size=1000)
+                gerados += len(pedidos)
+                self.informar(f"{gerados}/{quantidade} pedidos")
+
+            # A numeração segue a partir do último número gerado
+            if total:
+                numerador = Numerador.preparar_exercicio(exercicio)
+                Numerador.objects.filter(pk=numerador.pk).update(ultimo_num=proximo + total - 1)
+
+    def pedido(self, num_registro, exercicio, data, agora, cidadaos, setores, por_setor, papeis):
+        aleatorio = self.aleatorio
+        if (agora - data).days > DIAS_EM_ANDAMENTO:
+            situacoes, pesos = zip(*ENCERRADOS)
+            situacao = aleatorio.choices(situacoes, pesos)[0]
+        else:
+            situacao = aleatorio.choice(list(PedidoInformacao.SITUACOES))
+        etapa = list(PedidoInformacao.SITUACOES).index(situacao)
+        assunto = aleatorio.choice(ASSUNTOS)
+
+        pedido = PedidoInformacao(
+            situacao=situacao, num_registro=num_registro, ano=exercicio, data_pedido=data,
+            titulo=f"Informações sobre {assunto}"[:100],
+            descricao=aleatorio.choice(PEDIDOS).format(assunto=assunto, ano=exercicio - aleatorio.randint(0, 3)),
+            requerente_id=aleatorio.choice(cidadaos))
+
+        # Preenche as etapas já percorridas, com datas crescentes a partir do pedido
+        datas = iter(sorted(data + timedelta(seconds=aleatorio.randrange(max(int((agora - data).total_seconds()), 1)))
+                            for _ in range(etapa)))
+        if etapa >= 1:
+            setor_info = aleatorio.choice(setores)
+            pedido.setor_info = setor_info
+            pedido.func_adm = aleatorio.choice(papeis['setor_adm'])
+            pedido.data_encam = next(datas)
+        if etapa >= 2:
+            pedido.func_fornec = aleatorio.choice(por_setor[setor_info.pk])
+            pedido.arquivo_info = f"documentos/{exercicio}/{num_registro}.pdf"
+            pedido.observacoes_forn = "Documentos localizados no arquivo do setor."
+            pedido.data_fornec = next(datas)
+        if etapa >= 3:
+            pedido.parecer = f"Não há óbice legal ao fornecimento das informações sobre {assunto}."
+            pedido.func_parecer = aleatorio.choice(papeis['setor_parecer'])
+            pedido.data_parecer = next(datas)
+        if etapa >= 4:
+            pedido.resp_inicial = aleatorio.random() < 0.8
+            pedido.just_resp_inicial = "Informações fornecidas conforme o parecer."
+            pedido.func_resp_inicial = aleatorio.choice(papeis['setor_resposta'])
+            pedido.data_resp_inicial = next(datas)
+        if etapa >= 5:
+            pedido.recurso_1 = "As informações fornecidas estão incompletas."
+            pedido.data_recurso_1 = next(datas)
+        if etapa >= 6:
+            pedido.resp_recurso_1 = aleatorio.random() < 0.5
+            pedido.just_resp_recurso_1 = "Recurso analisado pela controladoria."
+            pedido.func_resp_recurso_1 = aleatorio.choice(papeis['setor_recurso_1'])
+            pedido.data_resp_recurso_1 = next(datas)
+        if etapa >= 7:
+            pedido.recurso_2 = "Persistem as omissões apontadas no primeiro recurso."
+            pedido.data_recurso_2 = next(datas)
+        if etapa >= 8:
+            pedido.resp_recurso_2 = aleatorio.random() < 0.5
+            pedido.just_resp_recurso_2 = "Decisão final da mesa diretora."
+            pedido.func_resp_recurso_2 = aleatorio.choice(papeis['setor_recurso_2'])
+            pedido.data_resp_recurso_2 = next(datas)
+        for prazo in PRAZOS.values():
+            setattr(pedido, prazo.campo, prazo.calcular(pedido))
+        return pedido
+
+    def nome(self):
+        return (f"{self.aleatorio.choice(PRENOMES)} {self.aleatorio.choice(SOBRENOMES)} "
+                f"{self.aleatorio.choice(SOBRENOMES)}")
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lai_app.calendario import PRAZOS, calendario_para, expressao_prazo
+from lai_app.models import PedidoInformacao
+
+
+class Command(BaseCommand):
+    help = ("Preenche os prazos ainda não gravados nos pedidos (resposta e recursos), contados "
+            "em dias úteis da data do ato. Atualiza em lotes curtos, percorrendo a chave primária, "
+            "para não manter muitas linhas bloqueadas de uma vez.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000)
+        parser.add_argument('--simular', action='store_true',
+                            help="Apenas conta os pedidos que seriam atualizados")
+
+    def handle(self, *args, **options):
+        for prazo in PRAZOS.values():
+            pendentes = PedidoInformacao.objects.filter(prazo.filtro(), **{f'{prazo.campo}__isnull': True})
+
+            if options['simular']:
+                self.stdout.write(f"{prazo.campo}: {pendentes.count()} pedido(s) sem prazo")
+                continue
+
+            calendario = calendario_para(pendentes, prazo)
+            if calendario is None:
+                self.stdout.write(f"{prazo.campo}: nenhum pedido sem prazo")
+                continue
+            expressao = expressao_prazo(prazo, calendario)
+
+            total = 0
+            ultimo = 0
+            while True:
+                chaves = list(pendentes.filter(pk__gt=ultimo).order_by('pk')
+                              .values_list('pk', flat=True)[:options['lote']])
+                if not chaves:
+                    break
+                with transaction.atomic():
+                    total += pendentes.filter(pk__in=chaves).update(**{prazo.campo: expressao})
+                ultimo = chaves[-1]
+
+            self.stdout.write(self.style.SUCCESS(f"{prazo.campo}: {total} pedido(s) atualizado(s)"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.utils.timezone import localdate
+
+from lai_app.models import Numerador
+
+
+class Command(BaseCommand):
+    help = ("Cria antecipadamente o contador de numeração de um exercício. "
+            "Agende para antes da virada do ano, evitando que o primeiro pedido do ano crie a linha.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercicio', type=int, default=localdate().year + 1,
+                            help="Exercício a preparar (padrão: o próximo ano)")
+
+    def handle(self, *args, **options):
+        numerador = Numerador.preparar_exercicio(options['exercicio'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Exercício {numerador.exercicio_num} preparado (último número: {numerador.ultimo_num})."))
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from lai_app.dados_abertos import publicar
+
+
+class Command(BaseCommand):
+    help = ("Publica os pedidos de informação como dados abertos: um arquivo JSONL comprimido por ano, "
+            "sem os dados pessoais dos requerentes, e um manifesto. Com --incremental, grava apenas os "
+            "pedidos incluídos ou movimentados desde a última publicação; exclusões só aparecem na "
+            "publicação completa seguinte. Exige DADOS_ABERTOS_SEGREDO.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--diretorio', default=settings.DADOS_ABERTOS_DIRETORIO,
+                            help="Diretório de publicação (padrão: DADOS_ABERTOS_DIRETORIO)")
+        parser.add_argument('--incremental', action='store_true',
+                            help="Grava só as alterações desde a marca do manifesto; "
+                                 "sem manifesto, faz a publicação completa")
+
+    def handle(self, *args, **options):
+        try:
+            gerados = publicar(str(options['diretorio']), incremental=options['incremental'])
+        except ImproperlyConfigured as erro:
+            raise CommandError(str(erro))
+        for arquivo in gerados:
+            self.stdout.write(f"{arquivo['arquivo']}: {arquivo['linhas']} pedido(s)")
+        self.stdout.write(self.style.SUCCESS(f"{len(gerados)} arquivo(s) publicado(s)."))
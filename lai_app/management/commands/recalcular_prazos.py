@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from lai_app.calendario import recalcular_prazos
+
+
+class Command(BaseCommand):
+    help = ("Recalcula, com um único UPDATE por prazo, os prazos de resposta e de recurso que ainda correm "
+            "segundo o calendário de feriados atual. Execute após carregar feriados fora do admin.")
+
+    def handle(self, *args, **options):
+        for prazo, total in recalcular_prazos().items():
+            self.stdout.write(self.style.SUCCESS(f"{prazo}: {total} pedido(s) recalculado(s)"))
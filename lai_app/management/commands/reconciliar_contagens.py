@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from lai_app.models import ContagemPedidos, PedidoInformacao
+
+
+class Command(BaseCommand):
+    help = ("Recalcula as contagens de pedidos por situação e setor a partir da tabela de pedidos, "
+            "corrigindo divergências. Agende periodicamente (ex.: a cada hora).")
+
+    def handle(self, *args, **options):
+        divergencias = ContagemPedidos.reconciliar()
+        for (situacao, setor_id), (anterior, atual) in sorted(divergencias.items(), key=str):
+            self.stdout.write(f"{PedidoInformacao.SITUACOES[situacao]} / setor {setor_id or '-'}: "
+                              f"{anterior} -> {atual}")
+        self.stdout.write(self.style.SUCCESS(f"{len(divergencias)} contagem(ns) corrigida(s)."))
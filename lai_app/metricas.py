@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.urls import URLPattern, get_resolver
+from django.utils.timezone import now
+
+# Limites (em segundos) dos baldes do histograma de latência por rota
+BALDES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Os contadores de cada processo vão para o cache compartilhado em lotes,
+# no máximo a cada INTERVALO_ENVIO segundos
+INTERVALO_ENVIO = 10
+
+# Idade máxima dos agregados do banco (filas, prazos, numerador) antes de um
+# recálculo em segundo plano
+INTERVALO_AGREGADOS = 60
+
+PREFIXO = 'metricas:'
+CHAVE_AGREGADOS = PREFIXO + 'agregados'
+CHAVE_ATUALIZANDO = PREFIXO + 'atualizando'
+
+# Requisições que não casam com nenhuma rota nomeada do projeto
+OUTRAS = 'outras'
+
+
+def rotas():
+    # Rotas nomeadas do URLconf do projeto (sem as incluídas, como o admin)
+    return [padrao.name for padrao in get_resolver().url_patterns
+            if isinstance(padrao, URLPattern) and padrao.name] + [OUTRAS]
+
+
+class AcumuladorMetricas:
+    # Contadores inteiros do processo (durações em microssegundos), somados sob
+    # uma trava e enviados ao cache com incr para valerem entre processos
+
+    def __init__(self):
+        self.trava = threading.Lock()
+        self.pendentes = Counter()
+        self.ultimo_envio = time.monotonic()
+
+    def somar(self, chave, valor=1):
+        with self.trava:
+            self.pendentes[chave] += valor
+        self.enviar()
+
+    def observar_latencia(self, rota, duracao):
+        with self.trava:
+            for limite in BALDES:
+                if duracao <= limite:
+                    self.pendentes[f'latencia:{rota}:{limite}'] += 1
+            self.pendentes[f'latencia:{rota}:soma'] += int(duracao * 1_000_000)
+            self.pendentes[f'latencia:{rota}:total'] += 1
+        self.enviar()
+
+    def enviar(self, forcar=False):
+        if not forcar and time.monotonic() - self.ultimo_envio < INTERVALO_ENVIO:
+            return
+        with self.trava:
+            pendentes, self.pendentes = self.pendentes, Counter()
+            self.ultimo_envio = time.monotonic()
+        for chave, valor in pendentes.items():
+            chave = PREFIXO + chave
+            # add só grava se a chave não existir; senão incrementa
+            if not cache.add(chave, valor, timeout=None):
+                try:
+                    cache.incr(chave, valor)
+                except ValueError:
+                    cache.add(chave, valor, timeout=None)
+
+
+acumulador = AcumuladorMetricas()
+
+
+def registrar_upload(tamanho):
+    acumulador.somar('uploads:bytes', tamanho)
+    acumulador.somar('uploads:total')
+
+
+def calcular_agregados():
+    from .models import ContagemPedidos, Numerador, PedidoInformacao
+
+    agora = now()
+    # Pedidos por situação vêm das contagens mantidas nas transições, sem varrer
+    # a tabela de pedidos
+    situacoes = dict(ContagemPedidos.objects.order_by().values_list('situacao')
+                     .annotate(total=Sum('total')))
+    # Janelas de recurso abertas: cada contagem percorre só o índice parcial da situação
+    prazos = {
+        'recurso_1': PedidoInformacao.objects.filter(situacao='PR', prazo_recurso_1__gte=agora).count(),
+        'recurso_2': PedidoInformacao.objects.filter(situacao='RR', prazo_recurso_2__gte=agora).count(),
+    }
+    numeradores = dict(Numerador.objects.values_list('exercicio_num', 'ultimo_num'))
+    return {
+        'gerado_em': time.time(),
+        'situacoes': {situacao: situacoes.get(situacao, 0) for situacao in PedidoInformacao.SITUACOES},
+        'prazos_recurso_abertos': prazos,
+        'numeradores': numeradores,
+    }
+
+
+def atualizar_agregados():
+    agregados = calcular_agregados()
+    cache.set(CHAVE_AGREGADOS, agregados, timeout=None)
+    return agregados
+
+
+def _atualizar_em_segundo_plano():
+    try:
+        atualizar_agregados()
+    finally:
+        cache.delete(CHAVE_ATUALIZANDO)
+        connection.close()
+
+
+def agregados():
+    # Devolve os agregados em cache; se estiverem velhos (ou ausentes), dispara
+    # um único recálculo em segundo plano e responde com o que houver
+    atuais = cache.get(CHAVE_AGREGADOS)
+    velho = atuais is None or time.time() - atuais['gerado_em'] > INTERVALO_AGREGADOS
+    if velho and cache.add(CHAVE_ATUALIZANDO, True, timeout=INTERVALO_AGREGADOS):
+        threading.Thread(target=_atualizar_em_segundo_plano, daemon=True).start()
+    return atuais
+
+
+def texto_prometheus():
+    # Exposição no formato texto do Prometheus (version 0.0.4)
+    acumulador.enviar(forcar=True)
+    nomes_rotas = rotas()
+    chaves = [f'latencia:{rota}:{sufixo}' for rota in nomes_rotas
+              for sufixo in (*BALDES, 'soma', 'total')]
+    chaves += ['uploads:bytes', 'uploads:total']
+    valores = cache.get_many([PREFIXO + chave for chave in chaves])
+
+    def valor(chave):
+        return valores.get(PREFIXO + chave, 0)
+
+    linhas = [
+        '# HELP lai_requisicao_segundos Latência das requisições por rota.',
+        '# TYPE lai_requisicao_segundos histogram',
+    ]
+    for rota in nomes_rotas:
+        total = valor(f'latencia:{rota}:total')
+        if not total:
+            continue
+        for limite in BALDES:
+            linhas.append(f'lai_requisicao_segundos_bucket{{rota="{rota}",le="{limite}"}} '
+                          f'{valor(f"latencia:{rota}:{limite}")}')
+        linhas.append(f'lai_requisicao_segundos_bucket{{rota="{rota}",le="+Inf"}} {total}')
+        linhas.append(f'lai_requisicao_segundos_sum{{rota="{rota}"}} '
+                      f'{valor(f"latencia:{rota}:soma") / 1_000_000}')
+        linhas.append(f'lai_requisicao_segundos_count{{rota="{rota}"}} {total}')
+
+    linhas += [
+        '# HELP lai_upload_bytes_total Bytes recebidos em arquivos de fornecimento de informação.',
+        '# TYPE lai_upload_bytes_total counter',
+        f'lai_upload_bytes_total {valor("uploads:bytes")}',
+        '# HELP lai_uploads_total Arquivos de fornecimento de informação recebidos.',
+        '# TYPE lai_uploads_total counter',
+        f'lai_uploads_total {valor("uploads:total")}',
+    ]
+
+    dados = agregados()
+    if dados is not None:
+        linhas += [
+            '# HELP lai_pedidos Pedidos de informação por situação.',
+            '# TYPE lai_pedidos gauge',
+        ]
+        linhas += [f'lai_pedidos{{situacao="{situacao}"}} {total}'
+                   for situacao, total in dados['situacoes'].items()]
+        linhas += [
+            '# HELP lai_prazos_recurso_abertos Pedidos com prazo de recurso ainda aberto.',
+            '# TYPE lai_prazos_recurso_abertos gauge',
+            f'lai_prazos_recurso_abertos{{instancia="1"}} {dados["prazos_recurso_abertos"]["recurso_1"]}',
+            f'lai_prazos_recurso_abertos{{instancia="2"}} {dados["prazos_recurso_abertos"]["recurso_2"]}',
+            '# HELP lai_protocolos_numerados_total Números de protocolo alocados no exercício.',
+            '# TYPE lai_protocolos_numerados_total counter',
+        ]
+        linhas += [f'lai_protocolos_numerados_total{{exercicio="{exercicio}"}} {ultimo}'
+                   for exercicio, ultimo in sorted(dados['numeradores'].items())]
+        linhas += [
+            '# HELP lai_agregados_idade_segundos Idade dos agregados de filas e prazos.',
+            '# TYPE lai_agregados_idade_segundos gauge',
+            f'lai_agregados_idade_segundos {time.time() - dados["gerado_em"]:.1f}',
+        ]
+
+    return '\n'.join(linhas) + '\n'
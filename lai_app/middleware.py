@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.functional import SimpleLazyObject
+
+from . import metricas
+from .papeis import resolver_papeis
+from .perfil import PerfilRequisicao
+
+logger = logging.getLogger('lai_app.consultas')
+logger_lentas = logging.getLogger('lai_app.consultas_lentas')
+
+DIRETORIO_PROJETO = str(settings.BASE_DIR) + os.sep
+
+
+class PapeisMiddleware:
+    # Resolve uma única vez por requisição os papéis do usuário autenticado.
+    # Deve vir depois de AuthenticationMiddleware.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.papeis = SimpleLazyObject(lambda: resolver_papeis(request.user))
+        return self.get_response(request)
+
+
+class DetectorN1Middleware:
+    # Agrupa o SQL executado em cada requisição pelo comando normalizado e registra
+    # como suspeitos de N+1 os comandos repetidos, indicando o template e o código
+    # que os dispararam. Só é ativado com DETECTOR_N1 = True nas configurações.
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DETECTOR_N1', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.limite = getattr(settings, 'DETECTOR_N1_LIMITE', 2)
+
+    def __call__(self, request):
+        registro = RegistroConsultas()
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(registro))
+            response = self.get_response(request)
+
+        view = request.resolver_match.view_name if request.resolver_match else '-'
+        for sql, execucoes in registro.repetidos(self.limite):
+            logger.warning("Possível N+1 em %s (%s): %d execuções de %s\n%s",
+                           request.path, view, len(execucoes), sql,
+                           "\n".join(f"  {origem} ({vezes}x)"
+                                     for origem, vezes in Counter(execucoes).most_common()))
+        return response
+
+
+class RegistroConsultas:
+    # execute_wrapper que guarda, por comando normalizado, a origem de cada execução
+
+    def __init__(self):
+        self.consultas = defaultdict(list)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas[normalizar_sql(sql)].append(origem_consulta())
+        return execute(sql, params, many, context)
+
+    def repetidos(self, limite):
+        return [(sql, execucoes) for sql, execucoes in self.consultas.items() if len(execucoes) >= limite]
+
+
+def normalizar_sql(sql):
+    # Os parâmetros já vêm separados; resta unificar listas de IN e espaços
+    sql = re.sub(r'IN \((?:%s, )*%s\)', 'IN (...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def origem_consulta():
+    # Primeiro nó de template e primeira linha do projeto na pilha de chamadas
+    template = codigo = None
+    quadro = sys._getframe(2)
+    while quadro is not None and not (template and codigo):
+        arquivo = quadro.f_code.co_filename
+        if template is None and quadro.f_code.co_name == 'render_annotated':
+            no = quadro.f_locals.get('self')
+            origem = getattr(no, 'origin', None)
+            if origem is not None and getattr(no, 'token', None) is not None:
+                template = f"{origem.template_name}:{no.token.lineno}"
+        elif (codigo is None and arquivo.startswith(DIRETORIO_PROJETO) and arquivo != __file__
+              and 'site-packages' not in arquivo):
+            codigo = f"{os.path.relpath(arquivo, DIRETORIO_PROJETO)}:{quadro.f_lineno} em {quadro.f_code.co_name}"
+        quadro = quadro.f_back
+    return " / ".join(parte for parte in (template, codigo) if parte) or "?"
+
+
+class TempoRequisicaoMiddleware:
+    # Mede, por requisição, o número e o tempo das consultas, o tempo da view e
+    # o da renderização do template, devolvendo-os no cabeçalho Server-Timing
+    # aos usuários da equipe (ou a todos, com SERVER_TIMING).
+    # Consultas acima de CONSULTA_LENTA_MS vão para o logger lai_app.consultas_lentas.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limite = getattr(settings, 'CONSULTA_LENTA_MS', 500) / 1000
+
+    def __call__(self, request):
+        medicao = request.medicao = MedicaoRequisicao(self.limite)
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(medicao))
+            response = self.get_response(request)
+        medicao.fim = time.perf_counter()
+
+        for lenta in medicao.lentas:
+            logger_lentas.warning(json.dumps({
+                'caminho': request.path,
+                'metodo': request.method,
+                'view': nome_view(request),
+                'duracao_ms': round(lenta['duracao'] * 1000, 1),
+                'sql': lenta['sql'],
+                'parametros': lenta['parametros'],
+                'consulta': redigir_consulta(request.GET),
+            }, ensure_ascii=False, default=str))
+
+        usuario = getattr(request, 'user', None)
+        if getattr(settings, 'SERVER_TIMING', False) or (usuario is not None and usuario.is_staff):
+            response['Server-Timing'] = medicao.server_timing()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.medicao.inicio_view = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # A view já retornou; o template é renderizado logo depois deste método
+        medicao = request.medicao
+        medicao.fim_view = time.perf_counter()
+        response.add_post_render_callback(lambda response: medicao.marcar_render())
+        return response
+
+
+class MedicaoRequisicao:
+    # execute_wrapper que acumula o tempo das consultas e guarda as lentas
+
+    def __init__(self, limite):
+        self.limite = limite
+        self.inicio = time.perf_counter()
+        self.inicio_view = self.fim_view = self.fim_render = self.fim = None
+        self.consultas = 0
+        self.tempo_consultas = 0.0
+        self.lentas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.consultas += 1
+            self.tempo_consultas += duracao
+            if duracao >= self.limite:
+                self.lentas.append({'sql': sql, 'duracao': duracao,
+                                    'parametros': redigir_parametros(params, many)})
+
+    def marcar_render(self):
+        self.fim_render = time.perf_counter()
+
+    def server_timing(self):
+        metricas = [('db', self.tempo_consultas, f"{self.consultas} consultas")]
+        if self.inicio_view is not None:
+            fim_view = self.fim_view or self.fim
+            metricas.append(('view', fim_view - self.inicio_view, "View"))
+            if self.fim_view is not None and self.fim_render is not None:
+                metricas.append(('tmpl', self.fim_render - self.fim_view, "Template"))
+        metricas.append(('total', self.fim - self.inicio, "Total"))
+        return ", ".join(f'{nome};dur={duracao * 1000:.1f};desc="{descricao}"'
+                         for nome, duracao, descricao in metricas)
+
+
+# Parâmetros da URL que nunca trazem dados pessoais e podem ir para o log como estão
+PARAMETROS_SEGUROS = {'situacao', 'ordenacao', 'numero', 'ano', 'data_inicio', 'data_fim', 'cursor'}
+
+
+def redigir_valor(valor):
+    # Mantém números, datas e booleanos; textos podem ser nomes, documentos ou e-mails
+    if isinstance(valor, (str, bytes, memoryview)):
+        return f"<redigido:{len(valor)}>"
+    if isinstance(valor, (list, tuple)):
+        return [redigir_valor(item) for item in valor]
+    return valor
+
+
+def redigir_parametros(params, many):
+    if params is None:
+        return None
+    if many:
+        return f"<{len(params)} conjuntos>" if hasattr(params, '__len__') else "<vários conjuntos>"
+    if isinstance(params, dict):
+        return {chave: redigir_valor(valor) for chave, valor in params.items()}
+    return [redigir_valor(valor) for valor in params]
+
+
+def redigir_consulta(query_dict):
+    return {chave: valores if chave in PARAMETROS_SEGUROS else [redigir_valor(v) for v in valores]
+            for chave, valores in query_dict.lists()}
+
+
+def nome_view(request):
+    # Nome da classe para views baseadas em classe (ex.: ConsultaPedInfosGeral)
+    match = request.resolver_match
+    if match is None:
+        return None
+    funcao = match.func
+    return getattr(funcao, 'view_class', funcao).__name__
+
+
+class MetricasMiddleware:
+    # Alimenta o histograma de latência por rota exposto em /metrics
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rotas = set(metricas.rotas())
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        rota = match.view_name if match is not None and match.view_name in self.rotas else metricas.OUTRAS
+        metricas.acumulador.observar_latencia(rota, time.perf_counter() - inicio)
+        return response
+
+
+class PerfilMiddleware:
+    # Perfil sob demanda: um superusuário acrescenta ?perfil=1 (ou o cabeçalho
+    # X-Perfil: 1) e a requisição roda sob o cProfile e o amostrador de pilhas; o
+    # resultado vai para PERFIL_DIRETORIO e o nome volta no cabeçalho X-Perfil.
+    # Deve vir depois de AuthenticationMiddleware.
+
+    def __init__(self, get_response):
+        self.diretorio = getattr(settings, 'PERFIL_DIRETORIO', None)
+        if not self.diretorio:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.intervalo = getattr(settings, 'PERFIL_INTERVALO', 0.001)
+
+    def __call__(self, request):
+        pedido = request.GET.get('perfil') == '1' or request.headers.get('X-Perfil') == '1'
+        if not (pedido and request.user.is_superuser):
+            return self.get_response(request)
+
+        perfil = PerfilRequisicao(self.diretorio, self.intervalo)
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(perfil.consultas))
+            response = perfil.executar(lambda: self.get_response(request))
+        response['X-Perfil'] = perfil.gravar(request, nome_view(request), response)
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lai_app', '0007_pedidoinformacao_prazo_recurso_2'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='numerador',
+            name='exercicio_num',
+            field=models.PositiveSmallIntegerField(unique=True, verbose_name='exercício'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:47
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY: a tabela de pedidos continua recebendo gravações
+    # durante a construção dos índices, o que exige rodar fora de transação
+    atomic = False
+
+    dependencies = [
+        ('lai_app', '0008_alter_numerador_exercicio_num'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=models.Index(condition=models.Q(('situacao__in', ['AI', 'EP', 'DR'])), fields=['situacao', 'data_pedido'], name='ped_info_fila_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=models.Index(condition=models.Q(('situacao', 'BI')), fields=['setor_info', 'data_pedido'], name='ped_info_fornec_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=models.Index(condition=models.Q(('situacao', 'AR')), fields=['data_recurso_1'], name='ped_info_recurso_1_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=models.Index(condition=models.Q(('situacao', 'AF')), fields=['data_recurso_2'], name='ped_info_recurso_2_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=models.Index(fields=['requerente', 'data_pedido'], name='ped_info_requerente_data_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=models.Index(fields=['situacao', 'data_pedido'], name='ped_info_situacao_data_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=models.Index(fields=['data_pedido'], name='ped_info_data_idx'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+from django.db import migrations, models, transaction
+from django.db.models.functions import ExtractYear
+
+LOTE = 10000
+
+TABELA = 'lai_app_pedidoinformacao'
+
+# NOT NULL sem varrer a tabela sob bloqueio exclusivo: a restrição CHECK é criada
+# NOT VALID e validada à parte (sem bloquear as escritas); com ela validada o
+# SET NOT NULL dispensa a varredura. Cada comando roda na sua própria transação.
+ANO_NOT_NULL = [
+    f'ALTER TABLE {TABELA} ADD CONSTRAINT ped_info_ano_not_null CHECK (ano IS NOT NULL) NOT VALID',
+    f'ALTER TABLE {TABELA} VALIDATE CONSTRAINT ped_info_ano_not_null',
+    f'ALTER TABLE {TABELA} ALTER COLUMN ano SET NOT NULL',
+    f'ALTER TABLE {TABELA} DROP CONSTRAINT ped_info_ano_not_null',
+]
+
+# O índice único é construído sem bloquear as escritas e só então vira a restrição
+CRIAR_INDICE_UNICO = (f'CREATE UNIQUE INDEX CONCURRENTLY ped_info_ano_num_registro_uniq '
+                      f'ON {TABELA} (ano, num_registro)')
+REMOVER_INDICE_UNICO = 'DROP INDEX CONCURRENTLY IF EXISTS ped_info_ano_num_registro_uniq'
+
+ANEXAR_RESTRICAO = (f'ALTER TABLE {TABELA} ADD CONSTRAINT ped_info_ano_num_registro_uniq '
+                    f'UNIQUE USING INDEX ped_info_ano_num_registro_uniq')
+REMOVER_RESTRICAO = f'ALTER TABLE {TABELA} DROP CONSTRAINT ped_info_ano_num_registro_uniq'
+
+
+def preencher_ano(apps, schema_editor):
+    # Preenche o ano dos pedidos existentes em lotes por faixa de chave primária,
+    # cada lote em sua própria transação para não manter a tabela bloqueada
+    PedidoInformacao = apps.get_model('lai_app', 'PedidoInformacao')
+    ultimo = PedidoInformacao.objects.aggregate(models.Max('pk'))['pk__max'] or 0
+
+    for inicio in range(0, ultimo + 1, LOTE):
+        with transaction.atomic():
+            (PedidoInformacao.objects
+             .filter(pk__gte=inicio, pk__lt=inicio + LOTE, ano__isnull=True)
+             .update(ano=ExtractYear('data_pedido')))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('lai_app', '0009_pedidoinformacao_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedidoinformacao',
+            name='ano',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, verbose_name='Ano'),
+        ),
+        migrations.RunPython(preencher_ano, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(ANO_NOT_NULL, f'ALTER TABLE {TABELA} ALTER COLUMN ano DROP NOT NULL'),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='pedidoinformacao',
+                    name='ano',
+                    field=models.PositiveSmallIntegerField(editable=False, verbose_name='Ano'),
+                ),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='pedidoinformacao',
+            name='num_registro',
+            field=models.PositiveIntegerField(verbose_name='Número de Registro'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CRIAR_INDICE_UNICO, REMOVER_INDICE_UNICO),
+                migrations.RunSQL(ANEXAR_RESTRICAO, REMOVER_RESTRICAO),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='pedidoinformacao',
+                    constraint=models.UniqueConstraint(fields=('ano', 'num_registro'),
+                                                       name='ped_info_ano_num_registro_uniq'),
+                ),
+            ],
+        ),
+    ]
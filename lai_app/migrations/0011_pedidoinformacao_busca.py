@@ -0,0 +1,70 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently, UnaccentExtension
+from django.db import migrations, models, transaction
+
+LOTE = 10000
+
+# Mantém o vetor de busca a cada INSERT e a cada UPDATE dos campos textuais,
+# inclusive nos UPDATEs condicionais das transições (lai_app.transicoes)
+CRIAR_GATILHO = """
+CREATE FUNCTION lai_app_ped_info_busca() RETURNS trigger AS $$
+BEGIN
+    NEW.busca :=
+        setweight(to_tsvector('portuguese', unaccent(coalesce(NEW.titulo, ''))), 'A') ||
+        setweight(to_tsvector('portuguese', unaccent(coalesce(NEW.descricao, ''))), 'B') ||
+        setweight(to_tsvector('portuguese', unaccent(coalesce(NEW.parecer, ''))), 'C') ||
+        setweight(to_tsvector('portuguese', unaccent(concat_ws(' ', NEW.just_resp_inicial,
+                                                               NEW.just_resp_recurso_1,
+                                                               NEW.just_resp_recurso_2))), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER lai_app_ped_info_busca
+    BEFORE INSERT OR UPDATE OF titulo, descricao, parecer, just_resp_inicial,
+                               just_resp_recurso_1, just_resp_recurso_2
+    ON lai_app_pedidoinformacao
+    FOR EACH ROW EXECUTE FUNCTION lai_app_ped_info_busca();
+"""
+
+REMOVER_GATILHO = """
+DROP TRIGGER IF EXISTS lai_app_ped_info_busca ON lai_app_pedidoinformacao;
+DROP FUNCTION IF EXISTS lai_app_ped_info_busca();
+"""
+
+
+def preencher_busca(apps, schema_editor):
+    # Dispara o gatilho nos pedidos existentes, em lotes por faixa de chave primária
+    PedidoInformacao = apps.get_model('lai_app', 'PedidoInformacao')
+    ultimo = PedidoInformacao.objects.aggregate(models.Max('pk'))['pk__max'] or 0
+
+    for inicio in range(0, ultimo + 1, LOTE):
+        with transaction.atomic():
+            (PedidoInformacao.objects
+             .filter(pk__gte=inicio, pk__lt=inicio + LOTE)
+             .update(titulo=models.F('titulo')))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('lai_app', '0010_pedidoinformacao_ano'),
+    ]
+
+    operations = [
+        UnaccentExtension(),
+        migrations.AddField(
+            model_name='pedidoinformacao',
+            name='busca',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunSQL(CRIAR_GATILHO, REMOVER_GATILHO),
+        migrations.RunPython(preencher_busca, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['busca'], name='ped_info_busca_gin_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+import unicodedata
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models, transaction
+
+LOTE = 5000
+
+
+def normalizar(texto):
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower().strip()
+
+
+def preencher_nome_busca(apps, schema_editor):
+    # Preenche o nome normalizado dos cidadãos existentes em lotes
+    Cidadao = apps.get_model('lai_app', 'Cidadao')
+    ultimo = 0
+
+    while True:
+        with transaction.atomic():
+            lote = list(Cidadao.objects.filter(pk__gt=ultimo).order_by('pk').only('pk', 'nome')[:LOTE])
+            if not lote:
+                break
+            for cidadao in lote:
+                cidadao.nome_busca = normalizar(cidadao.nome)
+            Cidadao.objects.bulk_update(lote, ['nome_busca'])
+        ultimo = lote[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('lai_app', '0011_pedidoinformacao_busca'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='cidadao',
+            name='nome_busca',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(preencher_nome_busca, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='cidadao',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['nome_busca'], name='cidadao_nome_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='cidadao',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['num_doc_id'], name='cidadao_doc_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
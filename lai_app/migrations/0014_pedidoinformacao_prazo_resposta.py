@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:24
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Os índices de prazo são construídos com CONCURRENTLY, fora de transação
+    atomic = False
+
+    dependencies = [
+        ('lai_app', '0013_feriado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedidoinformacao',
+            name='prazo_resposta',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Prazo para Resposta'),
+        ),
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=models.Index(condition=models.Q(('situacao__in', ['AI', 'EP', 'DR'])), fields=['situacao', 'prazo_resposta'], name='ped_info_prazo_fila_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=models.Index(condition=models.Q(('situacao', 'BI')), fields=['setor_info', 'prazo_resposta'], name='ped_info_prazo_fornec_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=models.Index(condition=models.Q(('situacao', 'PR')), fields=['prazo_recurso_1'], name='ped_info_prazo_recurso_1_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=models.Index(condition=models.Q(('situacao', 'RR')), fields=['prazo_recurso_2'], name='ped_info_prazo_recurso_2_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def contar_pedidos(apps, schema_editor):
+    # Contagens iniciais, a partir dos pedidos existentes
+    PedidoInformacao = apps.get_model('lai_app', 'PedidoInformacao')
+    ContagemPedidos = apps.get_model('lai_app', 'ContagemPedidos')
+    ContagemPedidos.objects.bulk_create(
+        ContagemPedidos(situacao=situacao, setor_id=setor_id, total=total)
+        for situacao, setor_id, total in PedidoInformacao.objects.order_by()
+            .values_list('situacao', 'setor_info_id').annotate(total=models.Count('pk')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lai_app', '0014_pedidoinformacao_prazo_resposta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContagemPedidos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('situacao', models.CharField(choices=[('AI', 'Análise Inicial'), ('BI', 'Buscando Informações'), ('EP', 'Elaborando Parecer'), ('DR', 'Definindo Resposta'), ('PR', 'Pedido Respondido'), ('AR', 'Analisando Recurso'), ('RR', 'Recurso Respondido'), ('AF', 'Analisando Recurso Final'), ('RF', 'Recurso Final Respondido')], max_length=2, verbose_name='Situação')),
+                ('total', models.BigIntegerField(default=0)),
+                ('setor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='lai_app.setor', verbose_name='Setor Fornecedor da Informação')),
+            ],
+            options={
+                'verbose_name': 'Contagem de Pedidos',
+                'verbose_name_plural': 'Contagens de Pedidos',
+                'constraints': [models.UniqueConstraint(fields=('situacao', 'setor'), name='contagem_situacao_setor_uniq', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunPython(contar_pedidos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:35
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # O índice de atualizado_em é construído com CONCURRENTLY, que não roda
+    # dentro de transação
+    atomic = False
+
+    dependencies = [
+        ('lai_app', '0015_contagempedidos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AtualizacaoResumo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('marca', models.DateTimeField(blank=True, null=True, verbose_name='Atualizado Até')),
+            ],
+            options={
+                'verbose_name': 'Atualização do Resumo',
+                'verbose_name_plural': 'Atualizações do Resumo',
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumoPedidos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ano', models.PositiveSmallIntegerField()),
+                ('mes', models.PositiveSmallIntegerField(verbose_name='Mês')),
+                ('situacao', models.CharField(choices=[('AI', 'Análise Inicial'), ('BI', 'Buscando Informações'), ('EP', 'Elaborando Parecer'), ('DR', 'Definindo Resposta'), ('PR', 'Pedido Respondido'), ('AR', 'Analisando Recurso'), ('RR', 'Recurso Respondido'), ('AF', 'Analisando Recurso Final'), ('RF', 'Recurso Final Respondido')], max_length=2, verbose_name='Situação')),
+                ('desfecho', models.CharField(choices=[('TR', 'Em Tramitação'), ('DE', 'Deferido'), ('IN', 'Indeferido')], max_length=2)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('recursos_1', models.PositiveIntegerField(default=0, verbose_name='Recursos em 1ª Instância')),
+                ('recursos_2', models.PositiveIntegerField(default=0, verbose_name='Recursos em 2ª Instância')),
+                ('duracoes', models.JSONField(default=dict, verbose_name='Durações')),
+            ],
+            options={
+                'verbose_name': 'Resumo de Pedidos',
+                'verbose_name_plural': 'Resumos de Pedidos',
+            },
+        ),
+        migrations.AddField(
+            model_name='pedidoinformacao',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, verbose_name='Última Movimentação'),
+        ),
+        AddIndexConcurrently(
+            model_name='pedidoinformacao',
+            index=models.Index(fields=['atualizado_em'], name='ped_info_atualizado_idx'),
+        ),
+        migrations.AddField(
+            model_name='resumopedidos',
+            name='setor_info',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='lai_app.setor', verbose_name='Setor Fornecedor da Informação'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumopedidos',
+            constraint=models.UniqueConstraint(fields=('ano', 'mes', 'setor_info', 'situacao', 'desfecho'), name='resumo_ano_mes_setor_situacao_desfecho_uniq', nulls_distinct=False),
+        ),
+    ]
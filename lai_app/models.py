@@ -1,16 +1,49 @@
-from django.db import models, transaction
+import unicodedata
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField, TrigramWordSimilarity
+from django.db import connection, models, transaction
 from django.contrib.auth.models import User
 from django.core.cache import cache
-from django.utils.timezone import now
-from datetime import datetime as dt
+from django.utils.timezone import localdate, now
+
+def incrementar_versao(chave):
+    # Versão compartilhada no cache: cada processo recarrega a sua cópia local
+    # quando a versão muda
+    try:
+        cache.incr(chave)
+    except ValueError:
+        if not cache.add(chave, 1, None):
+            cache.incr(chave)
 
 class SingletonModel(models.Model):
 
+    # Cópia local ao processo, validada contra uma versão compartilhada no cache.
+    # A versão é conferida no máximo uma vez por requisição (ver apps.py), de modo
+    # que as leituras seguintes não custam nenhuma consulta.
+    _local = None
+    _versao_local = None
+    _versao_conferida = False
+
     class Meta:
         abstract = True
 
+    @classmethod
+    def chave_versao(cls):
+        return cls.__name__ + ':versao'
+
     def set_cache(self):
-        cache.get(self.__class__.__name__, self)
+        # Incrementa a versão compartilhada para que todos os processos recarreguem,
+        # mas só depois do commit: antes disso outro processo recarregaria os
+        # valores antigos e os guardaria com a versão nova
+        classe = self.__class__
+        classe.limpar_cache()
+
+        def publicar():
+            incrementar_versao(classe.chave_versao())
+            classe.limpar_cache()
+
+        transaction.on_commit(publicar)
 
     def save(self, *args, **kwargs):
         self.pk = 1
@@ -20,13 +53,36 @@ class SingletonModel(models.Model):
     def delete(self, *args, **kwargs):
         pass
 
+    @classmethod
+    def limpar_cache(cls):
+        cls._local = None
+        cls._versao_local = None
+        cls._versao_conferida = False
+
+    @classmethod
+    def exigir_conferencia(cls):
+        # Chamado no início de cada requisição
+        cls._versao_conferida = False
+
     @classmethod
     def load(cls):
-        if cache.get(cls.__name__) is None:
-            obj, created = cls.objects.get_or_create(pk=1)
-            if not created:
-                obj.set_cache()
-        return cache.get(cls.__name__)
+        if cls._local is None or not cls._versao_conferida:
+            chave = cls.chave_versao()
+            versao = cache.get(chave)
+            if versao is None:
+                cache.add(chave, 1, None)
+                versao = cache.get(chave)
+            if cls._local is None or versao != cls._versao_local:
+                # Resolve as chaves estrangeiras junto com o registro
+                relacionados = [f.name for f in cls._meta.concrete_fields if f.is_relation]
+                obj, created = cls.objects.select_related(*relacionados).get_or_create(pk=1)
+                if created:
+                    # A criação passa por save(), que incrementa a versão
+                    versao = cache.get(chave)
+                cls._local = obj
+                cls._versao_local = versao
+            cls._versao_conferida = True
+        return cls._local
 
 class Cargo(models.Model):
     
@@ -41,9 +97,26 @@ class Cargo(models.Model):
         verbose_name = "Cargo"
         verbose_name_plural = "Cargos"
 
+def normalizar(texto):
+    # Minúsculas e sem acentos, para buscas por similaridade de trigramas
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower().strip()
+
+class CidadaoQuerySet(models.QuerySet):
+
+    def buscar(self, termo):
+        # Busca tolerante a erros de digitação e acentos, atendida pelos índices de
+        # trigramas; o documento de identificação é buscado por trecho
+        termo = normalizar(termo)
+        return (self.filter(models.Q(nome_busca__trigram_word_similar=termo) |
+                            models.Q(num_doc_id__contains=termo))
+                    .annotate(similaridade=TrigramWordSimilarity(termo, 'nome_busca'))
+                    .order_by('-similaridade', 'nome'))
+
 class Cidadao(models.Model):
     
     nome = models.CharField(max_length=100)
+    nome_busca = models.CharField(max_length=100, editable=False, default='')
     num_doc_id = models.CharField(max_length=20, verbose_name="Documento de Identificação")
     cep = models.CharField(max_length=8, verbose_name="CEP")
     logradouro = models.CharField(max_length=100)
@@ -55,12 +128,22 @@ class Cidadao(models.Model):
     credenciais = models.OneToOneField(User, on_delete=models.CASCADE, blank=True, null= True,
                                        verbose_name="Credenciais de Acesso")
 
+    objects = CidadaoQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        self.nome_busca = normalizar(self.nome)
+        super(Cidadao, self).save(*args, **kwargs)
+
     def __str__(self):
         return self.nome + " (" + self.num_doc_id + ")"
 
     class Meta:
         verbose_name = "Cidadão"
         verbose_name_plural = "Cidadãos"
+        indexes = [
+            GinIndex(fields=['nome_busca'], name='cidadao_nome_trgm_idx', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['num_doc_id'], name='cidadao_doc_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
 class Configuracao(SingletonModel):
     
@@ -84,6 +167,52 @@ class Configuracao(SingletonModel):
         verbose_name = "Configuração"
         verbose_name_plural = "Configurações"
 
+def publicar_calendario():
+    # Executado por Feriado.calendario_alterado depois do commit
+    from .calendario import CalendarioUteis, recalcular_prazos
+    incrementar_versao(Feriado.CHAVE_VERSAO)
+    CalendarioUteis.limpar_cache()
+    recalcular_prazos()
+
+class Feriado(models.Model):
+
+    # Dias sem expediente, além dos sábados e domingos, para a contagem dos prazos
+    # em dias úteis (ver lai_app.calendario)
+    data = models.DateField(unique=True)
+    descricao = models.CharField(max_length=100, verbose_name="Descrição")
+
+    CHAVE_VERSAO = 'Feriado:versao'
+
+    @classmethod
+    def calendario_alterado(cls, using=None, **kwargs):
+        # Receptor de post_save e post_delete (ver LaiAppConfig.ready), que valem
+        # também para fixtures e exclusões em massa: depois do commit todos os
+        # processos refazem o índice de dias úteis e os prazos que ainda correm
+        # são recalculados, uma única vez por transação
+        from .calendario import CalendarioUteis
+        CalendarioUteis.limpar_cache()
+        conexao = transaction.get_connection(using)
+        # A marca na conexão é limpa pelo próprio callback; um rollback (também o
+        # de um savepoint) descarta o callback, e então ele é registrado de novo
+        pendente = getattr(conexao, 'lai_recalculo_calendario', None)
+        if pendente is not None and any(funcao is pendente for _, funcao, _ in conexao.run_on_commit):
+            return
+
+        def publicar():
+            conexao.lai_recalculo_calendario = None
+            publicar_calendario()
+
+        conexao.lai_recalculo_calendario = publicar
+        transaction.on_commit(publicar, using=using)
+
+    def __str__(self):
+        return f"{self.data:%d/%m/%Y} - {self.descricao}"
+
+    class Meta:
+        verbose_name = "Feriado"
+        verbose_name_plural = "Feriados"
+        ordering = ['data']
+
 class Funcionario(models.Model):
     
     nome = models.CharField(max_length=100)
@@ -95,35 +224,35 @@ class Funcionario(models.Model):
            
     def analisa_ped_info(self):
 
-        if self.lotacao != Configuracao.objects.get(id=1).setor_adm:
+        if self.lotacao_id != Configuracao.load().setor_adm_id:
             return False
         
         return True
     
     def emite_parecer(self):
 
-        if self.lotacao != Configuracao.objects.get(id=1).setor_parecer:
+        if self.lotacao_id != Configuracao.load().setor_parecer_id:
             return False
         
         return True
     
     def responde_ped_info(self):
 
-        if self.lotacao != Configuracao.objects.get(id=1).setor_resposta:
+        if self.lotacao_id != Configuracao.load().setor_resposta_id:
             return False
         
         return True
     
     def responde_recurso_1(self):
 
-        if self.lotacao != Configuracao.objects.get(id=1).setor_recurso_1:
+        if self.lotacao_id != Configuracao.load().setor_recurso_1_id:
             return False
         
         return True
     
     def responde_recurso_2(self):
 
-        if self.lotacao != Configuracao.objects.get(id=1).setor_recurso_2:
+        if self.lotacao_id != Configuracao.load().setor_recurso_2_id:
             return False
         
         return True
@@ -137,24 +266,65 @@ class Funcionario(models.Model):
 
 class Numerador(models.Model):
         
-    exercicio_num = models.PositiveSmallIntegerField("exercício")
+    exercicio_num = models.PositiveSmallIntegerField("exercício", unique=True)
     ultimo_num = models.PositiveBigIntegerField("último número", default=0)
 
     @classmethod
-    def numerar(cls):
+    def preparar_exercicio(cls, exercicio):
+        # Cria o contador do exercício antes da virada do ano (ver o comando
+        # preparar_numerador); a restrição de unicidade resolve criações simultâneas
+        numeracao_exerc, created = cls.objects.get_or_create(exercicio_num=exercicio)
+        return numeracao_exerc
+
+    @classmethod
+    def numerar(cls, exercicio=None):
+
+        if exercicio is None:
+            exercicio = localdate().year
         
         with transaction.atomic():
 
-            exercicio = dt.now().year
-            
-            try:
-                numeracao_exerc = cls.objects.select_for_update().get(exercicio_num = exercicio)
-            except cls.DoesNotExist:          
-                numeracao_exerc = Numerador(exercicio_num=exercicio)
+            # Incremento atômico no banco: o bloqueio da linha dura apenas até o fim
+            # da transação que grava o pedido, sem leitura prévia com select_for_update
+            contador = cls.objects.filter(exercicio_num=exercicio)
             
-            numeracao_exerc.ultimo_num += 1
-            numeracao_exerc.save()
-            return numeracao_exerc.ultimo_num
+            if not contador.update(ultimo_num=models.F('ultimo_num') + 1):
+                cls.preparar_exercicio(exercicio)
+                contador.update(ultimo_num=models.F('ultimo_num') + 1)
+
+            return contador.values_list('ultimo_num', flat=True).get()
+
+class PedidoInformacaoQuerySet(models.QuerySet):
+
+    # Situações em que o pedido aguarda um setor definido na Configuração; em 'BI'
+    # aguarda o setor fornecedor indicado no próprio pedido
+    SETORES_ETAPA = {'AI': 'setor_adm_id', 'EP': 'setor_parecer_id', 'DR': 'setor_resposta_id'}
+
+    # Janelas de recurso: prazo e setor que julgará o recurso, se interposto
+    JANELAS_RECURSO = {'PR': ('prazo_recurso_1', 'setor_recurso_1_id'),
+                       'RR': ('prazo_recurso_2', 'setor_recurso_2_id')}
+
+    def aguardando_setor(self, setor_id):
+        config = Configuracao.load()
+        situacoes = [situacao for situacao, campo in self.SETORES_ETAPA.items()
+                     if getattr(config, campo) == setor_id]
+        return self.filter(models.Q(situacao__in=situacoes) |
+                           models.Q(situacao='BI', setor_info_id=setor_id))
+
+    def atrasados(self, agora):
+        return self.filter(prazo_resposta__lt=agora)
+
+    def vencendo(self, agora, limite):
+        return self.filter(prazo_resposta__gte=agora, prazo_resposta__lt=limite)
+
+    def recursos_abertos(self, agora, setor_id=None):
+        # Mesma regra de oportunidade_recurso_1/2, em SQL
+        config = Configuracao.load()
+        condicao = models.Q(pk__in=[])
+        for situacao, (prazo, campo) in self.JANELAS_RECURSO.items():
+            if setor_id is None or getattr(config, campo) == setor_id:
+                condicao |= models.Q(situacao=situacao, **{prazo + '__gte': agora})
+        return self.filter(condicao)
 
 class PedidoInformacao(models.Model):
 
@@ -174,13 +344,15 @@ class PedidoInformacao(models.Model):
                                 default='AI', verbose_name="Situação")
 
     # Campos da Criação do Pedido de Informação
-    num_registro = models.PositiveIntegerField(unique_for_year=True, 
-                                               verbose_name="Número de Registro")
+    num_registro = models.PositiveIntegerField(verbose_name="Número de Registro")
+    ano = models.PositiveSmallIntegerField(editable=False, verbose_name="Ano")
     titulo = models.CharField(max_length=100, verbose_name="Título")
     descricao = models.TextField(verbose_name="Descrição")
     data_pedido = models.DateTimeField(auto_now_add=True, verbose_name="Data do Pedido")
     requerente = models.ForeignKey('Cidadao', on_delete=models.PROTECT, 
                                    related_name='cid_req', verbose_name="Requerente")
+    prazo_resposta = models.DateTimeField(blank=True, null=True, editable=False,
+                                          verbose_name="Prazo para Resposta")
 
     # Campos do Setor Administrativo
     setor_info = models.ForeignKey('Setor', on_delete=models.PROTECT, 
@@ -260,6 +432,16 @@ class PedidoInformacao(models.Model):
                                             verbose_name="Funcionário da Resposta ao Recurso em 2ª Instância", 
                                             blank=True, null=True, related_name='func_resp_recurso_2')
 
+    # Última gravação do pedido (inclusão ou transição): marca d'água da atualização
+    # incremental do resumo do relatório anual (lai_app.relatorio)
+    atualizado_em = models.DateTimeField(auto_now=True, verbose_name="Última Movimentação")
+
+    # Vetor de busca textual (titulo, descrição, parecer e justificativas), mantido
+    # pelo gatilho lai_app_ped_info_busca criado na migração 0011
+    busca = SearchVectorField(blank=True, null=True, editable=False)
+
+    objects = PedidoInformacaoQuerySet.as_manager()
+
     def oportunidade_recurso_1(self):
         if (self.prazo_recurso_1 and 
             now() <= self.prazo_recurso_1 and
@@ -274,19 +456,194 @@ class PedidoInformacao(models.Model):
                 return True
         return False
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Guarda o setor lido do banco: formulários de etapa alteram setor_info
+        # na instância antes da transição, que precisa da contagem gravada
+        instancia = super().from_db(db, field_names, values)
+        if 'setor_info_id' in field_names:
+            instancia.setor_gravado = instancia.setor_info_id
+        return instancia
+
     def save(self, *args, **kwargs):
         
-        if self.num_registro is None:                        
-            self.num_registro = Numerador.numerar()
-
-        super(PedidoInformacao, self).save(*args, **kwargs)
+        if self.ano is None:
+            self.ano = localdate().year
+
+        if self.prazo_resposta is None and self._state.adding:
+            from .calendario import prazo_resposta
+            self.prazo_resposta = prazo_resposta(self.data_pedido or now())
+
+        # Um pedido novo entra na contagem da sua situação na mesma transação
+        adicionando = self._state.adding
+
+        if self.num_registro is not None:
+            with transaction.atomic():
+                super(PedidoInformacao, self).save(*args, **kwargs)
+                if adicionando:
+                    ContagemPedidos.ajustar(self.situacao, self.setor_info_id, 1)
+            self.setor_gravado = self.setor_info_id
+            return
+
+        # O número e o pedido são gravados na mesma transação: se a inclusão
+        # falhar, o número volta a ficar disponível e a numeração não tem lacunas
+        with transaction.atomic():
+            self.num_registro = Numerador.numerar(self.ano)
+            try:
+                super(PedidoInformacao, self).save(*args, **kwargs)
+            except Exception:
+                self.num_registro = None
+                raise
+            ContagemPedidos.ajustar(self.situacao, self.setor_info_id, 1)
+        self.setor_gravado = self.setor_info_id
 
     def __str__(self):
-        return f"{self.num_registro}/{self.data_pedido.year}"
+        return f"{self.num_registro}/{self.ano}"
 
     class Meta:
         verbose_name = "Pedido de Informação"
         verbose_name_plural = "Pedidos de Informação"
+        constraints = [
+            # O número de registro é reiniciado a cada ano
+            models.UniqueConstraint(fields=['ano', 'num_registro'], name='ped_info_ano_num_registro_uniq'),
+        ]
+        indexes = [
+            # Filas de trabalho: filtram pela situação e ordenam pela data
+            models.Index(fields=['situacao', 'data_pedido'], name='ped_info_fila_idx',
+                         condition=models.Q(situacao__in=['AI', 'EP', 'DR'])),
+            models.Index(fields=['setor_info', 'data_pedido'], name='ped_info_fornec_idx',
+                         condition=models.Q(situacao='BI')),
+            models.Index(fields=['data_recurso_1'], name='ped_info_recurso_1_idx',
+                         condition=models.Q(situacao='AR')),
+            models.Index(fields=['data_recurso_2'], name='ped_info_recurso_2_idx',
+                         condition=models.Q(situacao='AF')),
+            # Prazos por setor: atrasados, vencendo e janelas de recurso abertas
+            models.Index(fields=['situacao', 'prazo_resposta'], name='ped_info_prazo_fila_idx',
+                         condition=models.Q(situacao__in=['AI', 'EP', 'DR'])),
+            models.Index(fields=['setor_info', 'prazo_resposta'], name='ped_info_prazo_fornec_idx',
+                         condition=models.Q(situacao='BI')),
+            models.Index(fields=['prazo_recurso_1'], name='ped_info_prazo_recurso_1_idx',
+                         condition=models.Q(situacao='PR')),
+            models.Index(fields=['prazo_recurso_2'], name='ped_info_prazo_recurso_2_idx',
+                         condition=models.Q(situacao='RR')),
+            # Consultas: pedidos do cidadão e consulta geral
+            models.Index(fields=['requerente', 'data_pedido'], name='ped_info_requerente_data_idx'),
+            models.Index(fields=['situacao', 'data_pedido'], name='ped_info_situacao_data_idx'),
+            models.Index(fields=['data_pedido'], name='ped_info_data_idx'),
+            models.Index(fields=['atualizado_em'], name='ped_info_atualizado_idx'),
+            GinIndex(fields=['busca'], name='ped_info_busca_gin_idx'),
+        ]
+
+class ContagemPedidos(models.Model):
+
+    # Número de pedidos por situação e setor fornecedor, atualizado na mesma
+    # transação da inclusão do pedido e de cada transição (lai_app.transicoes).
+    # Alterações feitas por fora (bulk_create, SQL, exclusões) são corrigidas
+    # pelo comando reconciliar_contagens.
+    situacao = models.CharField(max_length=2, choices=PedidoInformacao.SITUACOES, verbose_name="Situação")
+    setor = models.ForeignKey('Setor', on_delete=models.CASCADE, blank=True, null=True,
+                              verbose_name="Setor Fornecedor da Informação")
+    total = models.BigIntegerField(default=0)
+
+    @classmethod
+    def ajustar(cls, situacao, setor_id, quantidade):
+        # Incremento atômico, como no Numerador: a linha fica bloqueada só até o
+        # fim da transação que movimenta o pedido
+        contagem = cls.objects.filter(situacao=situacao, setor_id=setor_id)
+
+        if not contagem.update(total=models.F('total') + quantidade):
+            cls.objects.get_or_create(situacao=situacao, setor_id=setor_id)
+            contagem.update(total=models.F('total') + quantidade)
+
+    @classmethod
+    def totais(cls):
+        # Todas as contagens em uma consulta: {(situação, setor_id): (nome do setor, total)}
+        return {(situacao, setor_id): (setor_nome, total)
+                for situacao, setor_id, setor_nome, total
+                in cls.objects.values_list('situacao', 'setor_id', 'setor__nome', 'total')}
+
+    @classmethod
+    def reconciliar(cls):
+        # Recalcula as contagens a partir dos pedidos e devolve as divergências
+        # encontradas. O bloqueio da tabela faz as transições em andamento esperarem:
+        # as que ainda não terminaram entram depois, sobre os totais corrigidos.
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {cls._meta.db_table} IN EXCLUSIVE MODE")
+
+            reais = {(situacao, setor_id): total for situacao, setor_id, total in
+                     PedidoInformacao.objects.order_by().values_list('situacao', 'setor_info_id')
+                                             .annotate(total=models.Count('pk'))}
+            atuais = {(situacao, setor_id): total for situacao, setor_id, total in
+                      cls.objects.values_list('situacao', 'setor_id', 'total')}
+
+            divergencias = {chave: (atuais.get(chave, 0), reais.get(chave, 0))
+                            for chave in reais.keys() | atuais.keys()
+                            if atuais.get(chave, 0) != reais.get(chave, 0)}
+
+            cls.objects.all().delete()
+            cls.objects.bulk_create(cls(situacao=situacao, setor_id=setor_id, total=total)
+                                    for (situacao, setor_id), total in reais.items())
+
+        return divergencias
+
+    def __str__(self):
+        return f"{self.get_situacao_display()} / {self.setor or '-'}: {self.total}"
+
+    class Meta:
+        verbose_name = "Contagem de Pedidos"
+        verbose_name_plural = "Contagens de Pedidos"
+        constraints = [
+            models.UniqueConstraint(fields=['situacao', 'setor'], name='contagem_situacao_setor_uniq',
+                                    nulls_distinct=False),
+        ]
+
+class ResumoPedidos(models.Model):
+
+    # Resumo materializado do relatório anual da LAI: uma linha por mês do pedido,
+    # setor fornecedor, situação e desfecho, com as durações de cada etapa. É
+    # refeito por mês, a partir dos pedidos movimentados desde a última atualização
+    # (lai_app.relatorio.atualizar_resumo).
+    DESFECHOS = {
+        "TR": "Em Tramitação",
+        "DE": "Deferido",
+        "IN": "Indeferido",
+    }
+
+    ano = models.PositiveSmallIntegerField()
+    mes = models.PositiveSmallIntegerField(verbose_name="Mês")
+    setor_info = models.ForeignKey('Setor', on_delete=models.CASCADE, blank=True, null=True,
+                                   verbose_name="Setor Fornecedor da Informação")
+    situacao = models.CharField(max_length=2, choices=PedidoInformacao.SITUACOES, verbose_name="Situação")
+    desfecho = models.CharField(max_length=2, choices=DESFECHOS)
+    total = models.PositiveIntegerField(default=0)
+    recursos_1 = models.PositiveIntegerField(default=0, verbose_name="Recursos em 1ª Instância")
+    recursos_2 = models.PositiveIntegerField(default=0, verbose_name="Recursos em 2ª Instância")
+    # {intervalo: {'n', 'soma', 'maximo', 'faixas'}}, em segundos (ver relatorio.Duracoes)
+    duracoes = models.JSONField(default=dict, verbose_name="Durações")
+
+    def __str__(self):
+        return f"{self.mes:02d}/{self.ano} - {self.get_situacao_display()} - {self.get_desfecho_display()}"
+
+    class Meta:
+        verbose_name = "Resumo de Pedidos"
+        verbose_name_plural = "Resumos de Pedidos"
+        constraints = [
+            models.UniqueConstraint(fields=['ano', 'mes', 'setor_info', 'situacao', 'desfecho'],
+                                    name='resumo_ano_mes_setor_situacao_desfecho_uniq', nulls_distinct=False),
+        ]
+
+class AtualizacaoResumo(SingletonModel):
+
+    # Marca d'água do resumo: os pedidos movimentados até esse momento já estão nele
+    marca = models.DateTimeField(blank=True, null=True, verbose_name="Atualizado Até")
+
+    def __str__(self):
+        return "Atualização do Resumo de Pedidos"
+
+    class Meta:
+        verbose_name = "Atualização do Resumo"
+        verbose_name_plural = "Atualizações do Resumo"
 
 class Setor(models.Model):
     
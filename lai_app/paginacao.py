@@ -0,0 +1,128 @@
+import datetime
+import json
+
+from django.core import signing
+from django.db.models import F, Q
+
+
+class SerializadorCursor:
+    # Datas com precisão total (o DjangoJSONEncoder trunca os microssegundos,
+    # o que quebraria a comparação com a última linha da página)
+
+    def dumps(self, obj):
+        def converter(valor):
+            if isinstance(valor, (datetime.datetime, datetime.date)):
+                return valor.isoformat()
+            raise TypeError(f"Tipo não suportado no cursor: {type(valor).__name__}")
+        return json.dumps(obj, default=converter, separators=(',', ':')).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+class PaginacaoKeysetMixin:
+    # Paginação por chave (keyset) para ListViews: cada página é buscada a partir
+    # dos valores de ordenação da última linha exibida, de modo que páginas
+    # profundas custam o mesmo que a primeira. Os cursores são assinados.
+
+    tamanho_pagina = 20
+    ordenacao = ('data_pedido',)
+    parametro_cursor = 'cursor'
+    salt_cursor = 'lai_app.paginacao'
+
+    def get_ordenacao(self):
+        return self.ordenacao
+
+    def ordem_keyset(self):
+        # Lista de (campo, decrescente) com a chave primária como desempate
+        campos = list(self.get_ordenacao())
+        if campos[-1].lstrip('-') != 'pk':
+            campos.append('-pk' if campos[0].startswith('-') else 'pk')
+        return [(campo.lstrip('-'), campo.startswith('-')) for campo in campos]
+
+    @staticmethod
+    def assinatura_ordem(ordem):
+        # Um cursor só vale para a ordenação (campos e sentidos) que o gerou
+        return [('-' if desc else '') + campo for campo, desc in ordem]
+
+    def ler_cursor(self, ordem):
+        token = self.request.GET.get(self.parametro_cursor)
+        if not token:
+            return None
+        try:
+            cursor = signing.loads(token, salt=self.salt_cursor, serializer=SerializadorCursor)
+        except signing.BadSignature:
+            return None
+        if cursor.get('ordem') != self.assinatura_ordem(ordem) or cursor.get('sentido') not in ('p', 'a'):
+            return None
+        return cursor
+
+    def gerar_cursor(self, ordem, sentido, valores):
+        return signing.dumps({'ordem': self.assinatura_ordem(ordem), 'sentido': sentido,
+                              'valores': valores},
+                             salt=self.salt_cursor, serializer=SerializadorCursor, compress=True)
+
+    @staticmethod
+    def filtro_apos(ordem, valores):
+        # (c1, ..., cn) depois de (v1, ..., vn) na ordem dada. A condição redundante
+        # sobre o primeiro campo permite a varredura por faixa no índice.
+        condicao = Q()
+        igualdades = Q()
+        for (campo, desc), valor in zip(ordem, valores):
+            condicao |= igualdades & Q(**{f"{campo}__{'lt' if desc else 'gt'}": valor})
+            igualdades &= Q(**{campo: valor})
+        primeiro, desc = ordem[0]
+        return Q(**{f"{primeiro}__{'lte' if desc else 'gte'}": valores[0]}) & condicao
+
+    def chave(self, item, i):
+        if isinstance(item, dict):
+            return item[f'cursor_{i}']
+        return getattr(item, f'cursor_{i}')
+
+    def projetar(self, queryset):
+        return queryset
+
+    def materializar(self, itens):
+        return itens
+
+    def consulta_pagina(self, queryset, ordem, cursor):
+        # Queryset da página pedida, com uma linha extra para saber se há mais.
+        # Para a página anterior a ordem é invertida e o resultado revertido.
+        voltando = cursor is not None and cursor['sentido'] == 'a'
+        ordem_consulta = [(campo, desc != voltando) for campo, desc in ordem]
+        queryset = self.projetar(queryset).annotate(**{f'cursor_{i}': F(campo) for i, (campo, desc) in enumerate(ordem)})
+        queryset = queryset.order_by(*[('-' if desc else '') + campo for campo, desc in ordem_consulta])
+        if cursor is not None:
+            queryset = queryset.filter(self.filtro_apos(ordem_consulta, cursor['valores']))
+        return queryset[:self.tamanho_pagina + 1]
+
+    def paginar(self, queryset):
+        ordem = self.ordem_keyset()
+        cursor = self.ler_cursor(ordem)
+        voltando = cursor is not None and cursor['sentido'] == 'a'
+
+        itens = list(self.consulta_pagina(queryset, ordem, cursor))
+        ha_mais = len(itens) > self.tamanho_pagina
+        itens = itens[:self.tamanho_pagina]
+        if voltando:
+            itens.reverse()
+
+        tem_proxima = ha_mais if not voltando else True
+        tem_anterior = ha_mais if voltando else cursor is not None
+
+        proximo = anterior = None
+        if itens and tem_proxima:
+            proximo = self.gerar_cursor(ordem, 'p', [self.chave(itens[-1], i) for i in range(len(ordem))])
+        if itens and tem_anterior:
+            anterior = self.gerar_cursor(ordem, 'a', [self.chave(itens[0], i) for i in range(len(ordem))])
+
+        return self.materializar(itens), anterior, proximo
+
+    def get_context_data(self, **kwargs):
+        pagina, anterior, proximo = self.paginar(self.object_list)
+        kwargs['object_list'] = pagina
+        context = super().get_context_data(**kwargs)
+        context['cursor_anterior'] = anterior
+        context['cursor_proximo'] = proximo
+
+        return context
@@ -0,0 +1,56 @@
+from dataclasses import dataclass
+
+from django.contrib.auth.models import User
+
+from .models import Cidadao, Configuracao, Funcionario
+
+
+@dataclass(frozen=True)
+class Papeis:
+
+    funcionario: Funcionario | None = None
+    cidadao: Cidadao | None = None
+    adm: bool = False
+    parecer: bool = False
+    resposta: bool = False
+    recurso_1: bool = False
+    recurso_2: bool = False
+
+    @property
+    def lotacao_id(self):
+        return self.funcionario.lotacao_id if self.funcionario else None
+
+    def fornece(self, setor_id):
+        # Verifica se o usuário é funcionário lotado no setor fornecedor da informação
+        return self.funcionario is not None and self.funcionario.lotacao_id == setor_id
+
+
+SEM_PAPEIS = Papeis()
+
+
+def resolver_papeis(usuario):
+
+    if not usuario.is_authenticated:
+        return SEM_PAPEIS
+
+    # Uma única consulta traz o funcionário e o cidadão vinculados ao usuário
+    credenciais = User.objects.select_related('funcionario', 'cidadao').get(pk=usuario.pk)
+    funcionario = getattr(credenciais, 'funcionario', None)
+    cidadao = getattr(credenciais, 'cidadao', None)
+
+    if funcionario is None:
+        return Papeis(cidadao=cidadao)
+
+    # A configuração vem do cache local ao processo, sem custo de consulta
+    config = Configuracao.load()
+    lotacao_id = funcionario.lotacao_id
+
+    return Papeis(
+        funcionario=funcionario,
+        cidadao=cidadao,
+        adm=lotacao_id == config.setor_adm_id,
+        parecer=lotacao_id == config.setor_parecer_id,
+        resposta=lotacao_id == config.setor_resposta_id,
+        recurso_1=lotacao_id == config.setor_recurso_1_id,
+        recurso_2=lotacao_id == config.setor_recurso_2_id,
+    )
@@ -0,0 +1,104 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.utils.text import slugify
+from django.utils.timezone import localtime, now
+
+
+class AmostradorPilhas(threading.Thread):
+    # Amostra a pilha de uma thread em intervalos fixos e acumula as pilhas no
+    # formato "collapsed" (uma linha "f1;f2;f3 contagem"), lido por flamegraph.pl
+    # e pelo speedscope
+
+    def __init__(self, thread_id, intervalo):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.parar = threading.Event()
+        self.pilhas = Counter()
+
+    def run(self):
+        while not self.parar.wait(self.intervalo):
+            quadro = sys._current_frames().get(self.thread_id)
+            pilha = []
+            while quadro is not None:
+                codigo = quadro.f_code
+                pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                quadro = quadro.f_back
+            if pilha:
+                self.pilhas[";".join(reversed(pilha))] += 1
+
+    def collapsed(self):
+        return "".join(f"{pilha} {total}\n" for pilha, total in self.pilhas.most_common())
+
+
+class ConsultasPerfil:
+    # execute_wrapper que guarda cada comando SQL com a sua duração
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append({'sql': sql, 'duracao_ms': round((time.perf_counter() - inicio) * 1000, 3)})
+
+
+class PerfilRequisicao:
+    # Executa uma requisição sob o cProfile e o amostrador de pilhas e grava, no
+    # diretório indicado, o dump do cProfile (.prof), as pilhas (.folded) e um
+    # JSON com a view, os tempos totais e o SQL executado
+
+    def __init__(self, diretorio, intervalo):
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self.consultas = ConsultasPerfil()
+
+    def executar(self, funcao):
+        self.perfil = cProfile.Profile()
+        self.amostrador = AmostradorPilhas(threading.get_ident(), self.intervalo)
+        self.amostrador.start()
+        inicio = time.perf_counter()
+        try:
+            return self.perfil.runcall(funcao)
+        finally:
+            self.duracao = time.perf_counter() - inicio
+            self.amostrador.parar.set()
+            self.amostrador.join()
+
+    def gravar(self, request, view, response):
+        # Nome: data e hora, view e chave do objeto (quando houver), ex.:
+        # 20250314-101502-123456-DetalhesPedInfo-42
+        match = request.resolver_match
+        partes = [localtime(now()).strftime('%Y%m%d-%H%M%S-%f'), view or 'sem-view']
+        if match is not None and match.kwargs:
+            partes += [str(valor) for valor in match.kwargs.values()]
+        nome = slugify("-".join(partes))
+        os.makedirs(self.diretorio, exist_ok=True)
+        base = os.path.join(self.diretorio, nome)
+
+        self.perfil.dump_stats(base + '.prof')
+        with open(base + '.folded', 'w', encoding='utf-8') as arquivo:
+            arquivo.write(self.amostrador.collapsed())
+        with open(base + '.json', 'w', encoding='utf-8') as arquivo:
+            json.dump({
+                'view': view,
+                'caminho': request.path,
+                'consulta': request.META.get('QUERY_STRING', ''),
+                'metodo': request.method,
+                'usuario': request.user.pk,
+                'status': response.status_code,
+                'duracao_ms': round(self.duracao * 1000, 3),
+                'amostras': sum(self.amostrador.pilhas.values()),
+                'intervalo_amostragem_s': self.intervalo,
+                'sql_total_ms': round(sum(c['duracao_ms'] for c in self.consultas.consultas), 3),
+                'sql': self.consultas.consultas,
+            }, arquivo, ensure_ascii=False, indent=2)
+        return nome
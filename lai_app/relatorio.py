@@ -0,0 +1,200 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models.functions import TruncMonth
+from django.utils.timezone import localtime, make_aware, now
+
+from .models import AtualizacaoResumo, PedidoInformacao, ResumoPedidos
+
+# Etapas cujas durações entram no relatório: (descrição, data inicial, data final)
+INTERVALOS = {
+    'encaminhamento': ("Pedido até o encaminhamento", 'data_pedido', 'data_encam'),
+    'fornecimento': ("Encaminhamento até o fornecimento", 'data_encam', 'data_fornec'),
+    'parecer': ("Fornecimento até o parecer", 'data_fornec', 'data_parecer'),
+    'resposta': ("Parecer até a resposta", 'data_parecer', 'data_resp_inicial'),
+    'total': ("Pedido até a resposta", 'data_pedido', 'data_resp_inicial'),
+}
+
+# Limites superiores, em horas, das faixas do histograma de durações; a última
+# faixa, acima de 90 dias, é aberta
+FAIXAS_HORAS = (1, 2, 4, 8, 12, 24, 48, 72, 96, 120, 168, 240, 336, 504, 720, 1080, 1440, 2160)
+LIMITES = tuple(horas * 3600 for horas in FAIXAS_HORAS)
+PERCENTIS = (50, 90, 95)
+
+# Decisões na ordem inversa do fluxo: o desfecho é a última proferida
+DECISOES = (('data_resp_recurso_2', 'resp_recurso_2'), ('data_resp_recurso_1', 'resp_recurso_1'),
+            ('data_resp_inicial', 'resp_inicial'))
+CHAVES_DESFECHO = {'DE': 'deferidos', 'IN': 'indeferidos', 'TR': 'em_tramitacao'}
+
+CAMPOS = (('setor_info_id', 'situacao', 'data_recurso_1', 'data_recurso_2') +
+          tuple(campo for decisao in DECISOES for campo in decisao) +
+          tuple(dict.fromkeys(campo for _, inicio, fim in INTERVALOS.values() for campo in (inicio, fim))))
+
+# Uma transação que grava um pedido dura bem menos que isso: os pedidos gravados
+# pouco antes da marca são relidos, para incluir os confirmados depois dela
+MARGEM = timedelta(minutes=10)
+
+
+class Duracoes:
+
+    # Contagem, soma, máximo e histograma das durações de uma etapa, em segundos.
+    # Ao contrário de médias e percentis, esses valores se somam entre meses e
+    # setores; os percentis são estimados do histograma somado.
+
+    def __init__(self, dados=None):
+        dados = dados or {}
+        self.n = dados.get('n', 0)
+        self.soma = dados.get('soma', 0)
+        self.maximo = dados.get('maximo', 0)
+        self.faixas = list(dados.get('faixas') or [0] * (len(LIMITES) + 1))
+
+    def incluir(self, segundos):
+        segundos = max(int(segundos), 0)
+        self.n += 1
+        self.soma += segundos
+        self.maximo = max(self.maximo, segundos)
+        self.faixas[bisect_left(LIMITES, segundos)] += 1
+
+    def somar(self, dados):
+        outra = Duracoes(dados)
+        self.n += outra.n
+        self.soma += outra.soma
+        self.maximo = max(self.maximo, outra.maximo)
+        self.faixas = [a + b for a, b in zip(self.faixas, outra.faixas)]
+
+    def media(self):
+        return self.soma / self.n if self.n else None
+
+    def percentil(self, p):
+        # Interpolação linear dentro da faixa em que cai a posição do percentil
+        if not self.n:
+            return None
+        posicao = p / 100 * self.n
+        acumulado = 0
+        for i, quantidade in enumerate(self.faixas):
+            if quantidade and acumulado + quantidade >= posicao:
+                inferior = LIMITES[i - 1] if i else 0
+                superior = min(LIMITES[i] if i < len(LIMITES) else self.maximo, self.maximo)
+                return inferior + (superior - inferior) * (posicao - acumulado) / quantidade
+            acumulado += quantidade
+        return self.maximo
+
+    def como_dict(self):
+        return {'n': self.n, 'soma': self.soma, 'maximo': self.maximo, 'faixas': self.faixas}
+
+
+def desfecho(pedido):
+    for data, decisao in DECISOES:
+        if pedido[data]:
+            return 'DE' if pedido[decisao] else 'IN'
+    return 'TR'
+
+
+def limites_mes(ano, mes):
+    return make_aware(datetime(ano, mes, 1)), make_aware(datetime(ano + mes // 12, mes % 12 + 1, 1))
+
+
+def resumir_mes(ano, mes):
+    # Refaz as linhas do resumo de um mês do pedido; o mês de um pedido nunca
+    # muda, de modo que os demais meses não são afetados
+    inicio, fim = limites_mes(ano, mes)
+    resumos = {}
+    duracoes = {}
+
+    pedidos = PedidoInformacao.objects.filter(data_pedido__gte=inicio, data_pedido__lt=fim).order_by()
+    for pedido in pedidos.values(*CAMPOS).iterator(chunk_size=5000):
+        chave = (pedido['setor_info_id'], pedido['situacao'], desfecho(pedido))
+        if chave not in resumos:
+            resumos[chave] = ResumoPedidos(ano=ano, mes=mes, setor_info_id=chave[0], situacao=chave[1],
+                                           desfecho=chave[2])
+            duracoes[chave] = {nome: Duracoes() for nome in INTERVALOS}
+
+        resumo = resumos[chave]
+        resumo.total += 1
+        resumo.recursos_1 += pedido['data_recurso_1'] is not None
+        resumo.recursos_2 += pedido['data_recurso_2'] is not None
+        for nome, (descricao, de, ate) in INTERVALOS.items():
+            if pedido[de] and pedido[ate]:
+                duracoes[chave][nome].incluir((pedido[ate] - pedido[de]).total_seconds())
+
+    for chave, resumo in resumos.items():
+        resumo.duracoes = {nome: etapa.como_dict() for nome, etapa in duracoes[chave].items() if etapa.n}
+
+    ResumoPedidos.objects.filter(ano=ano, mes=mes).delete()
+    ResumoPedidos.objects.bulk_create(resumos.values())
+
+
+def atualizar_resumo(completo=False):
+    # Refaz os meses que têm pedidos movimentados desde a marca (todos, na
+    # primeira execução ou se completo) e devolve a lista de (ano, mês) refeitos
+    with transaction.atomic():
+        # O bloqueio da marca serializa atualizações simultâneas
+        atualizacao, criada = AtualizacaoResumo.objects.select_for_update().get_or_create(pk=1)
+        inicio = now()
+
+        pedidos = PedidoInformacao.objects.order_by()
+        if atualizacao.marca and not completo:
+            pedidos = pedidos.filter(atualizado_em__gte=atualizacao.marca - MARGEM)
+        else:
+            ResumoPedidos.objects.all().delete()
+
+        meses = sorted({(localtime(mes).year, localtime(mes).month) for mes in
+                        pedidos.annotate(mes=TruncMonth('data_pedido')).values_list('mes', flat=True).distinct()})
+        for ano, mes in meses:
+            resumir_mes(ano, mes)
+
+        atualizacao.marca = inicio
+        atualizacao.save()
+
+    return meses
+
+
+def dias(segundos):
+    return round(segundos / 86400, 1) if segundos is not None else None
+
+
+def anos_disponiveis():
+    return list(ResumoPedidos.objects.order_by('-ano').values_list('ano', flat=True).distinct())
+
+
+def vazio():
+    return {'recebidos': 0, **dict.fromkeys(CHAVES_DESFECHO.values(), 0)}
+
+
+def relatorio_anual(ano):
+    # Estatísticas do ano montadas do resumo materializado, sem ler os pedidos
+    totais = {**vazio(), 'recursos_1': 0, 'recursos_2': 0}
+    situacoes = dict.fromkeys(PedidoInformacao.SITUACOES, 0)
+    meses = {mes: vazio() for mes in range(1, 13)}
+    setores = {}
+    duracoes = {nome: Duracoes() for nome in INTERVALOS}
+
+    linhas = (ResumoPedidos.objects.filter(ano=ano)
+              .values_list('mes', 'setor_info_id', 'setor_info__nome', 'situacao', 'desfecho', 'total',
+                           'recursos_1', 'recursos_2', 'duracoes'))
+    for mes, setor_id, setor_nome, situacao, desfecho_, total, recursos_1, recursos_2, etapas in linhas:
+        chave = CHAVES_DESFECHO[desfecho_]
+        setor = setores.setdefault((setor_nome or "Não encaminhado", setor_id or 0), vazio())
+        for agregado in (totais, meses[mes], setor):
+            agregado['recebidos'] += total
+            agregado[chave] += total
+        totais['recursos_1'] += recursos_1
+        totais['recursos_2'] += recursos_2
+        situacoes[situacao] += total
+        for nome, dados in etapas.items():
+            duracoes[nome].somar(dados)
+
+    return {
+        'ano': ano,
+        'atualizado_ate': AtualizacaoResumo.load().marca,
+        **totais,
+        'situacoes': [{'situacao': situacao, 'nome': PedidoInformacao.SITUACOES[situacao], 'total': total}
+                      for situacao, total in situacoes.items()],
+        'meses': [{'mes': mes, **valores} for mes, valores in meses.items()],
+        'setores': [{'setor': nome, **valores} for (nome, setor_id), valores in sorted(setores.items())],
+        'duracoes': [{'etapa': nome, 'descricao': INTERVALOS[nome][0], 'pedidos': etapa.n,
+                      'media_dias': dias(etapa.media()),
+                      **{f'p{p}_dias': dias(etapa.percentil(p)) for p in PERCENTIS}}
+                     for nome, etapa in duracoes.items()],
+    }
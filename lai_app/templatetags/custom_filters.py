@@ -3,6 +3,6 @@ from django import template
 register = template.Library()
 
 @register.filter
-def add_days(value, days):
-    from datetime import timedelta
-    return value + timedelta(days=int(days))
\ No newline at end of file
+def add_dias_uteis(value, days):
+    from lai_app.calendario import prazo_em_dias_uteis
+    return prazo_em_dias_uteis(value, int(days)) if value else None
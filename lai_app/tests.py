@@ -1,7 +1,99 @@
-from django.test import TestCase
-from datetime import datetime, timedelta
-from .models import PedidoInformacao, Cidadao, Numerador
+from django.contrib.auth.models import AnonymousUser, User
+import csv
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import pstats
+import shutil
+import tempfile
+import sys
+import threading
+import time
+import tracemalloc
+import unittest
+from django.conf import settings
+from django.core import serializers
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import Client, LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils.timezone import localdate, localtime, make_aware, now
+from datetime import date, datetime, timedelta
+from .models import (AtualizacaoResumo, Cargo, Configuracao, ContagemPedidos, Feriado, PedidoInformacao, Cidadao,
+                     Funcionario, Numerador, ResumoPedidos, Setor)
+from .checks import cache_compartilhado
+from .calendario import DIAS_RECURSO, CalendarioUteis, prazo_em_dias_uteis, recalcular_prazos, somar_dias_uteis
 from .forms import CidadaoForm
+from .linhas import LinhaPedInfo, ListaPedInfosMixin
+from . import metricas, relatorio, views
+from .middleware import DetectorN1Middleware, PerfilMiddleware
+from .paginacao import PaginacaoKeysetMixin
+from .papeis import SEM_PAPEIS, resolver_papeis
+from .transicoes import TRANSICOES, ConflitoTransicao, transitar
+
+
+# Cache do próprio processo para os testes que contam consultas: com o DatabaseCache
+# das configurações, as conferências de versão também seriam contadas como SQL
+CACHE_LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Monta setores, configuração, funcionários de cada setor e um cidadão com credenciais
+class CenarioMixin:
+
+    def criar_cenario(self):
+        cache.clear()
+        Configuracao.limpar_cache()
+        AtualizacaoResumo.limpar_cache()
+        CalendarioUteis.limpar_cache()
+
+        self.setores = {}
+        for sigla in ('ADM', 'FIN', 'JUR', 'GAB', 'REC1', 'REC2'):
+            self.setores[sigla] = Setor.objects.create(nome="Setor " + sigla, sigla=sigla)
+
+        Configuracao(setor_adm=self.setores['ADM'],
+                     setor_parecer=self.setores['JUR'],
+                     setor_resposta=self.setores['GAB'],
+                     setor_recurso_1=self.setores['REC1'],
+                     setor_recurso_2=self.setores['REC2']).save()
+
+        cargo = Cargo.objects.create(nome="Analista")
+        self.funcionarios = {}
+        for i, sigla in enumerate(self.setores):
+            usuario = User.objects.create(username=sigla.lower())
+            self.funcionarios[sigla] = Funcionario.objects.create(
+                nome="Funcionário " + sigla, matricula=str(i + 1), cargo=cargo,
+                lotacao=self.setores[sigla], credenciais=usuario)
+
+        self.cidadao = Cidadao.objects.create(nome="João Silva", num_doc_id="123456789",
+                                              cep="12345678", logradouro="Rua A", numero="100",
+                                              bairro="Centro", cidade="Cidade X", estado="XX",
+                                              credenciais=User.objects.create(username='joao'))
+
+    def queryset_da_view(self, classe_view, usuario, **parametros):
+        # Monta a view como o Django faria para obter o queryset de uma requisição GET
+        request = RequestFactory().get('/', parametros)
+        request.user = usuario
+        request.papeis = resolver_papeis(usuario)
+        view = classe_view()
+        view.setup(request)
+        queryset = view.get_queryset()
+        if isinstance(view, PaginacaoKeysetMixin):
+            # Consulta efetivamente executada para a página pedida
+            ordem = view.ordem_keyset()
+            queryset = view.consulta_pagina(queryset, ordem, view.ler_cursor(ordem))
+        return queryset
+
+    def criar_pedido(self, situacao='AI', **campos):
+        campos.setdefault('titulo', "Pedido")
+        campos.setdefault('descricao', "Descrição do pedido")
+        return PedidoInformacao.objects.create(requerente=self.cidadao, situacao=situacao, **campos)
 
 # Testa o cadastro de um cidadão
 class FormularioCidadaoTeste(TestCase):
@@ -59,10 +151,1652 @@ class ModeloPedidoInformacaoTeste(TestCase):
     def test_oportunidade_recurso_2(self):
         self.assertFalse(self.pedido.oportunidade_recurso_2())
 
+# Prepara o contador do exercício corrente, como o comando preparar_numerador
+class NumeradorMixin:
+
+    def setUp(self):
+        self.exercicio = localdate().year
+        Numerador.preparar_exercicio(self.exercicio)
+
 # Testa o numerador de pedidos
-class NumeradorTeste(TestCase):
+class NumeradorTeste(NumeradorMixin, TestCase):
     def test_numerar(self):
         numero1 = Numerador.numerar()
         numero2 = Numerador.numerar()
         self.assertEqual(numero1, 1)
         self.assertEqual(numero2, 2)
+
+    def test_numeracao_por_exercicio(self):
+        Numerador.preparar_exercicio(2030)
+        self.assertEqual(Numerador.numerar(2030), 1)
+        self.assertEqual(Numerador.numerar(2031), 1)
+        self.assertEqual(Numerador.numerar(2030), 2)
+
+    def test_sem_lacunas_quando_a_inclusao_falha(self):
+        pedido = PedidoInformacao(titulo="Sem requerente", descricao="Descrição")
+        with self.assertRaises(Exception):
+            pedido.save()
+        self.assertIsNone(pedido.num_registro)
+        self.assertEqual(Numerador.numerar(), 1)
+
+    def test_comando_prepara_o_proximo_exercicio(self):
+        call_command('preparar_numerador', stdout=io.StringIO())
+        self.assertTrue(Numerador.objects.filter(exercicio_num=self.exercicio + 1).exists())
+
+
+def _numerar_em_processo(quantidade, fila):
+    # Executado em um processo filho: abre conexões próprias com o banco de teste
+    connections.close_all()
+    try:
+        fila.put([Numerador.numerar() for _ in range(quantidade)])
+    finally:
+        connections.close_all()
+
+
+# Estressa o numerador com várias threads e processos, informando números por segundo
+@unittest.skipUnless(connection.vendor == 'postgresql', "Requer PostgreSQL")
+class NumeradorEstresseTeste(NumeradorMixin, TransactionTestCase):
+
+    CONCORRENTES = 8
+    POR_CONCORRENTE = 50
+
+    def relatar(self, modo, numeros, duracao):
+        total = self.CONCORRENTES * self.POR_CONCORRENTE
+        sys.stderr.write(f"\nNumerador ({modo}): {total} números em {duracao:.2f}s "
+                         f"({total / duracao:.0f} números/s)\n")
+        self.assertEqual(sorted(numeros), list(range(1, total + 1)))
+
+    def test_threads(self):
+        numeros = []
+        trava = threading.Lock()
+
+        def numerar():
+            try:
+                obtidos = [Numerador.numerar() for _ in range(self.POR_CONCORRENTE)]
+                with trava:
+                    numeros.extend(obtidos)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=numerar) for _ in range(self.CONCORRENTES)]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.relatar("threads", numeros, time.perf_counter() - inicio)
+
+    def test_processos(self):
+        contexto = multiprocessing.get_context('fork')
+        fila = contexto.Queue()
+        connections.close_all()
+
+        processos = [contexto.Process(target=_numerar_em_processo, args=(self.POR_CONCORRENTE, fila))
+                     for _ in range(self.CONCORRENTES)]
+        inicio = time.perf_counter()
+        for processo in processos:
+            processo.start()
+        numeros = []
+        for _ in processos:
+            numeros.extend(fila.get(timeout=60))
+        for processo in processos:
+            processo.join()
+        self.relatar("processos", numeros, time.perf_counter() - inicio)
+
+# Testa o cache da configuração global e sua invalidação por versão
+class ConfiguracaoCacheTeste(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        Configuracao.limpar_cache()
+        CalendarioUteis.limpar_cache()
+        self.setor_adm = Setor.objects.create(nome="Administração", sigla="ADM")
+        self.setor_jur = Setor.objects.create(nome="Jurídico", sigla="JUR")
+        Configuracao(setor_adm=self.setor_adm, setor_parecer=self.setor_jur).save()
+        cargo = Cargo.objects.create(nome="Analista")
+        self.funcionario = Funcionario.objects.create(nome="Maria", matricula="1",
+                                                      cargo=cargo, lotacao=self.setor_adm)
+
+    def test_papeis_sem_consultas(self):
+        Configuracao.load()
+        with self.assertNumQueries(0):
+            self.assertTrue(self.funcionario.analisa_ped_info())
+            self.assertFalse(self.funcionario.emite_parecer())
+            self.assertFalse(self.funcionario.responde_ped_info())
+            self.assertFalse(self.funcionario.responde_recurso_1())
+            self.assertFalse(self.funcionario.responde_recurso_2())
+            self.assertEqual(Configuracao.load().setor_adm.nome, "Administração")
+
+    def test_save_invalida_cache(self):
+        config = Configuracao.load()
+        config.setor_adm = self.setor_jur
+        config.save()
+        self.assertFalse(self.funcionario.analisa_ped_info())
+
+    def test_versao_alterada_por_outro_processo(self):
+        Configuracao.load()
+        Configuracao.objects.filter(pk=1).update(setor_adm=self.setor_jur)
+        # Sem mudança de versão a cópia local continua valendo
+        Configuracao.exigir_conferencia()
+        self.assertTrue(self.funcionario.analisa_ped_info())
+        # Outro processo salvou a configuração e incrementou a versão
+        cache.incr(Configuracao.chave_versao())
+        Configuracao.exigir_conferencia()
+        self.assertFalse(self.funcionario.analisa_ped_info())
+
+    def test_versao_incrementada_apos_o_commit(self):
+        chave = Configuracao.chave_versao()
+        config = Configuracao.load()
+        versao = cache.get(chave)
+        with self.captureOnCommitCallbacks() as callbacks:
+            config.setor_adm = self.setor_jur
+            config.save()
+            # Antes do commit os outros processos não podem recarregar
+            self.assertEqual(cache.get(chave), versao)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(cache.get(chave), versao + 1)
+
+    def test_exige_cache_compartilhado(self):
+        self.assertEqual(cache_compartilhado(None), [])
+        with self.settings(CACHES=CACHE_LOCAL):
+            erros = cache_compartilhado(None)
+        self.assertEqual([erro.id for erro in erros], ['lai_app.E001'])
+
+# Testa a resolução dos papéis do usuário por requisição
+@override_settings(CACHES=CACHE_LOCAL)
+class PapeisTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        Configuracao.load()
+
+    def test_resolver_papeis(self):
+        with self.assertNumQueries(1):
+            papeis = resolver_papeis(self.funcionarios['JUR'].credenciais)
+        self.assertTrue(papeis.parecer)
+        self.assertFalse(papeis.adm or papeis.resposta or papeis.recurso_1 or papeis.recurso_2)
+        self.assertTrue(papeis.fornece(self.setores['JUR'].pk))
+        self.assertFalse(papeis.fornece(self.setores['FIN'].pk))
+        self.assertIsNone(papeis.cidadao)
+
+        papeis = resolver_papeis(self.cidadao.credenciais)
+        self.assertEqual(papeis.cidadao, self.cidadao)
+        self.assertIsNone(papeis.funcionario)
+        self.assertFalse(papeis.fornece(None))
+
+        with self.assertNumQueries(0):
+            self.assertIs(resolver_papeis(AnonymousUser()), SEM_PAPEIS)
+
+    def test_consultas_menu(self):
+        # Sessão, usuário e papéis; para funcionários, também as contagens das filas
+        for usuario, consultas in ((self.funcionarios['ADM'].credenciais, 4), (self.cidadao.credenciais, 3)):
+            self.client.force_login(usuario)
+            with self.assertNumQueries(consultas):
+                resposta = self.client.get(reverse('menu'))
+            self.assertEqual(resposta.status_code, 200)
+
+    def test_menu_por_papel(self):
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+        resposta = self.client.get(reverse('menu'))
+        self.assertContains(resposta, reverse('ped_infos_analise'))
+        self.assertNotContains(resposta, reverse('ped_infos_parecer'))
+        self.assertContains(resposta, "Funcionário ADM")
+
+        self.client.force_login(self.cidadao.credenciais)
+        resposta = self.client.get(reverse('menu'))
+        self.assertContains(resposta, reverse('req_info'))
+        self.assertNotContains(resposta, reverse('ped_infos_fornecimento'))
+
+    def test_acesso_negado_sem_papel(self):
+        self.client.force_login(self.funcionarios['FIN'].credenciais)
+        self.assertEqual(self.client.get(reverse('ped_infos_analise')).status_code, 403)
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+        self.assertEqual(self.client.get(reverse('ped_infos_analise')).status_code, 200)
+
+# Testa o número de consultas das etapas do fluxo, que carregam o pedido uma única vez
+@override_settings(CACHES=CACHE_LOCAL)
+class EtapasPedInfoTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        Configuracao.load()
+        prazo = now() + timedelta(days=10)
+        fin = self.setores['FIN']
+        self.casos = [
+            # (rota, situação, usuário, consultas, campos)
+            ('analisar_ped_info', 'AI', self.funcionarios['ADM'].credenciais, 6, {}),
+            ('fornecer_ped_info', 'BI', self.funcionarios['FIN'].credenciais, 5, {'setor_info': fin}),
+            ('parecer_ped_info', 'EP', self.funcionarios['JUR'].credenciais, 5, {}),
+            ('resposta_ped_info', 'DR', self.funcionarios['GAB'].credenciais, 5, {}),
+            ('recurso1_ped_info', 'PR', self.cidadao.credenciais, 4,
+             {'prazo_recurso_1': prazo, 'func_resp_inicial': self.funcionarios['GAB']}),
+            ('resposta_rec_1', 'AR', self.funcionarios['REC1'].credenciais, 5, {}),
+            ('recurso2_ped_info', 'RR', self.cidadao.credenciais, 4,
+             {'prazo_recurso_2': prazo, 'func_resp_recurso_1': self.funcionarios['REC1']}),
+            ('resposta_rec_2', 'AF', self.funcionarios['REC2'].credenciais, 5, {}),
+            ('detalhes_ped_info', 'EP', self.funcionarios['ADM'].credenciais, 5,
+             {'setor_info': fin, 'func_adm': self.funcionarios['ADM']}),
+        ]
+
+    def test_consultas_por_etapa(self):
+        # Sessão, usuário, papéis e o pedido com seus relacionados (mais as opções do
+        # formulário); para funcionários, também as contagens das filas
+        for rota, situacao, usuario, consultas, campos in self.casos:
+            with self.subTest(rota=rota):
+                ped_info = self.criar_pedido(situacao, **campos)
+                self.client.force_login(usuario)
+                with self.assertNumQueries(consultas):
+                    resposta = self.client.get(reverse(rota, args=[ped_info.pk]))
+                self.assertEqual(resposta.status_code, 200)
+
+    def test_etapa_com_situacao_errada(self):
+        ped_info = self.criar_pedido('BI')
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+        resposta = self.client.get(reverse('analisar_ped_info', args=[ped_info.pk]))
+        self.assertEqual(resposta.status_code, 403)
+
+# Testa a máquina de transições do fluxo do pedido de informação
+class TransicoesTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+
+    def test_tabela_compilada(self):
+        self.assertEqual([(t.origem, t.destino) for t in TRANSICOES.values()],
+                         [('AI', 'BI'), ('BI', 'EP'), ('EP', 'DR'), ('DR', 'PR'),
+                          ('PR', 'AR'), ('AR', 'RR'), ('RR', 'AF'), ('AF', 'RF')])
+
+    def test_atualiza_apenas_campos_da_etapa(self):
+        ped_info = self.criar_pedido('EP')
+        ped_info.titulo = "Alterado sem permissão"
+        transitar(ped_info, parecer="Parecer", func_parecer=self.funcionarios['JUR'], data_parecer=now())
+
+        ped_info.refresh_from_db()
+        self.assertEqual(ped_info.situacao, 'DR')
+        self.assertEqual(ped_info.parecer, "Parecer")
+        self.assertEqual(ped_info.titulo, "Pedido")
+
+    def test_conflito_entre_submissoes(self):
+        ped_info = self.criar_pedido('AI')
+        primeira = PedidoInformacao.objects.get(pk=ped_info.pk)
+        segunda = PedidoInformacao.objects.get(pk=ped_info.pk)
+
+        transitar(primeira, setor_info=self.setores['FIN'], func_adm=self.funcionarios['ADM'], data_encam=now())
+        with self.assertRaises(ConflitoTransicao):
+            transitar(segunda, setor_info=self.setores['JUR'], func_adm=self.funcionarios['ADM'], data_encam=now())
+
+        ped_info.refresh_from_db()
+        self.assertEqual(ped_info.situacao, 'BI')
+        self.assertEqual(ped_info.setor_info, self.setores['FIN'])
+
+    def test_conflito_remove_arquivo_enviado(self):
+        ped_info = self.criar_pedido('BI', setor_info=self.setores['FIN'])
+        atrasado = PedidoInformacao.objects.get(pk=ped_info.pk)
+        media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(MEDIA_ROOT=media))
+
+        transitar(ped_info, arquivo_info=ContentFile(b'primeiro', name='primeiro.pdf'),
+                  func_fornec=self.funcionarios['FIN'], data_fornec=now())
+        with self.assertRaises(ConflitoTransicao):
+            transitar(atrasado, arquivo_info=ContentFile(b'segundo', name='segundo.pdf'),
+                      func_fornec=self.funcionarios['FIN'], data_fornec=now())
+
+        ped_info.refresh_from_db()
+        self.assertEqual(os.listdir(os.path.join(media, 'documentos')),
+                         [os.path.basename(ped_info.arquivo_info.name)])
+
+    def test_submissao_pela_view(self):
+        ped_info = self.criar_pedido('AI')
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+        resposta = self.client.post(reverse('analisar_ped_info', args=[ped_info.pk]),
+                                    {'setor_info': self.setores['FIN'].pk})
+        self.assertRedirects(resposta, reverse('ped_infos_analise'))
+
+        ped_info.refresh_from_db()
+        self.assertEqual(ped_info.situacao, 'BI')
+        self.assertEqual(ped_info.func_adm, self.funcionarios['ADM'])
+
+
+# Testa o prazo de recurso fixado nas transições e a leitura dos detalhes sem escrita
+class PrazosRecursoTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+
+    def test_indeferimento_abre_prazo(self):
+        ped_info = self.criar_pedido('DR')
+        resposta = now()
+        transitar(ped_info, resp_inicial=False, just_resp_inicial="Sigilo",
+                  func_resp_inicial=self.funcionarios['GAB'], data_resp_inicial=resposta)
+
+        ped_info.refresh_from_db()
+        self.assertEqual(ped_info.situacao, 'PR')
+        self.assertEqual(ped_info.prazo_recurso_1, prazo_em_dias_uteis(resposta, DIAS_RECURSO))
+
+        ped_info = self.criar_pedido('AR', recurso_1="Recurso")
+        transitar(ped_info, resp_recurso_1=False, just_resp_recurso_1="Mantido",
+                  func_resp_recurso_1=self.funcionarios['REC1'], data_resp_recurso_1=resposta)
+
+        ped_info.refresh_from_db()
+        self.assertEqual(ped_info.situacao, 'RR')
+        self.assertEqual(ped_info.prazo_recurso_2, prazo_em_dias_uteis(resposta, DIAS_RECURSO))
+
+    def test_deferimento_nao_abre_prazo(self):
+        ped_info = self.criar_pedido('DR')
+        transitar(ped_info, resp_inicial=True, func_resp_inicial=self.funcionarios['GAB'],
+                  data_resp_inicial=now())
+
+        ped_info.refresh_from_db()
+        self.assertEqual(ped_info.situacao, 'PR')
+        self.assertIsNone(ped_info.prazo_recurso_1)
+
+    def test_detalhes_sem_escrita(self):
+        ped_info = self.criar_pedido('PR', resp_inicial=False, data_resp_inicial=now())
+        self.client.force_login(self.cidadao.credenciais)
+
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('detalhes_ped_info', args=[ped_info.pk]))
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse([c['sql'] for c in consultas
+                          if 'UPDATE "lai_app_pedidoinformacao"' in c['sql']])
+        ped_info.refresh_from_db()
+        self.assertIsNone(ped_info.prazo_recurso_1)
+
+    def test_preenchimento_em_lotes(self):
+        resposta = now() - timedelta(days=3)
+        sem_prazo = [self.criar_pedido('PR', resp_inicial=False, data_resp_inicial=resposta)
+                     for _ in range(5)]
+        deferido = self.criar_pedido('PR', resp_inicial=True, data_resp_inicial=resposta)
+        recurso = self.criar_pedido('RR', resp_recurso_1=False, data_resp_recurso_1=resposta)
+        com_prazo = self.criar_pedido('PR', resp_inicial=False, data_resp_inicial=resposta,
+                                      prazo_recurso_1=resposta)
+
+        saida = io.StringIO()
+        call_command('preencher_prazos', lote=2, stdout=saida)
+
+        self.assertIn("prazo_recurso_1: 5 pedido(s)", saida.getvalue())
+        for ped_info in sem_prazo:
+            ped_info.refresh_from_db()
+            self.assertEqual(ped_info.prazo_recurso_1, prazo_em_dias_uteis(resposta, DIAS_RECURSO))
+        deferido.refresh_from_db()
+        self.assertIsNone(deferido.prazo_recurso_1)
+        recurso.refresh_from_db()
+        self.assertEqual(recurso.prazo_recurso_2, prazo_em_dias_uteis(resposta, DIAS_RECURSO))
+        com_prazo.refresh_from_db()
+        self.assertEqual(com_prazo.prazo_recurso_1, resposta)
+
+
+# Testa o calendário de dias úteis e o recálculo dos prazos quando os feriados mudam
+class CalendarioTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+
+    def test_fins_de_semana_e_feriados(self):
+        # 07/03/2025 é uma sexta-feira
+        self.assertEqual(somar_dias_uteis(date(2025, 3, 7), 1), date(2025, 3, 10))
+        self.assertEqual(somar_dias_uteis(date(2025, 3, 8), 1), date(2025, 3, 10))
+        self.assertEqual(somar_dias_uteis(date(2025, 3, 7), 10), date(2025, 3, 21))
+
+        Feriado.objects.create(data=date(2025, 3, 10), descricao="Aniversário da cidade")
+        self.assertEqual(somar_dias_uteis(date(2025, 3, 7), 1), date(2025, 3, 11))
+        self.assertEqual(somar_dias_uteis(date(2025, 3, 7), 10), date(2025, 3, 24))
+
+    def test_virada_do_ano(self):
+        Feriado.objects.create(data=date(2026, 1, 1), descricao="Confraternização Universal")
+        self.assertEqual(somar_dias_uteis(date(2025, 12, 30), 3), date(2026, 1, 5))
+        # Datas fora do intervalo indexado ampliam o índice
+        self.assertEqual(somar_dias_uteis(date(2031, 12, 31), 1), date(2032, 1, 1))
+
+    def test_prazo_vence_no_fim_do_dia(self):
+        prazo = localtime(prazo_em_dias_uteis(make_aware(datetime(2025, 3, 7, 15, 30)), 1))
+        self.assertEqual(prazo.date(), date(2025, 3, 10))
+        self.assertEqual((prazo.hour, prazo.minute), (23, 59))
+
+    def test_recalculo_em_conjunto(self):
+        resposta = make_aware(datetime(2025, 3, 7, 15, 30))
+        ped_info = self.criar_pedido('DR')
+        transitar(ped_info, resp_inicial=False, just_resp_inicial="Sigilo",
+                  func_resp_inicial=self.funcionarios['GAB'], data_resp_inicial=resposta)
+        recorrido = self.criar_pedido('AR', prazo_recurso_1=resposta)
+        transitar(recorrido, resp_recurso_1=False, just_resp_recurso_1="Mantido",
+                  func_resp_recurso_1=self.funcionarios['REC1'], data_resp_recurso_1=resposta)
+
+        Feriado.objects.create(data=date(2025, 3, 10), descricao="Aniversário da cidade")
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(recalcular_prazos(),
+                             {'prazo_resposta': 0, 'prazo_recurso_1': 1, 'prazo_recurso_2': 1})
+        self.assertEqual(len([c for c in consultas if c['sql'].startswith('UPDATE')]), 2)
+
+        ped_info.refresh_from_db()
+        recorrido.refresh_from_db()
+        self.assertEqual(localtime(ped_info.prazo_recurso_1).date(), date(2025, 3, 24))
+        self.assertEqual(ped_info.prazo_recurso_1, prazo_em_dias_uteis(resposta, DIAS_RECURSO))
+        self.assertEqual(recorrido.prazo_recurso_2, ped_info.prazo_recurso_1)
+        # O prazo da instância já encerrada não é alterado
+        self.assertEqual(recorrido.prazo_recurso_1, resposta)
+
+    def test_feriado_recalcula_prazos_apos_o_commit(self):
+        resposta = make_aware(datetime(2025, 3, 7, 15, 30))
+        ped_info = self.criar_pedido('DR')
+        transitar(ped_info, resp_inicial=False, just_resp_inicial="Sigilo",
+                  func_resp_inicial=self.funcionarios['GAB'], data_resp_inicial=resposta)
+        anterior = ped_info.prazo_recurso_1
+
+        # Feriado carregado como numa fixture (save "raw", sem passar por Feriado.save)
+        fixture = '[{"model": "lai_app.feriado", "fields": {"data": "2025-03-10", "descricao": "Aniversário"}}]'
+        with self.captureOnCommitCallbacks(execute=True):
+            for objeto in serializers.deserialize('json', fixture):
+                objeto.save()
+        ped_info.refresh_from_db()
+        self.assertEqual(ped_info.prazo_recurso_1, prazo_em_dias_uteis(resposta, DIAS_RECURSO))
+        self.assertGreater(ped_info.prazo_recurso_1, anterior)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Feriado.objects.all().delete()
+        ped_info.refresh_from_db()
+        self.assertEqual(ped_info.prazo_recurso_1, anterior)
+
+    def test_feriados_recalculam_uma_vez_por_transacao(self):
+        resposta = make_aware(datetime(2025, 3, 7, 15, 30))
+        ped_info = self.criar_pedido('DR')
+        transitar(ped_info, resp_inicial=False, just_resp_inicial="Sigilo",
+                  func_resp_inicial=self.funcionarios['GAB'], data_resp_inicial=resposta)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                for dia in (10, 11, 12):
+                    Feriado.objects.create(data=date(2025, 3, dia), descricao=f"Feriado {dia}")
+        self.assertEqual(len(callbacks), 1)
+        ped_info.refresh_from_db()
+        self.assertEqual(ped_info.prazo_recurso_1, prazo_em_dias_uteis(resposta, DIAS_RECURSO))
+
+        # Alterações desfeitas num savepoint não deixam o recálculo de fora
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    Feriado.objects.create(data=date(2025, 3, 13), descricao="Desfeito")
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            Feriado.objects.filter(data=date(2025, 3, 12)).delete()
+        self.assertEqual(len(callbacks), 1)
+
+
+# Testa os prazos gravados e o painel de prazos por setor
+class PrazosSetorTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        agora = now()
+        self.atrasado = self.criar_pedido('DR', prazo_resposta=agora - timedelta(days=1))
+        self.vencendo = self.criar_pedido('DR', prazo_resposta=agora + timedelta(hours=1))
+        self.no_prazo = self.criar_pedido('DR', prazo_resposta=agora + timedelta(days=30))
+        self.fornecimento = self.criar_pedido('BI', setor_info=self.setores['FIN'],
+                                              prazo_resposta=agora - timedelta(days=1))
+        self.recurso = self.criar_pedido('PR', prazo_recurso_1=agora + timedelta(days=2))
+        self.recurso_vencido = self.criar_pedido('PR', prazo_recurso_1=agora - timedelta(days=2))
+
+    def painel(self, sigla, **parametros):
+        self.client.force_login(self.funcionarios[sigla].credenciais)
+        resposta = self.client.get(reverse('prazos_setor'), parametros)
+        self.assertEqual(resposta.status_code, 200)
+        return {lista: [item['id'] for item in resposta.context[lista]['itens']]
+                for lista in ('atrasados', 'vencendo', 'recursos_abertos')}
+
+    def test_prazo_resposta_na_criacao(self):
+        ped_info = self.criar_pedido()
+        self.assertEqual(ped_info.prazo_resposta, prazo_em_dias_uteis(ped_info.data_pedido, 20))
+
+    def test_painel_do_setor(self):
+        self.assertEqual(self.painel('GAB'), {'atrasados': [self.atrasado.pk],
+                                              'vencendo': [self.vencendo.pk],
+                                              'recursos_abertos': []})
+        self.assertEqual(self.painel('FIN'), {'atrasados': [self.fornecimento.pk],
+                                              'vencendo': [], 'recursos_abertos': []})
+        self.assertEqual(self.painel('REC1'), {'atrasados': [], 'vencendo': [],
+                                               'recursos_abertos': [self.recurso.pk]})
+
+    def test_adm_escolhe_o_setor(self):
+        self.assertEqual(self.painel('ADM', setor=self.setores['GAB'].pk)['atrasados'], [self.atrasado.pk])
+        self.assertEqual(self.painel('JUR', setor=self.setores['GAB'].pk)['atrasados'], [])
+
+    def test_recursos_abertos_como_oportunidade_recurso(self):
+        abertos = set(PedidoInformacao.objects.recursos_abertos(now()).values_list('pk', flat=True))
+        esperados = {ped_info.pk for ped_info in PedidoInformacao.objects.all()
+                     if ped_info.oportunidade_recurso_1() or ped_info.oportunidade_recurso_2()}
+        self.assertEqual(abertos, esperados)
+
+    def test_cidadao_sem_acesso(self):
+        self.client.force_login(self.cidadao.credenciais)
+        self.assertEqual(self.client.get(reverse('prazos_setor')).status_code, 403)
+
+
+# Testa o resumo materializado do relatório anual, a atualização incremental a
+# partir da marca d'água e a exibição em HTML e JSON
+class RelatorioAnualTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        inicio = make_aware(datetime(2025, 1, 10, 9))
+        dia = timedelta(days=1)
+
+        self.deferido = self.criar_pedido('PR')
+        self.recurso = self.criar_pedido('RR')
+        self.novo = self.criar_pedido('AI')
+        PedidoInformacao.objects.filter(pk__in=[self.deferido.pk, self.recurso.pk]).update(
+            data_pedido=inicio, setor_info=self.setores['FIN'], data_encam=inicio + dia,
+            data_fornec=inicio + 3 * dia, data_parecer=inicio + 4 * dia, data_resp_inicial=inicio + 5 * dia)
+        PedidoInformacao.objects.filter(pk=self.deferido.pk).update(resp_inicial=True)
+        PedidoInformacao.objects.filter(pk=self.recurso.pk).update(
+            data_recurso_1=inicio + 6 * dia, resp_recurso_1=True, data_resp_recurso_1=inicio + 8 * dia)
+        PedidoInformacao.objects.filter(pk=self.novo.pk).update(data_pedido=inicio + 30 * dia)
+        # Movimentações antigas, fora da margem da marca d'água
+        PedidoInformacao.objects.update(atualizado_em=now() - timedelta(days=1))
+
+    def test_resumo_e_relatorio(self):
+        self.assertEqual(relatorio.atualizar_resumo(), [(2025, 1), (2025, 2)])
+
+        with CaptureQueriesContext(connection) as consultas:
+            dados = relatorio.relatorio_anual(2025)
+        self.assertFalse([c for c in consultas.captured_queries if 'lai_app_pedidoinformacao' in c['sql']])
+
+        self.assertEqual((dados['recebidos'], dados['deferidos'], dados['indeferidos'], dados['em_tramitacao']),
+                         (3, 2, 0, 1))
+        self.assertEqual((dados['recursos_1'], dados['recursos_2']), (1, 0))
+        self.assertEqual(dados['meses'][0]['recebidos'], 2)
+        self.assertEqual(dados['meses'][1]['em_tramitacao'], 1)
+        self.assertEqual([(setor['setor'], setor['recebidos']) for setor in dados['setores']],
+                         [("Não encaminhado", 1), ("Setor FIN", 2)])
+        duracoes = {etapa['etapa']: etapa for etapa in dados['duracoes']}
+        self.assertEqual((duracoes['total']['pedidos'], duracoes['total']['media_dias']), (2, 5.0))
+        self.assertEqual(duracoes['fornecimento']['media_dias'], 2.0)
+
+    def test_atualizacao_incremental(self):
+        relatorio.atualizar_resumo()
+        transitar(self.novo, setor_info=self.setores['JUR'], func_adm=self.funcionarios['ADM'], data_encam=now())
+
+        # Só o mês do pedido movimentado é refeito
+        self.assertEqual(relatorio.atualizar_resumo(), [(2025, 2)])
+        self.assertEqual(ResumoPedidos.objects.get(ano=2025, mes=2).setor_info, self.setores['JUR'])
+        self.assertEqual(ResumoPedidos.objects.filter(ano=2025, mes=1).count(), 2)
+        self.assertEqual(relatorio.atualizar_resumo(completo=True), [(2025, 1), (2025, 2)])
+
+    def test_percentis_do_histograma(self):
+        duracoes, metade = relatorio.Duracoes(), relatorio.Duracoes()
+        for horas in range(1, 101):
+            (duracoes if horas % 2 else metade).incluir(horas * 3600)
+        duracoes.somar(metade.como_dict())
+
+        self.assertEqual(duracoes.n, 100)
+        self.assertEqual(duracoes.media(), 50.5 * 3600)
+        self.assertEqual(duracoes.percentil(50), 50 * 3600)
+        self.assertEqual(duracoes.percentil(90), 90 * 3600)
+        self.assertEqual(duracoes.percentil(100), 100 * 3600)
+
+    def test_html_json_e_comando(self):
+        saida = io.StringIO()
+        call_command('atualizar_relatorio', stdout=saida)
+        self.assertIn("2 mês(es) atualizado(s)", saida.getvalue())
+
+        resposta = self.client.get(reverse('relatorio_anual'), {'ano': 2025})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, "Setor FIN")
+        # O ano corrente é sempre oferecido, mesmo sem pedidos
+        self.assertEqual(resposta.context['anos'], sorted({2025, localdate().year}, reverse=True))
+
+        dados = self.client.get(reverse('relatorio_anual'), {'ano': 2025, 'formato': 'json'}).json()
+        self.assertEqual(dados['recebidos'], 3)
+        self.assertIsNotNone(dados['atualizado_ate'])
+
+
+# Testa as contagens por situação e setor, mantidas nas transições, e o seu uso
+# na barra de navegação e no painel do menu
+class ContagensTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+
+    def contagem(self, situacao, setor=None):
+        contagem = ContagemPedidos.objects.filter(situacao=situacao, setor=setor).first()
+        return contagem.total if contagem else 0
+
+    def test_inclusao_e_transicoes(self):
+        pedidos = [self.criar_pedido() for _ in range(3)]
+        self.assertEqual(self.contagem('AI'), 3)
+
+        transitar(pedidos[0], setor_info=self.setores['FIN'], func_adm=self.funcionarios['ADM'], data_encam=now())
+        self.assertEqual(self.contagem('AI'), 2)
+        self.assertEqual(self.contagem('BI', self.setores['FIN']), 1)
+
+        transitar(pedidos[0], observacoes_forn="Segue", func_fornec=self.funcionarios['FIN'], data_fornec=now())
+        self.assertEqual(self.contagem('BI', self.setores['FIN']), 0)
+        self.assertEqual(self.contagem('EP', self.setores['FIN']), 1)
+
+    def test_analise_inicial_pela_view(self):
+        # O formulário atribui o novo setor à instância antes da transição; a
+        # contagem baixada deve ser a do setor gravado (nenhum, em 'AI')
+        ped_info = self.criar_pedido()
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+        resposta = self.client.post(reverse('analisar_ped_info', args=[ped_info.pk]),
+                                    {'setor_info': self.setores['FIN'].pk})
+        self.assertEqual(resposta.status_code, 302)
+
+        self.assertEqual(self.contagem('AI'), 0)
+        self.assertEqual(self.contagem('AI', self.setores['FIN']), 0)
+        self.assertEqual(self.contagem('BI', self.setores['FIN']), 1)
+        self.assertEqual(ContagemPedidos.reconciliar(), {})
+
+    def test_conflito_nao_altera_contagens(self):
+        ped_info = self.criar_pedido()
+        segunda = PedidoInformacao.objects.get(pk=ped_info.pk)
+        transitar(ped_info, setor_info=self.setores['FIN'], func_adm=self.funcionarios['ADM'], data_encam=now())
+        with self.assertRaises(ConflitoTransicao):
+            transitar(segunda, setor_info=self.setores['JUR'], func_adm=self.funcionarios['ADM'], data_encam=now())
+
+        self.assertEqual(self.contagem('AI'), 0)
+        self.assertEqual(self.contagem('BI', self.setores['FIN']), 1)
+        self.assertEqual(self.contagem('BI', self.setores['JUR']), 0)
+
+    def test_reconciliacao(self):
+        self.criar_pedido()
+        # Inclusões em massa não passam por save() e não atualizam as contagens
+        PedidoInformacao.objects.bulk_create(
+            PedidoInformacao(num_registro=100 + i, ano=2025, titulo="Pedido", descricao="Descrição",
+                             requerente=self.cidadao, situacao='BI', setor_info=self.setores['FIN'])
+            for i in range(4))
+        self.assertEqual(self.contagem('BI', self.setores['FIN']), 0)
+
+        saida = io.StringIO()
+        call_command('reconciliar_contagens', stdout=saida)
+        self.assertIn("1 contagem(ns) corrigida(s)", saida.getvalue())
+        self.assertEqual(self.contagem('AI'), 1)
+        self.assertEqual(self.contagem('BI', self.setores['FIN']), 4)
+        self.assertEqual(ContagemPedidos.reconciliar(), {})
+
+    def test_indicadores_e_painel(self):
+        for _ in range(2):
+            self.criar_pedido()
+        self.criar_pedido('BI', setor_info=self.setores['FIN'])
+
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+        resposta = self.client.get(reverse('menu'))
+        self.assertEqual(resposta.context['filas']['analise'], 2)
+        self.assertEqual(resposta.context['filas']['fornecimento'], 0)
+        self.assertIn(("Análise Inicial", 2), resposta.context['painel']['situacoes'])
+        self.assertEqual(resposta.context['painel']['fornecimento'], [("Setor FIN", 1)])
+
+        self.client.force_login(self.funcionarios['FIN'].credenciais)
+        resposta = self.client.get(reverse('menu'))
+        self.assertEqual(dict(resposta.context['filas']), {'fornecimento': 1})
+        self.assertNotIn('fornecimento', resposta.context['painel'])
+
+        self.client.force_login(self.cidadao.credenciais)
+        resposta = self.client.get(reverse('menu'))
+        self.assertNotIn('painel', resposta.context)
+
+
+# Testa submissões simultâneas da mesma etapa em conexões distintas
+@unittest.skipUnless(connection.vendor == 'postgresql', "Requer PostgreSQL")
+class TransicoesConcorrentesTeste(CenarioMixin, TransactionTestCase):
+
+    SUBMISSOES = 8
+
+    def setUp(self):
+        self.criar_cenario()
+
+    def test_apenas_uma_transicao(self):
+        ped_info = self.criar_pedido('EP')
+        barreira = threading.Barrier(self.SUBMISSOES)
+        resultados = []
+
+        def submeter(i):
+            try:
+                instancia = PedidoInformacao.objects.get(pk=ped_info.pk)
+                barreira.wait()
+                try:
+                    transitar(instancia, parecer=f"Parecer {i}",
+                              func_parecer_id=self.funcionarios['JUR'].pk, data_parecer=now())
+                    resultados.append(i)
+                except ConflitoTransicao:
+                    pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submeter, args=(i,)) for i in range(self.SUBMISSOES)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(resultados), 1)
+        ped_info.refresh_from_db()
+        self.assertEqual(ped_info.situacao, 'DR')
+        self.assertEqual(ped_info.parecer, f"Parecer {resultados[0]}")
+        self.assertEqual(ContagemPedidos.objects.get(situacao='EP', setor=None).total, 0)
+        self.assertEqual(ContagemPedidos.objects.get(situacao='DR', setor=None).total, 1)
+
+# Verifica, com EXPLAIN sobre uma base semeada com distribuição realista e
+# estatísticas atualizadas, que cada fila ou consulta usa o índice previsto
+@unittest.skipUnless(connection.vendor == 'postgresql', "Requer PostgreSQL")
+class PlanosConsultaTeste(CenarioMixin, TestCase):
+
+    PEDIDOS = 10000
+    CIDADAOS = 500
+    ASSUNTOS = ("licitação", "obras", "saúde", "transporte", "folha de pagamento", "convênios", "diárias")
+    # Situação de cada 100 pedidos: a maior parte já respondida, poucos nas filas
+    SITUACOES = (['AI'] * 2 + ['BI'] * 3 + ['EP'] * 2 + ['DR'] * 2 + ['PR'] * 45 + ['AR'] * 1 +
+                 ['RR'] * 15 + ['AF'] * 1 + ['RF'] * 29)
+
+    def setUp(self):
+        self.criar_cenario()
+        requerentes = [self.cidadao] + Cidadao.objects.bulk_create(
+            Cidadao(nome=f"Cidadão {i}", nome_busca=f"cidadao {i}", num_doc_id=f"{i:09d}", cep="12345678",
+                    logradouro="Rua B", numero=str(i), bairro="Centro", cidade="Cidade X", estado="XX")
+            for i in range(1, self.CIDADAOS))
+        setores = list(self.setores.values())
+        agora = now()
+        PedidoInformacao.objects.bulk_create(
+            PedidoInformacao(num_registro=i, ano=2020 + i % 6, titulo=f"Pedido sobre {self.ASSUNTOS[i % 7]}",
+                             # Um assunto raro, que a busca textual encontra pelo índice
+                             descricao="Cardápio da merenda escolar" if i % 250 == 0 else "Descrição",
+                             requerente=requerentes[i % len(requerentes)],
+                             situacao=self.SITUACOES[i % 100], setor_info=setores[i % len(setores)],
+                             data_recurso_1=agora, data_recurso_2=agora,
+                             prazo_resposta=agora + timedelta(days=i % 40 - 20),
+                             prazo_recurso_1=agora + timedelta(days=i % 20 - 10),
+                             prazo_recurso_2=agora + timedelta(days=i % 20 - 10))
+            for i in range(1, self.PEDIDOS + 1))
+
+        with connection.cursor() as cursor:
+            # data_pedido (auto_now_add) espalhada ao longo do ano de cada pedido
+            cursor.execute("UPDATE lai_app_pedidoinformacao SET data_pedido = "
+                           "make_timestamptz(ano, 1, 1, 12, 0, 0) + (num_registro %% 360) * interval '1 day'", [])
+            # As inclusões recentes ficam na lista pendente do GIN até o próximo
+            # VACUUM, que não roda dentro da transação do teste
+            cursor.execute("SELECT gin_clean_pending_list('ped_info_busca_gin_idx')")
+            cursor.execute("ANALYZE lai_app_pedidoinformacao")
+            cursor.execute("ANALYZE lai_app_cidadao")
+
+    # As filas do setor administrativo, do parecer e da resposta podem usar o índice
+    # parcial das filas ou o de situação e data, que têm as mesmas colunas
+    FILAS = '(ped_info_fila_idx|ped_info_situacao_data_idx)'
+
+    def assertUsaIndice(self, queryset, indice):
+        plano = queryset.explain()
+        self.assertNotIn("Seq Scan on lai_app_pedidoinformacao", plano)
+        self.assertRegex(plano, rf"(Index Scan(?: Backward)? using|Bitmap Index Scan on) {indice} ")
+
+    def casos(self):
+        adm = self.funcionarios['ADM'].credenciais
+        return [
+            (views.ConsultaPedInfosAnaliseInicial, adm, {}, self.FILAS),
+            (views.ConsultaPedInfosFornecInfo, self.funcionarios['FIN'].credenciais, {}, 'ped_info_fornec_idx'),
+            (views.ConsultaPedInfosParecer, self.funcionarios['JUR'].credenciais, {}, self.FILAS),
+            (views.ConsultaPedInfosRespInicial, self.funcionarios['GAB'].credenciais, {}, self.FILAS),
+            (views.ConsultaPedInfosRecPrimInst, self.funcionarios['REC1'].credenciais, {}, 'ped_info_recurso_1_idx'),
+            (views.ConsultaPedInfosRecSegInst, self.funcionarios['REC2'].credenciais, {}, 'ped_info_recurso_2_idx'),
+            (views.ConsultaMeusPedInfos, self.cidadao.credenciais, {}, 'ped_info_requerente_data_idx'),
+            (views.ConsultaPedInfosGeral, adm, {}, 'ped_info_data_idx'),
+            (views.ConsultaPedInfosGeral, adm, {'situacao': 'PR'}, 'ped_info_situacao_data_idx'),
+            (views.ConsultaPedInfosGeral, adm, {'data_inicio': '2025-01-01', 'data_fim': '2025-12-31'},
+             'ped_info_data_idx'),
+            (views.ConsultaPedInfosGeral, adm, {'numero': '123/2023'}, 'ped_info_ano_num_registro_uniq'),
+            (views.ConsultaPedInfosGeral, adm, {'numero': '123', 'ano': '2023'}, 'ped_info_ano_num_registro_uniq'),
+            (views.ConsultaPedInfosGeral, adm, {'ano': '2023'}, 'ped_info_data_idx'),
+            (views.ConsultaPedInfosGeral, adm, {'busca': 'merenda'}, 'ped_info_busca_gin_idx'),
+            (views.ConsultaPedInfosGeral, adm, {'requerente': 'joao silva'}, 'ped_info_requerente_data_idx'),
+            (views.ConsultaPedInfosGeral, adm, {'cursor': self.cursor_geral(adm)}, 'ped_info_data_idx'),
+        ]
+
+    def cursor_geral(self, usuario):
+        # Cursor de uma página intermediária da consulta geral
+        self.client.force_login(usuario)
+        resposta = self.client.get(reverse('ped_infos_geral'))
+        return resposta.context['cursor_proximo']
+
+    def test_indices_das_consultas(self):
+        for classe_view, usuario, parametros, indice in self.casos():
+            with self.subTest(view=classe_view.__name__, **parametros):
+                self.assertUsaIndice(self.queryset_da_view(classe_view, usuario, **parametros), indice)
+
+    def test_prazos_por_setor(self):
+        agora = now()
+        limite = agora + timedelta(days=3)
+        casos = (
+            ('ADM', 'atrasados', 'ped_info_prazo_fila_idx'),
+            ('GAB', 'vencendo', 'ped_info_prazo_fila_idx'),
+            ('FIN', 'atrasados', 'ped_info_prazo_fornec_idx'),
+            ('FIN', 'vencendo', 'ped_info_prazo_fornec_idx'),
+            ('REC1', 'recursos', 'ped_info_prazo_recurso_1_idx'),
+            ('REC2', 'recursos', 'ped_info_prazo_recurso_2_idx'),
+        )
+        for sigla, nome, indice in casos:
+            setor_id = self.setores[sigla].pk
+            pedidos = PedidoInformacao.objects.aguardando_setor(setor_id)
+            consultas = {'atrasados': pedidos.atrasados(agora), 'vencendo': pedidos.vencendo(agora, limite),
+                         'recursos': PedidoInformacao.objects.recursos_abertos(agora, setor_id)}
+            with self.subTest(setor=sigla, consulta=nome):
+                self.assertUsaIndice(consultas[nome].order_by('pk'), indice)
+
+# Testa o ano do protocolo e a unicidade de (ano, número de registro) no banco
+class ProtocoloTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+
+    def test_ano_e_protocolo(self):
+        ped_info = self.criar_pedido()
+        self.assertEqual(ped_info.ano, now().year)
+        self.assertEqual(str(ped_info), f"1/{now().year}")
+
+    def test_unicidade_no_banco(self):
+        self.criar_pedido(num_registro=7, ano=2024)
+        self.criar_pedido(num_registro=7, ano=2025)
+        with self.assertRaises(IntegrityError):
+            self.criar_pedido(num_registro=7, ano=2024)
+
+    def test_busca_por_numero_e_ano(self):
+        self.criar_pedido(num_registro=7, ano=2024, titulo="Procurado")
+        self.criar_pedido(num_registro=7, ano=2025)
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+        resposta = self.client.get(reverse('ped_infos_geral'), {'numero': '7/2024'})
+        self.assertEqual([p.titulo for p in resposta.context['ped_infos']], ["Procurado"])
+
+# Testa a busca textual em português sobre o vetor mantido pelo gatilho
+@unittest.skipUnless(connection.vendor == 'postgresql', "Requer PostgreSQL")
+class BuscaTextualTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+
+    def buscar(self, termos, **parametros):
+        resposta = self.client.get(reverse('ped_infos_geral'), {'busca': termos, **parametros})
+        return [p.titulo for p in resposta.context['ped_infos']]
+
+    def test_ignora_acentos_e_flexoes(self):
+        self.criar_pedido(titulo="Contratos de orçamento")
+        self.criar_pedido(titulo="Outro assunto")
+        self.assertEqual(self.buscar("orcamento contrato"), ["Contratos de orçamento"])
+
+    def test_ordena_por_relevancia(self):
+        self.criar_pedido(titulo="Pedido geral", descricao="Dados sobre merenda escolar")
+        self.criar_pedido(titulo="Merenda escolar", descricao="Cardápio")
+        self.assertEqual(self.buscar("merenda"), ["Merenda escolar", "Pedido geral"])
+        self.assertEqual(self.buscar("merenda", ordenacao='data_pedido'), ["Pedido geral", "Merenda escolar"])
+
+    def test_vetor_atualizado_nas_transicoes(self):
+        ped_info = self.criar_pedido('EP', titulo="Sem relação")
+        transitar(ped_info, parecer="Informação sigilosa", func_parecer=self.funcionarios['JUR'],
+                  data_parecer=now())
+        self.assertEqual(self.buscar("sigiloso"), ["Sem relação"])
+
+    def percorrer(self, **parametros):
+        resposta = self.client.get(reverse('ped_infos_geral'), parametros)
+        vistos = [p.pk for p in resposta.context['ped_infos']]
+        while resposta.context['cursor_proximo']:
+            resposta = self.client.get(reverse('ped_infos_geral'),
+                                       {**parametros, 'cursor': resposta.context['cursor_proximo']})
+            vistos += [p.pk for p in resposta.context['ped_infos']]
+        return vistos
+
+    def test_paginas_por_relevancia_e_similaridade(self):
+        # Relevâncias e similaridades repetidas e sem representação exata em float4,
+        # com a mesma data: o desempate fica com a chave primária
+        data = now()
+        requerentes = [Cidadao.objects.create(nome=nome, num_doc_id=str(i), cep="12345678", logradouro="Rua A",
+                                              numero="1", bairro="Centro", cidade="Cidade X", estado="XX")
+                       for i, nome in enumerate(["Maria Souza", "Mariana Souza", "Marilia Sousa"])]
+        PedidoInformacao.objects.bulk_create(
+            PedidoInformacao(num_registro=i, ano=2025, titulo=f"Pedido {i}",
+                             descricao=" ".join(["merenda"] * (i % 3 + 1) + ["escolar"] * (i % 5)),
+                             requerente=requerentes[i % 3], situacao='AI', data_pedido=data)
+            for i in range(1, 46))
+
+        for parametros, campo in (({'busca': "merenda"}, 'relevancia'), ({'requerente': "maria"}, 'similaridade')):
+            with self.subTest(campo=campo):
+                vistos = self.percorrer(**parametros)
+                self.assertEqual(len(vistos), 45)
+                resposta = self.client.get(reverse('ped_infos_geral'), parametros)
+                esperado = (resposta.context['view'].get_queryset()
+                            .order_by(f'-{campo}', '-data_pedido', '-pk').values_list('pk', flat=True))
+                self.assertEqual(vistos, list(esperado))
+
+# Testa a busca de requerentes por similaridade de trigramas
+@unittest.skipUnless(connection.vendor == 'postgresql', "Requer PostgreSQL")
+class BuscaRequerenteTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        self.maria = Cidadao.objects.create(nome="Maria Conceição Souza", num_doc_id="987654321",
+                                            cep="12345678", logradouro="Rua B", numero="1",
+                                            bairro="Centro", cidade="Cidade X", estado="XX")
+
+    def test_tolera_erros_e_acentos(self):
+        self.assertEqual(self.maria.nome_busca, "maria conceicao souza")
+        self.assertEqual(list(Cidadao.objects.buscar("Conceicao Sousa")), [self.maria])
+        self.assertEqual(list(Cidadao.objects.buscar("87654")), [self.maria])
+
+    def test_consulta_geral(self):
+        self.criar_pedido(titulo="Do João")
+        PedidoInformacao.objects.create(titulo="Da Maria", descricao="Descrição", requerente=self.maria)
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+        resposta = self.client.get(reverse('ped_infos_geral'), {'requerente': 'maria concei'})
+        self.assertEqual([p.titulo for p in resposta.context['ped_infos']], ["Da Maria"])
+
+    def test_admin(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@x.com', 'senha'))
+        resposta = self.client.get(reverse('admin:lai_app_cidadao_changelist'), {'q': 'joao silv'})
+        self.assertEqual(list(resposta.context['cl'].result_list), [self.cidadao])
+        resposta = self.client.get(reverse('admin:lai_app_cidadao_changelist'), {'q': 'joao'})
+        self.assertEqual(list(resposta.context['cl'].result_list), [self.cidadao])
+
+# Testa a paginação por chave das filas e da consulta geral
+class PaginacaoTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+        # Datas repetidas obrigam o desempate pela chave primária
+        data = now()
+        PedidoInformacao.objects.bulk_create(
+            PedidoInformacao(num_registro=i, ano=2025, titulo=f"Pedido {i}", descricao="Descrição",
+                             requerente=self.cidadao, situacao='AI', data_pedido=data - timedelta(days=i // 7))
+            for i in range(1, 46))
+
+    def pagina(self, nome_url='ped_infos_geral', **parametros):
+        resposta = self.client.get(reverse(nome_url), parametros)
+        return resposta, [p.pk for p in resposta.context['ped_infos']]
+
+    def test_percorre_todas_as_paginas(self):
+        resposta, pks = self.pagina()
+        self.assertEqual(len(pks), 20)
+        self.assertIsNone(resposta.context['cursor_anterior'])
+        vistos = list(pks)
+        while resposta.context['cursor_proximo']:
+            resposta, pks = self.pagina(cursor=resposta.context['cursor_proximo'])
+            vistos += pks
+        self.assertEqual(len(vistos), 45)
+        esperado = PedidoInformacao.objects.order_by('-data_pedido', '-pk').values_list('pk', flat=True)
+        self.assertEqual(vistos, list(esperado))
+
+    def test_volta_para_a_pagina_anterior(self):
+        primeira, pks_primeira = self.pagina()
+        segunda, pks_segunda = self.pagina(cursor=primeira.context['cursor_proximo'])
+        terceira, pks_terceira = self.pagina(cursor=segunda.context['cursor_proximo'])
+        _, pks = self.pagina(cursor=terceira.context['cursor_anterior'])
+        self.assertEqual(pks, pks_segunda)
+        voltou, pks = self.pagina(cursor=segunda.context['cursor_anterior'])
+        self.assertEqual(pks, pks_primeira)
+        self.assertIsNone(voltou.context['cursor_anterior'])
+
+    def test_fila_paginada(self):
+        resposta, pks = self.pagina('ped_infos_analise')
+        self.assertEqual(len(pks), 20)
+        _, pks_segunda = self.pagina('ped_infos_analise', cursor=resposta.context['cursor_proximo'])
+        self.assertEqual(len(pks_segunda), 20)
+        self.assertFalse(set(pks) & set(pks_segunda))
+
+    def test_cursor_adulterado_volta_ao_inicio(self):
+        _, pks_inicio = self.pagina()
+        _, pks = self.pagina(cursor="invalido")
+        self.assertEqual(pks, pks_inicio)
+
+    def test_cursor_de_outra_ordenacao_e_ignorado(self):
+        resposta, pks_inicio = self.pagina(ordenacao='data_pedido')
+        _, pks = self.pagina(ordenacao='-data_pedido', cursor=resposta.context['cursor_proximo'])
+        self.assertEqual(pks, self.pagina()[1])
+
+# Testa a projeção enxuta das listagens em linhas LinhaPedInfo
+class ListagemLinhasTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        self.criar_pedido(titulo="Primeiro", descricao="Texto longo " * 100)
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+
+    def test_pagina_em_linhas_compactas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('ped_infos_geral'))
+        linha, = resposta.context['ped_infos']
+        self.assertIsInstance(linha, LinhaPedInfo)
+        self.assertEqual((linha.titulo, linha.requerente_nome), ("Primeiro", "João Silva"))
+        self.assertEqual(linha.get_situacao_display(), "Análise Inicial")
+        self.assertFalse(hasattr(linha, '__dict__'))
+        self.assertContains(resposta, "João Silva")
+
+        sql = next(c['sql'] for c in consultas.captured_queries if 'lai_app_pedidoinformacao' in c['sql'])
+        self.assertNotIn('descricao', sql)
+        self.assertIn('lai_app_cidadao', sql)
+
+# Testa a exportação em fluxo da consulta geral, com os mesmos filtros e ordenação
+class ExportacaoConsultaTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+
+    def exportar(self, **parametros):
+        resposta = self.client.get(reverse('ped_infos_geral'), parametros)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.streaming)
+        return resposta, b''.join(resposta.streaming_content)
+
+    def test_csv_com_filtros(self):
+        self.criar_pedido(titulo="Contratos de limpeza")
+        self.criar_pedido('BI', titulo="Contratos de obras", setor_info=self.setores['FIN'])
+        self.criar_pedido(titulo="Diárias")
+
+        with CaptureQueriesContext(connection) as consultas:
+            resposta, conteudo = self.exportar(titulo="contratos", ordenacao='data_pedido', formato='csv')
+        self.assertIn('attachment;', resposta['Content-Disposition'])
+        linhas = list(csv.reader(io.StringIO(conteudo.decode('utf-8-sig')), delimiter=';'))
+        self.assertEqual(linhas[0][:6], ['numero', 'ano', 'data_pedido', 'titulo', 'situacao', 'requerente'])
+        self.assertEqual([(linha[3], linha[4], linha[5], linha[6]) for linha in linhas[1:]],
+                         [("Contratos de limpeza", "Análise Inicial", "João Silva", ""),
+                          ("Contratos de obras", "Buscando Informações", "João Silva", "Setor FIN")])
+        sql = next(c['sql'] for c in consultas.captured_queries if 'lai_app_pedidoinformacao' in c['sql'])
+        self.assertIn('lai_app_cidadao', sql)
+
+    def test_csv_sem_formulas(self):
+        for titulo in ("=HYPERLINK(\"http://x\")", "+1+1", "-2+3", "@SOMA(A1)", "\tTab", "Normal - ok"):
+            self.criar_pedido(titulo=titulo)
+        self.cidadao.nome = "=cmd|' /C calc'!A0"
+        self.cidadao.save()
+
+        _, conteudo = self.exportar(ordenacao='data_pedido', formato='csv')
+        linhas = list(csv.reader(io.StringIO(conteudo.decode('utf-8-sig')), delimiter=';'))[1:]
+        self.assertEqual([linha[3] for linha in linhas],
+                         ["'=HYPERLINK(\"http://x\")", "'+1+1", "'-2+3", "'@SOMA(A1)", "'\tTab", "Normal - ok"])
+        self.assertEqual({linha[5] for linha in linhas}, {"'=cmd|' /C calc'!A0"})
+
+    def test_jsonl_gzip(self):
+        for i in range(3):
+            self.criar_pedido(titulo=f"Pedido {i}")
+
+        resposta, conteudo = self.exportar(ordenacao='-data_pedido', formato='jsonl')
+        self.assertEqual(resposta['Content-Type'], 'application/gzip')
+        registros = [json.loads(linha) for linha in gzip.decompress(conteudo).decode('utf-8').splitlines()]
+        self.assertEqual([registro['titulo'] for registro in registros], ["Pedido 2", "Pedido 1", "Pedido 0"])
+        self.assertEqual(registros[0]['requerente'], "João Silva")
+
+    def test_exige_setor_administrativo(self):
+        self.client.force_login(self.funcionarios['FIN'].credenciais)
+        resposta = self.client.get(reverse('ped_infos_geral'), {'formato': 'csv'})
+        self.assertEqual(resposta.status_code, 403)
+
+    def test_memoria_independe_do_resultado(self):
+        PedidoInformacao.objects.bulk_create(
+            (PedidoInformacao(num_registro=i, ano=2025 if i <= 3000 else 2024, titulo=f"Pedido {i}",
+                              descricao="Descrição", requerente=self.cidadao)
+             for i in range(1, 10001)), batch_size=2000)
+
+        def pico(**parametros):
+            resposta = self.client.get(reverse('ped_infos_geral'), {'formato': 'csv', **parametros})
+            tracemalloc.start()
+            total = sum(conteudo.count(b'\n') for conteudo in resposta.streaming_content)
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return total, pico
+
+        pequeno, grande = pico(ano=2025), pico()
+        sys.stderr.write(f"\nExportação: pico de {pequeno[1] / 2**10:.0f} KiB com {pequeno[0] - 1} pedidos e "
+                         f"{grande[1] / 2**10:.0f} KiB com {grande[0] - 1}\n")
+        # Os dois resultados passam de um lote do cursor; o pico é o de um lote
+        self.assertEqual((pequeno[0], grande[0]), (3001, 10001))
+        self.assertLess(grande[1], pequeno[1] * 1.5)
+
+
+# Compara memória e tempo de materializar 10 mil pedidos como instâncias completas
+# do modelo e como linhas projetadas, informando os números obtidos
+class ListagemLinhasBenchmarkTeste(CenarioMixin, TestCase):
+
+    PEDIDOS = 10000
+
+    def setUp(self):
+        self.criar_cenario()
+        texto = "Texto do pedido de informação. " * 40
+        PedidoInformacao.objects.bulk_create(
+            (PedidoInformacao(num_registro=i, ano=2025, titulo=f"Pedido {i}", descricao=texto,
+                              parecer=texto, just_resp_inicial=texto, requerente=self.cidadao)
+             for i in range(1, self.PEDIDOS + 1)), batch_size=1000)
+
+    def medir(self, carregar):
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        itens = carregar()
+        duracao = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertEqual(len(itens), self.PEDIDOS)
+        return pico, duracao
+
+    def test_linhas_contra_instancias(self):
+        queryset = PedidoInformacao.objects.order_by('data_pedido', 'pk')
+        mixin = ListaPedInfosMixin()
+        completo = self.medir(lambda: list(queryset.select_related('requerente')))
+        linhas = self.medir(lambda: mixin.materializar(list(mixin.projetar(queryset))))
+
+        for nome, (pico, duracao) in (("instâncias", completo), ("linhas", linhas)):
+            sys.stderr.write(f"\nListagem ({nome}): {self.PEDIDOS} pedidos, pico de "
+                             f"{pico / 2**20:.1f} MiB em {duracao:.2f}s\n")
+        self.assertLess(linhas[0], completo[0])
+
+# Orçamento de consultas: executa uma rota de lai_cmg/urls.py sobre os dados
+# semeados e falha, listando o SQL, se o número de consultas passar do máximo
+class OrcamentoConsultasMixin:
+
+    def assertOrcamentoConsultas(self, rota, usuario, maximo, args=(), parametros=None):
+        if usuario is not None:
+            self.client.force_login(usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse(rota, args=args), parametros)
+        self.assertEqual(resposta.status_code, 200, rota)
+        if len(consultas) > maximo:
+            sql = "\n".join(consulta['sql'] for consulta in consultas.captured_queries)
+            self.fail(f"{rota}: {len(consultas)} consultas, orçamento de {maximo}\n{sql}")
+
+# Testa o orçamento de consultas de todas as rotas nomeadas do projeto, com filas
+# cheias para que carregamentos por linha estourem o limite
+@override_settings(CACHES=CACHE_LOCAL)
+class OrcamentoConsultasTeste(OrcamentoConsultasMixin, CenarioMixin, TestCase):
+
+    POR_SITUACAO = 25
+
+    # rota: (usuário, situação do pedido usado como argumento, máximo de consultas)
+    ORCAMENTOS = {
+        'menu': ('ADM', None, 4),
+        'req_info': ('cidadao', None, 3),
+        'registrar_cidadao': (None, None, 0),
+        'metricas': (None, None, 0),
+        'analisar_ped_info': ('ADM', 'AI', 6),
+        'fornecer_ped_info': ('FIN', 'BI', 5),
+        'parecer_ped_info': ('JUR', 'EP', 5),
+        'resposta_ped_info': ('GAB', 'DR', 5),
+        'recurso1_ped_info': ('cidadao', 'PR', 4),
+        'resposta_rec_1': ('REC1', 'AR', 5),
+        'recurso2_ped_info': ('cidadao', 'RR', 4),
+        'resposta_rec_2': ('REC2', 'AF', 5),
+        'detalhes_ped_info': ('ADM', 'EP', 5),
+        'arquivo_ped_info': ('ADM', 'RF', 4),
+        'ped_infos_analise': ('ADM', None, 5),
+        'meus_ped_infos': ('cidadao', None, 4),
+        'ped_infos_fornecimento': ('FIN', None, 5),
+        'ped_infos_geral': ('ADM', None, 5),
+        'ped_infos_parecer': ('JUR', None, 5),
+        'ped_infos_resposta': ('GAB', None, 5),
+        'ped_infos_resp_rec_1': ('REC1', None, 5),
+        'ped_infos_resp_rec_2': ('REC2', None, 5),
+        'prazos_setor': ('ADM', None, 8),
+        'relatorio_anual': (None, None, 2),
+    }
+
+    def setUp(self):
+        self.criar_cenario()
+        self.enterContext(self.settings(METRICAS_TOKEN='orcamento'))
+        self.client = Client(headers={'Authorization': "Bearer orcamento"})
+        # A configuração, o calendário de dias úteis e os agregados das métricas
+        # ficam em cache entre requisições; não entram no orçamento
+        Configuracao.load()
+        AtualizacaoResumo.load()
+        somar_dias_uteis(localtime(now()).date(), 0)
+        metricas.atualizar_agregados()
+        prazo = now() + timedelta(days=10)
+        self.pedidos = {}
+        pedidos = []
+        for situacao in PedidoInformacao.SITUACOES:
+            for i in range(self.POR_SITUACAO):
+                pedidos.append(PedidoInformacao(
+                    num_registro=len(pedidos) + 1, ano=2025, titulo=f"Pedido {situacao} {i}",
+                    descricao="Descrição", requerente=self.cidadao, situacao=situacao,
+                    setor_info=self.setores['FIN'], func_adm=self.funcionarios['ADM'],
+                    func_resp_inicial=self.funcionarios['GAB'],
+                    func_resp_recurso_1=self.funcionarios['REC1'],
+                    prazo_recurso_1=prazo, prazo_recurso_2=prazo,
+                    data_recurso_1=now(), data_recurso_2=now()))
+        for ped_info in PedidoInformacao.objects.bulk_create(pedidos):
+            self.pedidos.setdefault(ped_info.situacao, ped_info)
+
+        # Arquivo de informação servido pela rota de download
+        self.enterContext(self.settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        ped_info = self.pedidos['RF']
+        ped_info.arquivo_info.save('informacao.pdf', ContentFile(b'%PDF-1.4'))
+
+    def usuario(self, chave):
+        if chave is None:
+            return None
+        if chave == 'cidadao':
+            return self.cidadao.credenciais
+        return self.funcionarios[chave].credenciais
+
+    def test_orcamento_por_rota(self):
+        for rota, (usuario, situacao, maximo) in self.ORCAMENTOS.items():
+            with self.subTest(rota=rota):
+                args = (self.pedidos[situacao].pk,) if situacao else ()
+                self.client.logout()
+                self.assertOrcamentoConsultas(rota, self.usuario(usuario), maximo, args)
+
+    def test_todas_as_rotas_tem_orcamento(self):
+        from lai_cmg.urls import urlpatterns
+        rotas = {padrao.name for padrao in urlpatterns if isinstance(padrao, URLPattern) and padrao.name}
+        self.assertEqual(rotas - set(self.ORCAMENTOS), set())
+
+# Testa o detector de N+1: comandos repetidos na requisição são registrados com a origem
+@override_settings(DETECTOR_N1=True, CACHES=CACHE_LOCAL)
+class DetectorN1Teste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+
+    def test_desligado_por_padrao(self):
+        with self.settings(DETECTOR_N1=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                DetectorN1Middleware(lambda request: HttpResponse())
+
+    def test_registra_consultas_repetidas(self):
+        def view(request):
+            for setor in Setor.objects.all():
+                Funcionario.objects.filter(lotacao=setor).first()
+            return HttpResponse()
+
+        with self.assertLogs('lai_app.consultas', 'WARNING') as registros:
+            DetectorN1Middleware(view)(RequestFactory().get('/setores/'))
+        mensagem, = registros.output
+        self.assertIn("/setores/", mensagem)
+        self.assertIn("6 execuções", mensagem)
+        self.assertIn("lai_app/tests.py", mensagem)
+
+    def test_paginas_sem_repeticao(self):
+        for _ in range(30):
+            self.criar_pedido()
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+        with self.assertNoLogs('lai_app.consultas', 'WARNING'):
+            for rota in ('menu', 'ped_infos_geral', 'ped_infos_analise'):
+                self.client.get(reverse(rota))
+
+# Testa o cabeçalho Server-Timing e o log estruturado de consultas lentas
+class TempoRequisicaoTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        self.criar_pedido(titulo="Pedido sigiloso")
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+
+    def test_server_timing(self):
+        User.objects.filter(username='adm').update(is_staff=True)
+        resposta = self.client.get(reverse('ped_infos_geral'))
+        metricas = [metrica.split(';')[0] for metrica in resposta['Server-Timing'].split(', ')]
+        self.assertEqual(metricas, ['db', 'view', 'tmpl', 'total'])
+        self.assertRegex(resposta['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ consultas"')
+
+    def test_server_timing_oculto(self):
+        # Fora da equipe, os tempos e o número de consultas não são expostos
+        self.assertNotIn('Server-Timing', self.client.get(reverse('ped_infos_geral')))
+        self.client.logout()
+        self.assertNotIn('Server-Timing', self.client.get(reverse('metricas')))
+        with self.settings(SERVER_TIMING=True):
+            self.assertIn('Server-Timing', self.client.get(reverse('ped_infos_geral')))
+
+    @override_settings(CONSULTA_LENTA_MS=0)
+    def test_log_de_consultas_lentas(self):
+        with self.assertLogs('lai_app.consultas_lentas', 'WARNING') as registros:
+            self.client.get(reverse('ped_infos_geral'), {'titulo': "sigiloso", 'situacao': 'AI'})
+        entradas = [json.loads(registro.getMessage()) for registro in registros.records]
+        entrada = next(e for e in entradas if 'lai_app_pedidoinformacao' in e['sql'])
+        self.assertEqual(entrada['caminho'], reverse('ped_infos_geral'))
+        self.assertEqual(entrada['view'], 'ConsultaPedInfosGeral')
+        self.assertEqual(entrada['consulta'], {'titulo': ['<redigido:8>'], 'situacao': ['AI']})
+        self.assertNotIn("sigiloso", json.dumps(entradas))
+
+# Testa o endpoint de métricas: histogramas por rota, agregados em cache e token
+@override_settings(METRICAS_TOKEN='segredo', CACHES=CACHE_LOCAL)
+class MetricasTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        cache.clear()
+        self.criar_pedido('AI')
+        self.criar_pedido('PR', prazo_recurso_1=now() + timedelta(days=5))
+        self.criar_pedido('PR', prazo_recurso_1=now() - timedelta(days=1))
+
+    def metricas(self, token='segredo'):
+        resposta = self.client.get(reverse('metricas'), headers={'Authorization': f"Bearer {token}"})
+        return resposta, resposta.content.decode()
+
+    def test_histograma_por_rota(self):
+        self.client.force_login(self.funcionarios['ADM'].credenciais)
+        self.client.get(reverse('ped_infos_geral'))
+        self.client.get(reverse('ped_infos_geral'))
+        _, texto = self.metricas()
+        self.assertIn('lai_requisicao_segundos_count{rota="ped_infos_geral"} 2', texto)
+        self.assertIn('lai_requisicao_segundos_bucket{rota="ped_infos_geral",le="+Inf"} 2', texto)
+
+    def test_agregados_vem_do_cache(self):
+        metricas.atualizar_agregados()
+        with self.assertNumQueries(0):
+            _, texto = self.metricas()
+        self.assertIn('lai_pedidos{situacao="AI"} 1', texto)
+        self.assertIn('lai_pedidos{situacao="PR"} 2', texto)
+        self.assertIn('lai_prazos_recurso_abertos{instancia="1"} 1', texto)
+        self.assertIn(f'lai_protocolos_numerados_total{{exercicio="{now().year}"}} 3', texto)
+
+    def test_registra_upload(self):
+        metricas.registrar_upload(1024)
+        _, texto = self.metricas()
+        self.assertIn('lai_upload_bytes_total 1024', texto)
+        self.assertIn('lai_uploads_total 1', texto)
+
+    def test_exige_token(self):
+        resposta, _ = self.metricas(token='errado')
+        self.assertEqual(resposta.status_code, 403)
+        resposta, _ = self.metricas()
+        self.assertEqual(resposta.status_code, 200)
+        with self.settings(METRICAS_TOKEN=None):
+            resposta, _ = self.metricas()
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_agregados_usam_as_contagens(self):
+        # Pedidos incluídos por fora das transições só aparecem depois da reconciliação
+        PedidoInformacao.objects.bulk_create([PedidoInformacao(
+            num_registro=99, ano=2025, titulo="Pedido", descricao="Descrição", requerente=self.cidadao,
+            situacao='AI')])
+        with CaptureQueriesContext(connection) as consultas:
+            agregados = metricas.calcular_agregados()
+        self.assertEqual(agregados['situacoes']['AI'], 1)
+        self.assertNotIn('GROUP BY "lai_app_pedidoinformacao"', " ".join(c['sql'] for c in consultas))
+        ContagemPedidos.reconciliar()
+        self.assertEqual(metricas.calcular_agregados()['situacoes']['AI'], 2)
+
+# Testa a publicação de dados abertos: arquivos por ano sem dados pessoais,
+# manifesto e publicação incremental a partir da marca
+@override_settings(DADOS_ABERTOS_SEGREDO='chave-da-publicacao')
+class DadosAbertosTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio)
+
+        self.antigo = self.criar_pedido('PR', setor_info=self.setores['FIN'], resp_inicial=True,
+                                        data_resp_inicial=now())
+        self.atual = self.criar_pedido()
+        PedidoInformacao.objects.filter(pk=self.antigo.pk).update(ano=2024)
+        PedidoInformacao.objects.update(atualizado_em=now() - timedelta(days=1))
+
+    def ler(self, nome):
+        with gzip.open(os.path.join(self.diretorio, nome), 'rt', encoding='utf-8') as arquivo:
+            return [json.loads(linha) for linha in arquivo]
+
+    def manifesto(self):
+        with open(os.path.join(self.diretorio, 'manifesto.json'), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+
+    def test_publicacao_completa(self):
+        saida = io.StringIO()
+        call_command('publicar_dados_abertos', diretorio=self.diretorio, stdout=saida)
+        self.assertIn("2 arquivo(s) publicado(s)", saida.getvalue())
+
+        registro, = self.ler('pedidos-2024.jsonl.gz')
+        self.assertEqual((registro['numero'], registro['setor_info'], registro['resp_inicial'],
+                          registro['resp_recurso_1'], registro['desfecho']),
+                         (self.antigo.num_registro, "Setor FIN", "Deferido", None, "Deferido"))
+        self.assertEqual(registro['requerente'], self.ler(f'pedidos-{self.atual.ano}.jsonl.gz')[0]['requerente'])
+        # Nenhum dado pessoal do cidadão chega aos arquivos
+        with open(os.path.join(self.diretorio, 'pedidos-2024.jsonl.gz'), 'rb') as arquivo:
+            texto = gzip.decompress(arquivo.read()).decode('utf-8')
+        for dado in ("João Silva", "123456789", "Rua A", "12345678"):
+            self.assertNotIn(dado, texto)
+
+        arquivos = {item['arquivo']: item for item in self.manifesto()['arquivos']}
+        self.assertEqual(arquivos['pedidos-2024.jsonl.gz']['linhas'], 1)
+        self.assertEqual([nome for nome in os.listdir(self.diretorio) if nome.endswith('.tmp')], [])
+
+    def test_exige_chave_propria(self):
+        for segredo in (None, '', settings.SECRET_KEY):
+            with self.subTest(segredo=segredo), self.settings(DADOS_ABERTOS_SEGREDO=segredo):
+                with self.assertRaisesMessage(CommandError, "DADOS_ABERTOS_SEGREDO"):
+                    call_command('publicar_dados_abertos', diretorio=self.diretorio, stdout=io.StringIO())
+        self.assertEqual(os.listdir(self.diretorio), [])
+
+    def test_textos_livres_redigidos(self):
+        PedidoInformacao.objects.filter(pk=self.atual.pk).update(
+            titulo="Pedido de joao silva",
+            descricao="Eu, JOÃO Silva, CPF 123.456.789-00, RG 123456789, peço os contratos de 2023-2024. "
+                      "Respostas para joao.silva@exemplo.com.br ou (11) 98765-4321.",
+            recurso_1="Não recebi nada. Telefone 11 3456-7890, celular 98765 4321. João",
+            parecer="O requerente João Silva (12345678900) tem direito às informações.")
+        call_command('publicar_dados_abertos', diretorio=self.diretorio, stdout=io.StringIO())
+
+        registro, = self.ler(f'pedidos-{self.atual.ano}.jsonl.gz')
+        texto = json.dumps(registro, ensure_ascii=False)
+        for dado in ("João", "JOÃO", "joao", "Silva", "123.456.789-00", "12345678900", "123456789",
+                     "@exemplo", "98765", "3456-7890"):
+            self.assertNotIn(dado, texto)
+        self.assertEqual(registro['descricao'],
+                         "Eu, [removido] [removido], CPF [removido], RG [removido], peço os contratos de "
+                         "2023-2024. Respostas para [removido] ou [removido].")
+        self.assertEqual(registro['parecer'], "O requerente [removido] [removido] ([removido]) tem direito "
+                                              "às informações.")
+
+    def test_publicacao_incremental(self):
+        call_command('publicar_dados_abertos', diretorio=self.diretorio, stdout=io.StringIO())
+        transitar(self.atual, setor_info=self.setores['JUR'], func_adm=self.funcionarios['ADM'], data_encam=now())
+
+        call_command('publicar_dados_abertos', diretorio=self.diretorio, incremental=True, stdout=io.StringIO())
+        alteracoes = [item for item in self.manifesto()['arquivos'] if item['tipo'] == 'alteracoes']
+        self.assertEqual(len(alteracoes), 1)
+        registro, = self.ler(alteracoes[0]['arquivo'])
+        self.assertEqual((registro['numero'], registro['setor_info']), (self.atual.num_registro, "Setor JUR"))
+
+        # Uma nova publicação completa substitui os arquivos de alterações
+        call_command('publicar_dados_abertos', diretorio=self.diretorio, stdout=io.StringIO())
+        self.assertEqual(sorted(os.listdir(self.diretorio)),
+                         sorted(['manifesto.json', 'pedidos-2024.jsonl.gz', f'pedidos-{self.atual.ano}.jsonl.gz']))
+
+
+# Testa o download do arquivo de informação: autorização, Range, ETag e a
+# entrega pelo proxy com X-Accel-Redirect ou X-Sendfile
+class ArquivoPedInfoTeste(CenarioMixin, TestCase):
+
+    CONTEUDO = bytes(range(256)) * 4
+
+    def setUp(self):
+        self.criar_cenario()
+        self.media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(MEDIA_ROOT=self.media, ARQUIVOS_PROTEGIDOS=''))
+        self.ped_info = self.criar_pedido('RF', setor_info=self.setores['FIN'], resp_inicial=True,
+                                          data_resp_inicial=now())
+        self.ped_info.arquivo_info.save('informacao.pdf', ContentFile(self.CONTEUDO))
+        self.url = reverse('arquivo_ped_info', args=[self.ped_info.pk])
+
+    def baixar(self, usuario=None, **cabecalhos):
+        self.client.force_login(usuario or self.funcionarios['ADM'].credenciais)
+        return self.client.get(self.url, headers=cabecalhos)
+
+    def test_permissao(self):
+        self.assertEqual(self.baixar(self.funcionarios['JUR'].credenciais).status_code, 403)
+        self.assertEqual(self.baixar(self.cidadao.credenciais).status_code, 200)
+        # Antes do deferimento, o requerente não recebe o documento
+        PedidoInformacao.objects.filter(pk=self.ped_info.pk).update(resp_inicial=False)
+        self.assertEqual(self.baixar(self.cidadao.credenciais).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_arquivo_completo_e_etag(self):
+        resposta = self.baixar()
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(b''.join(resposta.streaming_content), self.CONTEUDO)
+        self.assertEqual(resposta['Content-Type'], 'application/pdf')
+        self.assertEqual(resposta['Accept-Ranges'], 'bytes')
+        self.assertIn('private', resposta['Cache-Control'])
+
+        resposta = self.baixar(if_none_match=resposta['ETag'])
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta.content, b'')
+
+    def test_faixas(self):
+        resposta = self.baixar(range='bytes=100-199')
+        self.assertEqual(resposta.status_code, 206)
+        self.assertEqual(resposta['Content-Range'], f"bytes 100-199/{len(self.CONTEUDO)}")
+        self.assertEqual(b''.join(resposta.streaming_content), self.CONTEUDO[100:200])
+
+        resposta = self.baixar(range='bytes=-24')
+        self.assertEqual(b''.join(resposta.streaming_content), self.CONTEUDO[-24:])
+
+        resposta = self.baixar(range=f'bytes={len(self.CONTEUDO)}-')
+        self.assertEqual(resposta.status_code, 416)
+        self.assertEqual(resposta['Content-Range'], f"bytes */{len(self.CONTEUDO)}")
+
+        # Com If-Range de outra versão do arquivo, a faixa é ignorada
+        resposta = self.baixar(range='bytes=0-9', if_range='"outra-versao"')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(b''.join(resposta.streaming_content), self.CONTEUDO)
+
+    def test_entrega_pelo_proxy(self):
+        with self.settings(ARQUIVOS_PROTEGIDOS='x-accel'):
+            resposta = self.baixar()
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta['X-Accel-Redirect'], '/protegido/' + self.ped_info.arquivo_info.name)
+        self.assertEqual(resposta.content, b'')
+
+        with self.settings(ARQUIVOS_PROTEGIDOS='x-sendfile'):
+            resposta = self.baixar()
+        self.assertEqual(resposta['X-Sendfile'], self.ped_info.arquivo_info.path)
+        self.assertEqual(resposta.content, b'')
+
+    def test_sem_arquivo(self):
+        os.remove(self.ped_info.arquivo_info.path)
+        self.assertEqual(self.baixar().status_code, 404)
+        PedidoInformacao.objects.filter(pk=self.ped_info.pk).update(arquivo_info='')
+        self.assertEqual(self.baixar().status_code, 404)
+
+# Testa o gerador de dados sintéticos e o benchmark de rotas em escala reduzida
+class DadosSinteticosTeste(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        Configuracao.limpar_cache()
+        CalendarioUteis.limpar_cache()
+        call_command('gerar_dados_sinteticos', setores=8, funcionarios=20, cidadaos=30,
+                     pedidos=400, anos=1, lote=100, stdout=io.StringIO())
+
+    def test_dados_gerados(self):
+        self.assertEqual(Setor.objects.count(), 8)
+        self.assertEqual(Funcionario.objects.count(), 20)
+        self.assertEqual(Cidadao.objects.count(), 30)
+        self.assertEqual(PedidoInformacao.objects.count(), 400)
+        self.assertEqual(set(PedidoInformacao.objects.values_list('situacao', flat=True)),
+                         set(PedidoInformacao.SITUACOES))
+        # A numeração continua depois dos pedidos gerados
+        self.assertEqual(Numerador.objects.get(exercicio_num=now().year).ultimo_num, 400)
+        self.assertEqual(Cidadao.objects.buscar(Cidadao.objects.first().nome).count() > 0, True)
+        # As contagens da barra de navegação refletem os pedidos inseridos em massa
+        self.assertEqual(sum(ContagemPedidos.objects.values_list('total', flat=True)), 400)
+        # As datas sorteadas sobrevivem ao auto_now_add, que continua ligado
+        datas = list(PedidoInformacao.objects.order_by('num_registro').values_list('data_pedido', flat=True))
+        self.assertEqual(datas, sorted(datas))
+        self.assertGreater(len(set(datas)), 1)
+        self.assertFalse(PedidoInformacao.objects.filter(data_encam__lt=F('data_pedido')).exists())
+        self.assertTrue(PedidoInformacao._meta.get_field('data_pedido').auto_now_add)
+
+    @override_settings(METRICAS_TOKEN='benchmark')
+    def test_benchmark_e_comparacao(self):
+        with tempfile.TemporaryDirectory() as diretorio:
+            saida = os.path.join(diretorio, 'base.json')
+            call_command('benchmark_rotas', repeticoes=2, saida=saida,
+                         stdout=io.StringIO(), stderr=io.StringIO())
+            with open(saida, encoding='utf-8') as arquivo:
+                relatorio = json.load(arquivo)
+            self.assertEqual(relatorio['pedidos'], 400)
+            self.assertIn('ped_infos_geral {"busca": "licitação merenda"}', relatorio['rotas'])
+            for nome, resultado in relatorio['rotas'].items():
+                self.assertEqual(resultado['status'], 200, nome)
+
+            saida_nova = os.path.join(diretorio, 'nova.json')
+            relatorio['rotas']['menu']['consultas'] = 0
+            with open(saida, 'w', encoding='utf-8') as arquivo:
+                json.dump(relatorio, arquivo)
+            with self.assertRaisesMessage(CommandError, "1 rota(s) com regressão"):
+                call_command('benchmark_rotas', repeticoes=2, saida=saida_nova, base=saida,
+                             tolerancia=10_000, stdout=io.StringIO(), stderr=io.StringIO())
+
+# Roda o gerador de carga por alguns segundos contra o servidor de testes, com
+# taxas altas nas etapas de fila para provocar disputa pelos mesmos pedidos
+class CargaFluxoTeste(CenarioMixin, LiveServerTestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        for _ in range(5):
+            self.criar_pedido('AI')
+            self.criar_pedido('EP')
+        for _ in range(3):
+            self.criar_pedido('PR', resp_inicial=True, data_resp_inicial=now(),
+                              prazo_recurso_1=now() + timedelta(days=10))
+
+    def test_carga(self):
+        with tempfile.TemporaryDirectory() as diretorio, self.settings(MEDIA_ROOT=diretorio):
+            saida = os.path.join(diretorio, 'carga.json')
+            call_command('carga_fluxo', url=self.live_server_url, duracao=3, semente=1, saida=saida,
+                         taxa=['requerer=5', 'analisar=8', 'parecer=8', 'recurso_1=4'], stdout=io.StringIO())
+            with open(saida, encoding='utf-8') as arquivo:
+                relatorio = json.load(arquivo)
+
+        etapas = relatorio['etapas']
+        self.assertGreater(etapas['requerer']['desfechos'].get('sucesso', 0), 0)
+        self.assertGreater(etapas['analisar']['desfechos'].get('sucesso', 0), 0)
+        self.assertGreater(etapas['recurso_1']['desfechos'].get('sucesso', 0), 0)
+        for nome, etapa in etapas.items():
+            self.assertEqual(etapa['taxa_erro'], 0, (nome, etapa['desfechos']))
+        # Cada pedido é movimentado uma única vez, apesar da disputa
+        self.assertEqual(PedidoInformacao.objects.filter(data_parecer__isnull=False).count(),
+                         etapas['parecer']['desfechos'].get('sucesso', 0))
+
+# Testa o perfil sob demanda, restrito a superusuários
+class PerfilTeste(CenarioMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cenario()
+        self.ped_info = self.criar_pedido()
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio)
+        self.admin = User.objects.create(username='admin', is_superuser=True)
+        Funcionario.objects.create(nome="Administrador", matricula="99", cargo=Cargo.objects.first(),
+                                   lotacao=self.setores['ADM'], credenciais=self.admin)
+
+    def test_desligado_por_padrao(self):
+        with self.settings(PERFIL_DIRETORIO=None):
+            with self.assertRaises(MiddlewareNotUsed):
+                PerfilMiddleware(lambda request: HttpResponse())
+
+    def get(self, usuario, **kwargs):
+        self.client.force_login(usuario)
+        with self.settings(PERFIL_DIRETORIO=self.diretorio):
+            return self.client.get(reverse('detalhes_ped_info', args=[self.ped_info.pk]), **kwargs)
+
+    def test_grava_perfil_do_superusuario(self):
+        resposta = self.get(self.admin, data={'perfil': '1'})
+        nome = resposta['X-Perfil']
+        self.assertIn('detalhespedinfo', nome)
+        self.assertTrue(nome.endswith(str(self.ped_info.pk)))
+        self.assertEqual(sorted(os.listdir(self.diretorio)),
+                         [nome + '.folded', nome + '.json', nome + '.prof'])
+
+        with open(os.path.join(self.diretorio, nome + '.json'), encoding='utf-8') as arquivo:
+            dados = json.load(arquivo)
+        self.assertEqual(dados['view'], 'DetalhesPedInfo')
+        self.assertTrue(any('lai_app_pedidoinformacao' in c['sql'] for c in dados['sql']))
+        pstats.Stats(os.path.join(self.diretorio, nome + '.prof'))
+
+    def test_cabecalho(self):
+        resposta = self.get(self.admin, headers={'X-Perfil': '1'})
+        self.assertIn('X-Perfil', resposta)
+
+    def test_restrito_a_superusuarios(self):
+        resposta = self.get(self.funcionarios['ADM'].credenciais, data={'perfil': '1'})
+        self.assertNotIn('X-Perfil', resposta)
+        resposta = self.get(self.admin)
+        self.assertNotIn('X-Perfil', resposta)
+        self.assertEqual(os.listdir(self.diretorio), [])
@@ -0,0 +1,101 @@
+from typing import NamedTuple
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models, transaction
+
+from .calendario import PRAZOS
+from .models import ContagemPedidos, PedidoInformacao
+
+
+# Campos preenchidos em cada etapa do fluxo, indexados pela situação de origem
+CAMPOS_ETAPA = {
+    'AI': ('setor_info', 'func_adm', 'data_encam'),
+    'BI': ('arquivo_info', 'observacoes_forn', 'func_fornec', 'data_fornec'),
+    'EP': ('parecer', 'func_parecer', 'data_parecer'),
+    'DR': ('resp_inicial', 'just_resp_inicial', 'func_resp_inicial', 'data_resp_inicial'),
+    'PR': ('recurso_1', 'data_recurso_1'),
+    'AR': ('resp_recurso_1', 'just_resp_recurso_1', 'func_resp_recurso_1', 'data_resp_recurso_1'),
+    'RR': ('recurso_2', 'data_recurso_2'),
+    'AF': ('resp_recurso_2', 'just_resp_recurso_2', 'func_resp_recurso_2', 'data_resp_recurso_2'),
+}
+
+
+class Transicao(NamedTuple):
+    origem: str
+    destino: str
+    campos: tuple
+    prazos: tuple
+
+
+class ConflitoTransicao(Exception):
+    pass
+
+
+TRANSICOES = {}
+
+
+def compilar_transicoes():
+    # As situações estão declaradas na ordem do fluxo: cada uma leva à seguinte
+    situacoes = list(PedidoInformacao.SITUACOES)
+    transicoes = {}
+
+    for origem, destino in zip(situacoes, situacoes[1:]):
+        if origem not in CAMPOS_ETAPA:
+            raise ImproperlyConfigured(f"A situação '{origem}' não tem campos de etapa definidos.")
+        # Prazos que começam a correr na situação de destino, contados de uma
+        # data gravada nesta etapa (ex.: o prazo de recurso, da data da resposta)
+        prazos = tuple(prazo for prazo in PRAZOS.values()
+                       if destino in prazo.situacoes and prazo.data in CAMPOS_ETAPA[origem])
+        # atualizado_em (auto_now) recebe a hora da transição no pre_save
+        nomes = CAMPOS_ETAPA[origem] + tuple(prazo.campo for prazo in prazos) + ('atualizado_em',)
+        campos = tuple(PedidoInformacao._meta.get_field(nome) for nome in nomes)
+        transicoes[origem] = Transicao(origem, destino, campos, prazos)
+
+    TRANSICOES.clear()
+    TRANSICOES.update(transicoes)
+    return TRANSICOES
+
+
+def transitar(ped_info, **valores):
+    # Avança o pedido para a situação seguinte com um único UPDATE condicional,
+    # gravando apenas os campos da etapa. Se outro usuário já tiver movimentado
+    # o pedido, nenhuma linha é afetada e ConflitoTransicao é levantada.
+    try:
+        transicao = TRANSICOES[ped_info.situacao]
+    except KeyError:
+        raise ConflitoTransicao(f"Não há transição a partir da situação '{ped_info.situacao}'.")
+
+    # O setor contado é o gravado no banco, não o que um formulário de etapa já
+    # tenha atribuído à instância
+    setor_anterior = getattr(ped_info, 'setor_gravado', ped_info.setor_info_id)
+    for nome, valor in valores.items():
+        setattr(ped_info, nome, valor)
+
+    # Os prazos são fixados uma única vez, na própria transição
+    for prazo in transicao.prazos:
+        setattr(ped_info, prazo.campo, prazo.calcular(ped_info))
+
+    # pre_save grava em disco os arquivos enviados e devolve o valor da coluna
+    enviados = [arquivo for arquivo in (getattr(ped_info, campo.attname) for campo in transicao.campos
+                                        if isinstance(campo, models.FileField))
+                if arquivo and not arquivo._committed]
+    atualizacao = {campo.name: campo.pre_save(ped_info, False) for campo in transicao.campos}
+
+    with transaction.atomic():
+        atualizados = (PedidoInformacao.objects
+                       .filter(pk=ped_info.pk, situacao=transicao.origem)
+                       .update(situacao=transicao.destino, **atualizacao))
+
+        if not atualizados:
+            # Sem a transição, ninguém mais aponta para os arquivos já gravados
+            for arquivo in enviados:
+                arquivo.delete(save=False)
+            raise ConflitoTransicao(f"O pedido {ped_info.pk} não está mais na situação '{transicao.origem}'.")
+
+        # As contagens por situação e setor acompanham a transição na mesma transação
+        ContagemPedidos.ajustar(transicao.origem, setor_anterior, -1)
+        ContagemPedidos.ajustar(transicao.destino, ped_info.setor_info_id, 1)
+
+    ped_info.situacao = transicao.destino
+    ped_info.setor_gravado = ped_info.setor_info_id
+    return transicao
@@ -1,21 +1,51 @@
-from datetime import datetime as dt, timedelta
+import os
+from datetime import datetime as dt
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponseForbidden
+from django.contrib.postgres.lookups import Unaccent
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
 from django.urls import reverse_lazy
-from django.views.generic import DetailView, FormView, ListView, TemplateView
+from django.utils.crypto import constant_time_compare
+from django.views.generic import DetailView, FormView, ListView, TemplateView, View
 from django.db import IntegrityError
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.utils.timezone import localdate, now
 
 from .forms import (AnaliseInicialForm, CidadaoForm, FornecInfoForm, ParecerPedInfoForm, 
                     RecursoPrimInstForm, RecursoSegInstForm, ReqInformacaoForm, RespostaPedInfoForm, 
                     RespostaRecPrimInstForm, RespostaRecSegInstForm)
-from .models import Configuracao, PedidoInformacao
+from .calendario import prazo_em_dias_uteis
+from .models import PedidoInformacao, Setor, normalizar
+from .linhas import ListaPedInfosMixin
+from . import downloads, exportacao, filas, metricas as metricas_app, relatorio
+from .transicoes import ConflitoTransicao, transitar
 
 
 class MenuView(LoginRequiredMixin, TemplateView):
     template_name = 'lai_app/menu.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.request.papeis.funcionario:
+            context['painel'] = filas.painel(self.request)
+        return context
+
+def metricas(request):
+    # Métricas no formato do Prometheus, só com o token de METRICAS_TOKEN; sem
+    # token configurado, o endpoint não existe
+    token = settings.METRICAS_TOKEN
+    if not token:
+        raise Http404
+    if not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return HttpResponseForbidden("Token de métricas inválido.")
+    return HttpResponse(metricas_app.texto_prometheus(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def registrar_cidadao(request):
     if request.method == 'POST':
         form = CidadaoForm(request.POST)
@@ -32,64 +62,87 @@ def registrar_cidadao(request):
         form = CidadaoForm()
     return render(request, 'registration/registrar_cidadao.html', {'form': form})
 
-class AnaliseInicialPedInfo(LoginRequiredMixin, FormView):
+class PedInfoUnicoMixin:
+    # Carrega o pedido de informação uma única vez por requisição, já com os
+    # objetos relacionados exibidos no template, e reutiliza a mesma instância
+    relacionados = ('requerente',)
 
-    form_class = AnaliseInicialForm
-    template_name = 'lai_app/analise_inicial.html'
-    success_url = reverse_lazy('ped_infos_analise')
+    def get_ped_info(self):
+        if not hasattr(self, 'ped_info'):
+            self.ped_info = (PedidoInformacao.objects
+                             .select_related(*self.relacionados)
+                             .get(pk=self.kwargs['pk']))
+        return self.ped_info
 
-    def dispatch(self, request, *args, **kwargs):
+class EtapaPedInfoView(PedInfoUnicoMixin, LoginRequiredMixin, FormView):
+    # Base das etapas do fluxo do pedido de informação
 
-        ped_info = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        usuario = request.user
-                
-        if ( ped_info.situacao == 'AI' and 
-            hasattr(usuario, 'funcionario') and
-            usuario.funcionario.analisa_ped_info):
+    def tem_permissao(self, ped_info, papeis):
+        return False
+
+    def dispatch(self, request, *args, **kwargs):
 
+        if self.tem_permissao(self.get_ped_info(), request.papeis):
             return super().dispatch(request, *args, **kwargs)
-        
-        else:
-            
-            return HttpResponseForbidden("Você não tem permissão para acessar esta página."
-                                        " Contate o administrador do sistema.")              
-        
-    def form_valid(self, form):
-        
-        ped_info = form.save(commit=False)
-        ped_info.func_adm = self.request.user.funcionario
-        ped_info.data_encam = dt.now()
-        ped_info.situacao = 'BI' 
 
-        ped_info.save()
+        return HttpResponseForbidden("Você não tem permissão para acessar esta página."
+                                     " Contate o administrador do sistema.")
 
-        return super(AnaliseInicialPedInfo, self).form_valid(form)
+    def concluir_etapa(self, ped_info, form, **valores):
+        # Registra a etapa e avança a situação do pedido; em caso de submissão
+        # concorrente apenas a primeira é gravada
+        try:
+            transitar(ped_info, **valores)
+        except ConflitoTransicao:
+            form.add_error(None, "Este pedido já foi movimentado por outro usuário.")
+            return False
+
+        return True
 
     def get_context_data(self, **kwargs):
         # Adiciona o objeto ao contexto para exibir no template
         context = super().get_context_data(**kwargs)
-        context['ped_info'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
+        context['ped_info'] = self.get_ped_info()
         
         return context
 
     def get_form_kwargs(self):
         # Adiciona o objeto ao form para ser validado
         kwargs = super().get_form_kwargs()
-        kwargs['instance'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
+        kwargs['instance'] = self.get_ped_info()
         
         return kwargs
 
-class ConsultaMeusPedInfos(LoginRequiredMixin, ListView):
+class AnaliseInicialPedInfo(EtapaPedInfoView):
+
+    form_class = AnaliseInicialForm
+    template_name = 'lai_app/analise_inicial.html'
+    success_url = reverse_lazy('ped_infos_analise')
+
+    def tem_permissao(self, ped_info, papeis):
+        return ped_info.situacao == 'AI' and papeis.adm
+        
+    def form_valid(self, form):
+        
+        ped_info = form.save(commit=False)
+
+        if not self.concluir_etapa(ped_info, form,
+                                   func_adm=self.request.papeis.funcionario,
+                                   data_encam=dt.now()):
+            return self.form_invalid(form)
+
+        return super(AnaliseInicialPedInfo, self).form_valid(form)
+
+class ConsultaMeusPedInfos(ListaPedInfosMixin, LoginRequiredMixin, ListView):
 
     model = PedidoInformacao
+    ordenacao = ('data_pedido',)
     template_name = 'lai_app/ped_infos_cidadao.html'
     context_object_name = 'ped_infos'
 
     def dispatch(self, request, *args, **kwargs):
 
-        usuario = request.user
-        
-        if (hasattr(usuario, 'cidadao')):                        
+        if request.papeis.cidadao:
             return super().dispatch(request, *args, **kwargs)
         else:
             return HttpResponseForbidden("Você não tem permissão para acessar esta página."
@@ -98,21 +151,20 @@ class ConsultaMeusPedInfos(LoginRequiredMixin, ListView):
     def get_queryset(self):
 
         queryset = PedidoInformacao.objects.filter(
-            requerente=self.request.user.cidadao).order_by('data_pedido')
+            requerente=self.request.papeis.cidadao)
         
         return queryset
 
-class ConsultaPedInfosAnaliseInicial(LoginRequiredMixin, ListView):
+class ConsultaPedInfosAnaliseInicial(ListaPedInfosMixin, LoginRequiredMixin, ListView):
 
     model = PedidoInformacao
+    ordenacao = ('data_pedido',)
     template_name = 'lai_app/ped_infos_analise.html'
     context_object_name = 'ped_infos'
 
     def dispatch(self, request, *args, **kwargs):
 
-        usuario = request.user
-
-        if (hasattr(usuario, 'funcionario') and usuario.funcionario.analisa_ped_info):                        
+        if request.papeis.adm:
             return super().dispatch(request, *args, **kwargs)
         else:
             return HttpResponseForbidden("Você não tem permissão para acessar esta página."
@@ -121,21 +173,20 @@ class ConsultaPedInfosAnaliseInicial(LoginRequiredMixin, ListView):
     def get_queryset(self):
         # Obtém o queryset base
 
-        queryset = PedidoInformacao.objects.filter(situacao='AI').order_by('data_pedido')
+        queryset = PedidoInformacao.objects.filter(situacao='AI')
         
         return queryset
 
-class ConsultaPedInfosFornecInfo(LoginRequiredMixin, ListView):
+class ConsultaPedInfosFornecInfo(ListaPedInfosMixin, LoginRequiredMixin, ListView):
 
     model = PedidoInformacao
+    ordenacao = ('data_pedido',)
     template_name = 'lai_app/ped_infos_fornecimento.html'
     context_object_name = 'ped_infos'
 
     def dispatch(self, request, *args, **kwargs):
 
-        usuario = request.user
-        
-        if (hasattr(usuario, 'funcionario')):                        
+        if request.papeis.funcionario:
             return super().dispatch(request, *args, **kwargs)
         else:
             return HttpResponseForbidden("Você não tem permissão para acessar esta página."
@@ -145,12 +196,12 @@ class ConsultaPedInfosFornecInfo(LoginRequiredMixin, ListView):
 
         queryset = PedidoInformacao.objects.filter(
             situacao='BI',
-            setor_info=self.request.user.funcionario.lotacao
-        ).order_by('data_pedido')
+            setor_info_id=self.request.papeis.lotacao_id
+        )
         
         return queryset
 
-class ConsultaPedInfosGeral(LoginRequiredMixin, ListView):
+class ConsultaPedInfosGeral(ListaPedInfosMixin, LoginRequiredMixin, ListView):
 
     model = PedidoInformacao
     template_name = 'lai_app/ped_infos_geral.html'
@@ -158,16 +209,24 @@ class ConsultaPedInfosGeral(LoginRequiredMixin, ListView):
 
     def dispatch(self, request, *args, **kwargs):
 
-        usuario = request.user
-
-        if (hasattr(usuario, 'funcionario') and usuario.funcionario.analisa_ped_info):                        
+        if request.papeis.adm:
             return super().dispatch(request, *args, **kwargs)
         else:
             return HttpResponseForbidden("Você não tem permissão para acessar esta página."
                                         " Contate o administrador do sistema.")  
 
+    def get(self, request, *args, **kwargs):
+        # Exportação com os mesmos filtros e a mesma ordenação da consulta, em fluxo
+        formato = request.GET.get('formato')
+        if formato in exportacao.FORMATOS:
+            queryset = self.get_queryset().order_by(*self.assinatura_ordem(self.ordem_keyset()))
+            return exportacao.exportar(queryset, formato)
+
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
-        # Obtém o queryset base
+        # Obtém o queryset base; a ordenação e o tamanho da página são aplicados
+        # pela paginação por chave (PaginacaoKeysetMixin)
 
         queryset = PedidoInformacao.objects.all()
         
@@ -179,39 +238,47 @@ class ConsultaPedInfosGeral(LoginRequiredMixin, ListView):
         data_inicio = self.request.GET.get('data_inicio')
         data_fim = self.request.GET.get('data_fim')
         situacao = self.request.GET.get('situacao')
+        busca = self.request.GET.get('busca')
         ordenacao = self.request.GET.get('ordenacao')
 
-        filtros = 0
-        
+        # Aceita o protocolo completo no formato "número/ano"
+        if numero and '/' in numero:
+            numero, ano = (parte.strip() for parte in numero.split('/', 1))
+
         if numero and numero.isdigit():
             queryset = queryset.filter(num_registro=int(numero))
-            filtros += 1
         if ano and ano.isdigit():
-            queryset = queryset.filter(data_pedido__year=int(ano))
-            filtros += 1
+            queryset = queryset.filter(ano=int(ano))
         if data_inicio:
             queryset = queryset.filter(data_pedido__gte=data_inicio)
-            filtros += 1
         if data_fim:
             queryset = queryset.filter(data_pedido__lte=data_fim)
-            filtros += 1    
         if requerente:
-            queryset = queryset.filter(requerente__nome__icontains=requerente)
-            filtros += 1
+            # Busca por similaridade de trigramas no nome normalizado do requerente
+            requerente = normalizar(requerente)
+            queryset = queryset.filter(requerente__nome_busca__trigram_word_similar=requerente).annotate(
+                similaridade=Cast(TrigramWordSimilarity(requerente, 'requerente__nome_busca'), FloatField()))
         if titulo:
             queryset = queryset.filter(titulo__icontains=titulo)
-            filtros += 1
         if situacao:
             queryset = queryset.filter(situacao=situacao)
-            filtros += 1
-        
-        if ordenacao in ['data_pedido', '-data_pedido', 'requerente__nome', '-requerente__nome']:
-            queryset = queryset.order_by(ordenacao)
+        if busca:
+            # Busca textual sobre o vetor indexado, ignorando acentos e flexões
+            consulta = SearchQuery(Unaccent(Value(busca)), config='portuguese', search_type='websearch')
+            queryset = queryset.filter(busca=consulta).annotate(
+                relevancia=Cast(SearchRank(F('busca'), consulta), FloatField()))
+        
+        # A relevância e a similaridade são calculadas em real (float4); convertidas
+        # para double precision, o valor gravado no cursor volta idêntico na
+        # comparação com a última linha da página
+        if busca and ordenacao in [None, '', 'relevancia']:
+            self.ordenacao = ('-relevancia', '-data_pedido')
+        elif requerente and ordenacao in [None, '', 'relevancia']:
+            self.ordenacao = ('-similaridade', '-data_pedido')
+        elif ordenacao in ['data_pedido', '-data_pedido', 'requerente__nome', '-requerente__nome']:
+            self.ordenacao = (ordenacao,)
         else:
-            queryset = queryset.order_by('-data_pedido')
-
-        if filtros == 0:
-            queryset = queryset[:20]
+            self.ordenacao = ('-data_pedido',)
 
         return queryset
     
@@ -221,21 +288,24 @@ class ConsultaPedInfosGeral(LoginRequiredMixin, ListView):
 
         context['filtros'] = self.request.GET
         context['ordenacao'] = self.request.GET.get('ordenacao', '-data_pedido')  # Ordenação padrão
+
+        # Filtros da consulta, sem o cursor da página, para os links de exportação
+        filtros_exportacao = self.request.GET.copy()
+        filtros_exportacao.pop(self.parametro_cursor, None)
+        context['filtros_exportacao'] = filtros_exportacao.urlencode()
         
         return context
 
-class ConsultaPedInfosParecer(LoginRequiredMixin, ListView):
+class ConsultaPedInfosParecer(ListaPedInfosMixin, LoginRequiredMixin, ListView):
 
     model = PedidoInformacao
+    ordenacao = ('data_pedido',)
     template_name = 'lai_app/ped_infos_parecer.html'
     context_object_name = 'ped_infos'
 
     def dispatch(self, request, *args, **kwargs):
 
-        usuario = request.user
-        
-        if (hasattr(usuario, 'funcionario') and
-            usuario.funcionario.emite_parecer()):                        
+        if request.papeis.parecer:
             return super().dispatch(request, *args, **kwargs)
         else:
             return HttpResponseForbidden("Você não tem permissão para acessar esta página."
@@ -244,22 +314,20 @@ class ConsultaPedInfosParecer(LoginRequiredMixin, ListView):
     def get_queryset(self):
 
         queryset = PedidoInformacao.objects.filter(
-            situacao='EP').order_by('data_pedido')
+            situacao='EP')
         
         return queryset
     
-class ConsultaPedInfosRespInicial(LoginRequiredMixin, ListView):
+class ConsultaPedInfosRespInicial(ListaPedInfosMixin, LoginRequiredMixin, ListView):
 
     model = PedidoInformacao
+    ordenacao = ('data_pedido',)
     template_name = 'lai_app/ped_infos_resposta.html'
     context_object_name = 'ped_infos'
 
     def dispatch(self, request, *args, **kwargs):
 
-        usuario = request.user
-        
-        if (hasattr(usuario, 'funcionario') and
-            usuario.funcionario.responde_ped_info):                        
+        if request.papeis.resposta:
             return super().dispatch(request, *args, **kwargs)
         else:
             return HttpResponseForbidden("Você não tem permissão para acessar esta página."
@@ -268,22 +336,20 @@ class ConsultaPedInfosRespInicial(LoginRequiredMixin, ListView):
     def get_queryset(self):
 
         queryset = PedidoInformacao.objects.filter(
-            situacao='DR').order_by('data_pedido')
+            situacao='DR')
         
         return queryset
 
-class ConsultaPedInfosRecPrimInst(LoginRequiredMixin, ListView):
+class ConsultaPedInfosRecPrimInst(ListaPedInfosMixin, LoginRequiredMixin, ListView):
 
     model = PedidoInformacao
+    ordenacao = ('data_recurso_1',)
     template_name = 'lai_app/ped_infos_resp_rec_1.html'
     context_object_name = 'ped_infos'
 
     def dispatch(self, request, *args, **kwargs):
 
-        usuario = request.user
-        
-        if (hasattr(usuario, 'funcionario') and
-            usuario.funcionario.responde_recurso_1):                        
+        if request.papeis.recurso_1:
             return super().dispatch(request, *args, **kwargs)
         else:
             return HttpResponseForbidden("Você não tem permissão para acessar esta página."
@@ -292,22 +358,20 @@ class ConsultaPedInfosRecPrimInst(LoginRequiredMixin, ListView):
     def get_queryset(self):
 
         queryset = PedidoInformacao.objects.filter(
-            situacao='AR').order_by('data_recurso_1')
+            situacao='AR')
         
         return queryset
     
-class ConsultaPedInfosRecSegInst(LoginRequiredMixin, ListView):
+class ConsultaPedInfosRecSegInst(ListaPedInfosMixin, LoginRequiredMixin, ListView):
 
     model = PedidoInformacao
+    ordenacao = ('data_recurso_2',)
     template_name = 'lai_app/ped_infos_resp_rec_2.html'
     context_object_name = 'ped_infos'
 
     def dispatch(self, request, *args, **kwargs):
 
-        usuario = request.user
-        
-        if (hasattr(usuario, 'funcionario') and
-            usuario.funcionario.responde_recurso_2):                        
+        if request.papeis.recurso_2:
             return super().dispatch(request, *args, **kwargs)
         else:
             return HttpResponseForbidden("Você não tem permissão para acessar esta página."
@@ -316,236 +380,234 @@ class ConsultaPedInfosRecSegInst(LoginRequiredMixin, ListView):
     def get_queryset(self):
 
         queryset = PedidoInformacao.objects.filter(
-            situacao='AF').order_by('data_recurso_2')
+            situacao='AF')
         
         return queryset
 
-class DetalhesPedInfo(LoginRequiredMixin, DetailView):
-
-    model = PedidoInformacao
-    template_name = 'lai_app/detalhes_ped_info.html'
-    context_object_name = 'ped_info'
-
-    def dispatch(self, request, *args, **kwargs):
+class AcessoPedInfoMixin(PedInfoUnicoMixin):
+    # Acesso às informações de um pedido: o requerente, o setor administrativo e
+    # o setor responsável pela etapa em andamento
 
-        usuario = request.user
-        req = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        requerente = req.requerente
-        config = Configuracao.objects.get(id=1)
+    def tem_permissao(self, req, papeis):
 
         # Verifica se o usuário é o requerente do pedido
-        if ((hasattr(usuario, 'cidadao') and requerente == usuario.cidadao) or 
-        # Verifica se o usuário é funcionário
-            (hasattr(usuario, 'funcionario') and  
-        # Verifica se o usuário é funcionário e se pertence ao setor de análise de pedidos (administrativo)
-            (usuario.funcionario.analisa_ped_info) or
+        return ((papeis.cidadao and req.requerente_id == papeis.cidadao.pk) or 
+        # Verifica se o usuário pertence ao setor de análise de pedidos (administrativo)
+            papeis.adm or
         # Verifica a fase do processo e se o usuário é do setor responsável por fornecer a informação
-            (req.situacao == 'BI' and req.setor_destino == usuario.funcionario.lotacao) or        
+            (req.situacao == 'BI' and papeis.fornece(req.setor_info_id)) or        
         # Verifica a fase do processo e se o usuário é do setor responsável por emitir o parecer
-            (req.situacao == 'EP' and usuario.funcionario.lotacao == config.setor_parecer) or
+            (req.situacao == 'EP' and papeis.parecer) or
         # Verifica a fase do processo e se o usuário é do setor responsável por definir a resposta
-            (req.situacao == 'DR' and usuario.funcionario.lotacao == config.setor_resposta) or
+            (req.situacao == 'DR' and papeis.resposta) or
         # Verifica a fase do processo e se o usuário é do setor responsável por analisar o recurso em 1ª instância
-            (req.situacao == 'AR' and usuario.funcionario.lotacao == config.setor_recurso_1) or
+            (req.situacao == 'AR' and papeis.recurso_1) or
         # Verifica a fase do processo e se o usuário é do setor responsável por analisar o recurso em 2ª instância
-            (req.situacao == 'AF' and usuario.funcionario.lotacao == config.setor_recurso_2))):
-
-            if(hasattr(usuario, 'cidadao')):
-                if (req.prazo_recurso_1 is None and req.situacao == 'PR' and req.resp_inicial == False):
-                    req.prazo_recurso_1 = dt.now() + timedelta(days=10)
-                    req.save()
-                if (req.prazo_recurso_2 is None and req.situacao == 'RR' and req.resp_recurso_1 == False):
-                    req.prazo_recurso_2 = dt.now() + timedelta(days=10)
-                    req.save()
-            
+            (req.situacao == 'AF' and papeis.recurso_2))
+
+    def dispatch(self, request, *args, **kwargs):
+
+        if self.tem_permissao(self.get_ped_info(), request.papeis):
             return super().dispatch(request, *args, **kwargs)            
         
         return HttpResponseForbidden("Você não tem permissão para acessar esta página."
                                         " Contate o administrador do sistema.")
+
+class ArquivoPedInfo(AcessoPedInfoMixin, LoginRequiredMixin, View):
+
+    # Documento levantado pelo setor fornecedor. O requerente só o recebe depois
+    # do deferimento, como na página de detalhes.
+
+    def tem_permissao(self, req, papeis):
+        return (super().tem_permissao(req, papeis) and
+                bool(papeis.funcionario or req.resp_inicial or req.resp_recurso_1 or req.resp_recurso_2))
+
+    def get(self, request, *args, **kwargs):
+        arquivo = self.get_ped_info().arquivo_info
+        if not arquivo:
+            raise Http404("O pedido não tem arquivo de informação.")
+        try:
+            return downloads.servir_arquivo(request, arquivo.path, os.path.basename(arquivo.name))
+        except FileNotFoundError:
+            raise Http404("Arquivo de informação não encontrado.")
+
+class DetalhesPedInfo(AcessoPedInfoMixin, LoginRequiredMixin, DetailView):
+
+    model = PedidoInformacao
+    template_name = 'lai_app/detalhes_ped_info.html'
+    context_object_name = 'ped_info'
+    relacionados = ('requerente', 'setor_info',
+                    'func_adm__cargo', 'func_adm__lotacao',
+                    'func_fornec__cargo', 'func_fornec__lotacao',
+                    'func_parecer__cargo', 'func_parecer__lotacao',
+                    'func_resp_inicial__cargo', 'func_resp_inicial__lotacao',
+                    'func_resp_recurso_1__cargo', 'func_resp_recurso_1__lotacao',
+                    'func_resp_recurso_2__cargo', 'func_resp_recurso_2__lotacao')
+
+    def get_object(self, queryset=None):
+        return self.get_ped_info()
     
-class EmitirParecerPedInfo(LoginRequiredMixin, FormView):
+class EmitirParecerPedInfo(EtapaPedInfoView):
 
     form_class = ParecerPedInfoForm
     template_name = 'lai_app/emissao_parecer.html'
     success_url = reverse_lazy('ped_infos_parecer')
 
-    def dispatch(self, request, *args, **kwargs):
-
-        ped_info = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        usuario = request.user
-                
-        if ( ped_info.situacao == 'EP' and 
-            hasattr(usuario, 'funcionario') and
-            usuario.funcionario.emite_parecer):
-
-            return super().dispatch(request, *args, **kwargs)
-        
-        else:
-            
-            return HttpResponseForbidden("Você não tem permissão para acessar esta página."
-                                        " Contate o administrador do sistema.")              
+    def tem_permissao(self, ped_info, papeis):
+        return ped_info.situacao == 'EP' and papeis.parecer
         
     def form_valid(self, form):
         
         ped_info = form.save(commit=False)
-        ped_info.func_parecer = self.request.user.funcionario
-        ped_info.data_parecer = dt.now()
-        ped_info.situacao = 'DR' 
 
-        ped_info.save()
+        if not self.concluir_etapa(ped_info, form,
+                                   func_parecer=self.request.papeis.funcionario,
+                                   data_parecer=dt.now()):
+            return self.form_invalid(form)
 
         return super(EmitirParecerPedInfo, self).form_valid(form)
 
-    def get_context_data(self, **kwargs):
-        # Adiciona o objeto ao contexto para exibir no template
-        context = super().get_context_data(**kwargs)
-        context['ped_info'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return context
-
-    def get_form_kwargs(self):
-        # Adiciona o objeto ao form para ser validado
-        kwargs = super().get_form_kwargs()
-        kwargs['instance'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return kwargs
-
-class FornecimentoInformacao(LoginRequiredMixin, FormView):
+class FornecimentoInformacao(EtapaPedInfoView):
 
     form_class = FornecInfoForm
     template_name = 'lai_app/fornec_info.html'
     success_url = reverse_lazy('ped_infos_fornecimento')
 
-    def dispatch(self, request, *args, **kwargs):
-
-        ped_info = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        usuario = request.user
-        
-        if ( ped_info.situacao == 'BI' and 
-            hasattr(usuario, 'funcionario') and
-            usuario.funcionario.lotacao == ped_info.setor_info):
-
-            return super().dispatch(request, *args, **kwargs)
-        
-        else:
-            
-            return HttpResponseForbidden("Você não tem permissão para acessar esta página."
-                                        " Contate o administrador do sistema.")              
+    def tem_permissao(self, ped_info, papeis):
+        return ped_info.situacao == 'BI' and papeis.fornece(ped_info.setor_info_id)
         
     def form_valid(self, form):
         
         ped_info = form.save(commit=False)
-        ped_info.func_fornec = self.request.user.funcionario
-        ped_info.data_fornec = dt.now()
-        ped_info.situacao = 'EP' 
-
-        ped_info.save()
 
-        return super(FornecimentoInformacao, self).form_valid(form)
+        if not self.concluir_etapa(ped_info, form,
+                                   func_fornec=self.request.papeis.funcionario,
+                                   data_fornec=dt.now()):
+            return self.form_invalid(form)
 
-    def get_context_data(self, **kwargs):
-        # Adiciona o objeto ao contexto para exibir no template
-        context = super().get_context_data(**kwargs)
-        context['ped_info'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return context
+        arquivo = form.cleaned_data.get('arquivo_info')
+        if isinstance(arquivo, UploadedFile):
+            metricas_app.registrar_upload(arquivo.size)
 
-    def get_form_kwargs(self):
-        # Adiciona o objeto ao form para ser validado
-        kwargs = super().get_form_kwargs()
-        kwargs['instance'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return kwargs
+        return super(FornecimentoInformacao, self).form_valid(form)
 
-class InterporRecursoPrimeiraInst(LoginRequiredMixin, FormView):
+class InterporRecursoPrimeiraInst(EtapaPedInfoView):
 
     form_class = RecursoPrimInstForm
     template_name = 'lai_app/interpor_recurso_1.html'
 
-    def dispatch(self, request, *args, **kwargs):
+    relacionados = ('requerente', 'func_resp_inicial__cargo', 'func_resp_inicial__lotacao')
 
-        ped_info = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        usuario = request.user
-                
-        if (ped_info.oportunidade_recurso_1 and 
-            hasattr(usuario, 'cidadao') and
-            ped_info.requerente == usuario.cidadao):
-            
-            return super().dispatch(request, *args, **kwargs)
-        
-        else:
-            
-            return HttpResponseForbidden("Você não tem permissão para acessar esta página."
-                                        " Contate o administrador do sistema.")              
+    def tem_permissao(self, ped_info, papeis):
+        return (ped_info.oportunidade_recurso_1() and 
+                papeis.cidadao is not None and
+                ped_info.requerente_id == papeis.cidadao.pk)
         
     def form_valid(self, form):
         
         ped_info = form.save(commit=False)
-        ped_info.data_recurso_1 = dt.now()
-        ped_info.situacao = 'AR' 
 
-        ped_info.save()
+        if not self.concluir_etapa(ped_info, form,
+                                   data_recurso_1=dt.now()):
+            return self.form_invalid(form)
 
         return redirect('detalhes_ped_info', pk=ped_info.pk)
 
-    def get_context_data(self, **kwargs):
-        # Adiciona o objeto ao contexto para exibir no template
-        context = super().get_context_data(**kwargs)
-        context['ped_info'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return context
-
-    def get_form_kwargs(self):
-        # Adiciona o objeto ao form para ser validado
-        kwargs = super().get_form_kwargs()
-        kwargs['instance'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return kwargs
-
-class InterporRecursoSegundaInst(LoginRequiredMixin, FormView):
+class InterporRecursoSegundaInst(EtapaPedInfoView):
 
     form_class = RecursoSegInstForm
     template_name = 'lai_app/interpor_recurso_2.html'
 
-    def dispatch(self, request, *args, **kwargs):
+    relacionados = ('requerente', 'func_resp_recurso_1__cargo', 'func_resp_recurso_1__lotacao')
 
-        ped_info = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        usuario = request.user
-                
-        if (ped_info.oportunidade_recurso_2 and 
-            hasattr(usuario, 'cidadao') and
-            ped_info.requerente == usuario.cidadao):
-            
-            return super().dispatch(request, *args, **kwargs)
-        
-        else:
-            
-            return HttpResponseForbidden("Você não tem permissão para acessar esta página."
-                                        " Contate o administrador do sistema.")              
+    def tem_permissao(self, ped_info, papeis):
+        return (ped_info.oportunidade_recurso_2() and 
+                papeis.cidadao is not None and
+                ped_info.requerente_id == papeis.cidadao.pk)
         
     def form_valid(self, form):
         
         ped_info = form.save(commit=False)
-        ped_info.data_recurso_2 = dt.now()
-        ped_info.situacao = 'AF' 
 
-        ped_info.save()
+        if not self.concluir_etapa(ped_info, form,
+                                   data_recurso_2=dt.now()):
+            return self.form_invalid(form)
 
         return redirect('detalhes_ped_info', pk=ped_info.pk)
 
+class PrazosSetor(LoginRequiredMixin, TemplateView):
+
+    # Painel de prazos do setor: pedidos atrasados, pedidos que vencem nos próximos
+    # dias úteis e janelas de recurso abertas, atendidos pelos índices de prazos
+    template_name = 'lai_app/prazos_setor.html'
+    limite = 50
+    dias_vencendo = 3
+
+    def dispatch(self, request, *args, **kwargs):
+
+        if request.papeis.funcionario:
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return HttpResponseForbidden("Você não tem permissão para acessar esta página."
+                                        " Contate o administrador do sistema.")
+
+    def get_setor_id(self):
+        # O setor administrativo pode acompanhar qualquer setor
+        setor_id = self.request.papeis.lotacao_id
+        if self.request.papeis.adm:
+            try:
+                setor_id = int(self.request.GET['setor'])
+            except (KeyError, ValueError):
+                pass
+        return setor_id
+
+    def linhas(self, queryset, prazo):
+        # Uma linha além do limite indica que há mais pedidos do que os exibidos
+        itens = list(queryset
+                     .values('id', 'num_registro', 'ano', 'titulo', 'situacao',
+                             prazo=prazo, requerente_nome=F('requerente__nome'))
+                     .order_by('prazo', 'id')[:self.limite + 1])
+        for item in itens:
+            item['situacao_display'] = PedidoInformacao.SITUACOES[item['situacao']]
+        return {'itens': itens[:self.limite], 'mais': len(itens) > self.limite}
+
     def get_context_data(self, **kwargs):
-        # Adiciona o objeto ao contexto para exibir no template
         context = super().get_context_data(**kwargs)
-        context['ped_info'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
+        setor_id = self.get_setor_id()
+        agora = now()
+        pedidos = PedidoInformacao.objects.aguardando_setor(setor_id)
+
+        context['setor_id'] = setor_id
+        context['setores'] = Setor.objects.filter(ativo=True).order_by('nome') if self.request.papeis.adm else None
+        context['dias_vencendo'] = self.dias_vencendo
+        context['atrasados'] = self.linhas(pedidos.atrasados(agora), F('prazo_resposta'))
+        context['vencendo'] = self.linhas(
+            pedidos.vencendo(agora, prazo_em_dias_uteis(agora, self.dias_vencendo)), F('prazo_resposta'))
+        context['recursos_abertos'] = self.linhas(
+            PedidoInformacao.objects.recursos_abertos(agora, setor_id),
+            Case(When(situacao='RR', then=F('prazo_recurso_2')), default=F('prazo_recurso_1')))
+
         return context
 
-    def get_form_kwargs(self):
-        # Adiciona o objeto ao form para ser validado
-        kwargs = super().get_form_kwargs()
-        kwargs['instance'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return kwargs
+class RelatorioAnual(TemplateView):
+
+    # Relatório anual da LAI, público, montado do resumo materializado (ver
+    # lai_app.relatorio); com ?formato=json devolve os mesmos dados em JSON
+    template_name = 'lai_app/relatorio_anual.html'
+
+    def get(self, request, *args, **kwargs):
+        try:
+            ano = int(request.GET['ano'])
+        except (KeyError, ValueError):
+            ano = localdate().year
+
+        dados = relatorio.relatorio_anual(ano)
+        if request.GET.get('formato') == 'json':
+            return JsonResponse(dados, json_dumps_params={'ensure_ascii': False})
+
+        # O ano corrente e o pedido são oferecidos mesmo sem pedidos no resumo
+        anos = sorted(set(relatorio.anos_disponiveis()) | {ano, localdate().year}, reverse=True)
+        return self.render_to_response(self.get_context_data(relatorio=dados, anos=anos))
 
 class RequererInformacao(LoginRequiredMixin, FormView):
 
@@ -554,7 +616,7 @@ class RequererInformacao(LoginRequiredMixin, FormView):
 
     def dispatch(self, request, *args, **kwargs):
 
-        if hasattr(request.user, 'cidadao') == False:
+        if not request.papeis.cidadao:
             return HttpResponseForbidden("Você não tem permissão para acessar esta página."
                                         " Contate o administrador do sistema.")        
         
@@ -563,33 +625,20 @@ class RequererInformacao(LoginRequiredMixin, FormView):
     def form_valid(self, form):
         
         req_informacao = form.save(commit=False)
-        cidadao = self.request.user.cidadao
+        cidadao = self.request.papeis.cidadao
         req_informacao.requerente = cidadao
 
         req_informacao.save()
         return redirect('detalhes_ped_info', pk=req_informacao.pk)
 
-class RespostaInicialPedInfo(LoginRequiredMixin, FormView):
+class RespostaInicialPedInfo(EtapaPedInfoView):
 
     form_class = RespostaPedInfoForm
     template_name = 'lai_app/resposta_inicial.html'
     success_url = reverse_lazy('ped_infos_resposta')
 
-    def dispatch(self, request, *args, **kwargs):
-
-        ped_info = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        usuario = request.user
-                
-        if (ped_info.situacao == 'DR' and 
-            hasattr(usuario, 'funcionario') and
-            usuario.funcionario.responde_ped_info):
-
-            return super().dispatch(request, *args, **kwargs)
-        
-        else:
-            
-            return HttpResponseForbidden("Você não tem permissão para acessar esta página."
-                                        " Contate o administrador do sistema.")              
+    def tem_permissao(self, ped_info, papeis):
+        return ped_info.situacao == 'DR' and papeis.resposta
         
     def form_valid(self, form):
         
@@ -602,50 +651,22 @@ class RespostaInicialPedInfo(LoginRequiredMixin, FormView):
             if not justificativa or justificativa.strip() == "":
                 form.add_error(None, "A justificativa é obrigatória para indeferimento!")
                 return super(RespostaInicialPedInfo, self).form_invalid(form)
-        
-        ped_info.func_resp_inicial = self.request.user.funcionario
-        ped_info.data_resp_inicial = dt.now()
-        ped_info.situacao = 'PR'
 
-        ped_info.save()
+        if not self.concluir_etapa(ped_info, form,
+                                   func_resp_inicial=self.request.papeis.funcionario,
+                                   data_resp_inicial=dt.now()):
+            return self.form_invalid(form)
 
         return super(RespostaInicialPedInfo, self).form_valid(form)
 
-    def get_context_data(self, **kwargs):
-        # Adiciona o objeto ao contexto para exibir no template
-        context = super().get_context_data(**kwargs)
-        context['ped_info'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return context
-
-    def get_form_kwargs(self):
-        # Adiciona o objeto ao form para ser validado
-        kwargs = super().get_form_kwargs()
-        kwargs['instance'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return kwargs
-
-class RespostaRecursoPrimeiraInst(LoginRequiredMixin, FormView):
+class RespostaRecursoPrimeiraInst(EtapaPedInfoView):
 
     form_class = RespostaRecPrimInstForm
     template_name = 'lai_app/resp_recurso_1.html'
     success_url = reverse_lazy('ped_infos_resp_rec_1')
 
-    def dispatch(self, request, *args, **kwargs):
-
-        ped_info = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        usuario = request.user
-                
-        if (ped_info.situacao == 'AR' and 
-            hasattr(usuario, 'funcionario') and
-            usuario.funcionario.responde_recurso_1):
-
-            return super().dispatch(request, *args, **kwargs)
-        
-        else:
-            
-            return HttpResponseForbidden("Você não tem permissão para acessar esta página."
-                                        " Contate o administrador do sistema.")              
+    def tem_permissao(self, ped_info, papeis):
+        return ped_info.situacao == 'AR' and papeis.recurso_1
         
     def form_valid(self, form):
         
@@ -658,50 +679,22 @@ class RespostaRecursoPrimeiraInst(LoginRequiredMixin, FormView):
             if not justificativa or justificativa.strip() == "":
                 form.add_error(None, "A justificativa é obrigatória para indeferimento!")
                 return super(RespostaRecursoPrimeiraInst, self).form_invalid(form)
-        
-        ped_info.func_resp_recurso_1 = self.request.user.funcionario
-        ped_info.data_resp_recurso_1 = dt.now()
-        ped_info.situacao = 'RR'
 
-        ped_info.save()
+        if not self.concluir_etapa(ped_info, form,
+                                   func_resp_recurso_1=self.request.papeis.funcionario,
+                                   data_resp_recurso_1=dt.now()):
+            return self.form_invalid(form)
 
         return super(RespostaRecursoPrimeiraInst, self).form_valid(form)
 
-    def get_context_data(self, **kwargs):
-        # Adiciona o objeto ao contexto para exibir no template
-        context = super().get_context_data(**kwargs)
-        context['ped_info'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return context
-
-    def get_form_kwargs(self):
-        # Adiciona o objeto ao form para ser validado
-        kwargs = super().get_form_kwargs()
-        kwargs['instance'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return kwargs
-
-class RespostaRecursoSegundaInst(LoginRequiredMixin, FormView):
+class RespostaRecursoSegundaInst(EtapaPedInfoView):
 
     form_class = RespostaRecSegInstForm
     template_name = 'lai_app/resp_recurso_2.html'
     success_url = reverse_lazy('ped_infos_resp_rec_2')
 
-    def dispatch(self, request, *args, **kwargs):
-
-        ped_info = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        usuario = request.user
-                
-        if (ped_info.situacao == 'AF' and 
-            hasattr(usuario, 'funcionario') and
-            usuario.funcionario.responde_recurso_2):
-
-            return super().dispatch(request, *args, **kwargs)
-        
-        else:
-            
-            return HttpResponseForbidden("Você não tem permissão para acessar esta página."
-                                        " Contate o administrador do sistema.")              
+    def tem_permissao(self, ped_info, papeis):
+        return ped_info.situacao == 'AF' and papeis.recurso_2
         
     def form_valid(self, form):
         
@@ -714,25 +707,10 @@ class RespostaRecursoSegundaInst(LoginRequiredMixin, FormView):
             if not justificativa or justificativa.strip() == "":
                 form.add_error(None, "A justificativa é obrigatória para indeferimento!")
                 return super(RespostaRecursoSegundaInst, self).form_invalid(form)
-        
-        ped_info.func_resp_recurso_2 = self.request.user.funcionario
-        ped_info.data_resp_recurso_2 = dt.now()
-        ped_info.situacao = 'RF'
 
-        ped_info.save()
+        if not self.concluir_etapa(ped_info, form,
+                                   func_resp_recurso_2=self.request.papeis.funcionario,
+                                   data_resp_recurso_2=dt.now()):
+            return self.form_invalid(form)
 
-        return super(RespostaRecursoSegundaInst, self).form_valid(form)
-
-    def get_context_data(self, **kwargs):
-        # Adiciona o objeto ao contexto para exibir no template
-        context = super().get_context_data(**kwargs)
-        context['ped_info'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return context
-
-    def get_form_kwargs(self):
-        # Adiciona o objeto ao form para ser validado
-        kwargs = super().get_form_kwargs()
-        kwargs['instance'] = PedidoInformacao.objects.get(pk=self.kwargs['pk'])
-        
-        return kwargs
\ No newline at end of file
+        return super(RespostaRecursoSegundaInst, self).form_valid(form)
\ No newline at end of file
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'crispy_forms',
     'crispy_bootstrap5',
     'widget_tweaks'
@@ -47,15 +49,65 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 MIDDLEWARE = [
+    'lai_app.middleware.MetricasMiddleware',
+    'lai_app.middleware.TempoRequisicaoMiddleware',
+    'lai_app.middleware.DetectorN1Middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'lai_app.middleware.PapeisMiddleware',
+    'lai_app.middleware.PerfilMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Tempos de banco, view e template de cada requisição no cabeçalho Server-Timing:
+# só para usuários da equipe (is_staff), a menos que SERVER_TIMING esteja ligado.
+# Consultas a partir de CONSULTA_LENTA_MS milissegundos vão para o log de consultas
+# lentas (lai_app.consultas_lentas), em JSON e com os parâmetros redigidos
+SERVER_TIMING = False
+CONSULTA_LENTA_MS = 500
+
+# Token exigido (cabeçalho "Authorization: Bearer <token>") para ler /metrics;
+# sem token o endpoint responde 404
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')
+
+# Perfis sob demanda (?perfil=1 ou cabeçalho X-Perfil: 1, só para superusuários):
+# dump do cProfile, pilhas amostradas a cada PERFIL_INTERVALO segundos e o SQL da
+# requisição. Desligado até que o operador defina PERFIL_DIRETORIO.
+PERFIL_DIRETORIO = os.environ.get('PERFIL_DIRETORIO')
+PERFIL_INTERVALO = 0.001
+
+# Publicação de dados abertos (comando publicar_dados_abertos): diretório dos
+# arquivos e chave dos pseudônimos dos requerentes. A chave é obrigatória e
+# exclusiva da publicação (nunca a SECRET_KEY): mantenha-a estável e secreta,
+# pois trocá-la muda todos os pseudônimos já publicados.
+DADOS_ABERTOS_DIRETORIO = os.environ.get('DADOS_ABERTOS_DIRETORIO', BASE_DIR / 'dados_abertos')
+DADOS_ABERTOS_SEGREDO = os.environ.get('DADOS_ABERTOS_SEGREDO')
+
+# Registra no logger lai_app.consultas os comandos SQL repetidos numa mesma
+# requisição (suspeitos de N+1). Desligado por padrão; ative em desenvolvimento.
+DETECTOR_N1 = False
+DETECTOR_N1_LIMITE = 2
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'lai_app': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 ROOT_URLCONF = 'lai_cmg.urls'
 
 TEMPLATES = [
@@ -69,6 +121,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'lai_app.context_processors.papeis',
+                'lai_app.context_processors.filas',
             ],
         },
     },
@@ -98,6 +152,19 @@ DATABASES = {
     }
 }
 
+# Cache
+# A versão da Configuração (lai_app.models.SingletonModel) é guardada aqui e precisa
+# ser vista por todos os workers: o backend tem de ser compartilhado (verificação
+# lai_app.E001). A tabela do DatabaseCache é criada com "manage.py createcachetable";
+# em produção, Redis ou Memcached também servem.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'lai_cache',
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -131,6 +198,14 @@ USE_TZ = True
 MEDIA_ROOT = BASE_DIR / 'media'
 MEDIA_URL = '/media/'
 
+# Os documentos enviados (arquivo_info) só são entregues pela view arquivo_ped_info,
+# depois da autorização; MEDIA_ROOT não deve ser publicado pelo servidor web.
+# Com 'x-accel' (nginx) ou 'x-sendfile' (Apache/lighttpd), a transferência fica com
+# o proxy; vazio, o próprio Django entrega o arquivo. No nginx:
+#     location /protegido/ { internal; alias <MEDIA_ROOT>/; }
+ARQUIVOS_PROTEGIDOS = os.environ.get('ARQUIVOS_PROTEGIDOS', '')
+ARQUIVOS_PROTEGIDOS_PREFIXO = '/protegido/'
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
@@ -144,7 +219,6 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = 'menu' # Define a url de encaminhamento do usuário após fazer o login no sistema
 LOGOUT_REDIRECT_URL = "menu" # Define a url de encaminhamento do usuário após fazer o logout do sistema
 
-import os
 
 # Onde os arquivos serão coletados com `collectstatic`
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
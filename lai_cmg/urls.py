@@ -15,8 +15,6 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.conf import settings
-from django.conf.urls.static import static
 from django.urls import include, path
 
 from lai_app import views
@@ -33,6 +31,7 @@ urlpatterns = [
     path('ped-info/resp-rec-2/<int:pk>/', views.RespostaRecursoSegundaInst.as_view(), name='resposta_rec_2'),
     path('ped-info/requerer/', views.RequererInformacao.as_view(), name='req_info'),
     path('ped-info/<int:pk>/', views.DetalhesPedInfo.as_view(), name='detalhes_ped_info'),
+    path('ped-info/<int:pk>/arquivo/', views.ArquivoPedInfo.as_view(), name='arquivo_ped_info'),
     path('ped-infos/analisar/', views.ConsultaPedInfosAnaliseInicial.as_view(), name='ped_infos_analise'),
     path('ped-infos/cidadao/', views.ConsultaMeusPedInfos.as_view(), name='meus_ped_infos'),
     path('ped-infos/fornecer-info/', views.ConsultaPedInfosFornecInfo.as_view(), name='ped_infos_fornecimento'),
@@ -41,12 +40,15 @@ urlpatterns = [
     path('ped-infos/resposta/', views.ConsultaPedInfosRespInicial.as_view(), name='ped_infos_resposta'),
     path('ped-infos/resp-rec-1/', views.ConsultaPedInfosRecPrimInst.as_view(), name='ped_infos_resp_rec_1'),
     path('ped-infos/resp-rec-2/', views.ConsultaPedInfosRecSegInst.as_view(), name='ped_infos_resp_rec_2'),
+    path('prazos/setor/', views.PrazosSetor.as_view(), name='prazos_setor'),
+    path('relatorio/', views.RelatorioAnual.as_view(), name='relatorio_anual'),
 
     path('registro-cidadao/', views.registrar_cidadao, name='registrar_cidadao'),
+    path('metrics', views.metricas, name='metricas'),
     path('accounts/', include('django.contrib.auth.urls')),
     path('admin/', admin.site.urls)
 
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
 
 admin.site.site_header = "Gerenciamento SisAIP"
 admin.site.site_title = "SisAIP Admin"